@@ -0,0 +1,46 @@
+from migen import *
+from migen.genlib.cdc import MultiReg
+
+from litex.gen import *
+
+from litex.soc.interconnect.csr import CSR, CSRStatus
+
+# Boot timestamps ----------------------------------------------------------------------------------
+
+class BootTimestamp(LiteXModule):
+    """Free running sys cycle counter started by the sys reset, the time base of the boot log.
+
+    A write to `latch` copies the 64-bit counter into `cycles`; software stamps the boot stages with
+    it. `events` maps names to (signal, clock_domain) pairs for stages only the gateware sees, like
+    the first video frame: the counter value at the first rising edge of each signal is kept in a
+    `<name>` status register (0 until it happened). Signals from other clock domains go through a
+    MultiReg and must stay high for a few sys cycles.
+    """
+    def __init__(self, events=None):
+        self.latch  = CSR()
+        self.cycles = CSRStatus(64, description="Cycles since reset, at the last ``latch`` write.")
+
+        # # #
+
+        counter = Signal(64)
+        self.sync += counter.eq(counter + 1)
+        self.sync += If(self.latch.re, self.cycles.status.eq(counter))
+
+        events = {} if events is None else events
+        for name, (signal, clock_domain) in sorted(events.items()):
+            status = CSRStatus(64, name=name, description=f"Cycles since reset at the first ``{name}`` event.")
+            setattr(self, name, status)
+            level = Signal()
+            if clock_domain == "sys":
+                self.comb += level.eq(signal)
+            else:
+                self.specials += MultiReg(signal, level)
+            level_d = Signal()
+            seen    = Signal()
+            self.sync += [
+                level_d.eq(level),
+                If(level & ~level_d & ~seen,
+                    seen.eq(1),
+                    status.status.eq(counter),
+                )
+            ]
@@ -0,0 +1,129 @@
+#
+# Content hashed bitstream cache for the LiteX build flow.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import re
+import json
+import shutil
+import hashlib
+
+# Build Cache --------------------------------------------------------------------------------------
+
+class BuildCache:
+    """Skip synthesis and place and route when the gateware did not change.
+
+    `build()` first lets the builder generate everything without running the vendor toolchain (the
+    software is compiled as usual, make only rebuilds what changed), then hashes:
+
+    - the generated gateware sources and constraints, minus date stamps,
+    - the HDL sources of external cores added to the platform,
+    - the toolchain options and build arguments,
+    - the external software packages (sources and Makefiles) and the LiteX software, but only when
+      the BIOS is baked into the bitstream through an initialized integrated ROM.
+
+    On a hit the cached bitstreams are copied back in place, on a miss the generated build script
+    runs and its bitstreams are stored under the hash. Generated headers and the SoC identifier
+    carry the build date: build with `ident_version=False` or the identifier alone makes every
+    build a miss.
+    """
+    gateware_exts = (".v", ".sv", ".vhd", ".vhdl", ".init", ".cst", ".sdc", ".pdc", ".ldc", ".lpf",
+        ".xdc", ".tcl", ".ys", ".py")
+    software_exts = (".c", ".h", ".S", ".s", ".ld", ".json", "Makefile", ".mak")
+    date_stamp    = re.compile(rb".*(Auto-generated|[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}).*\n")
+
+    def __init__(self, builder, cache_dir, software=()):
+        self.builder   = builder
+        self.cache_dir = cache_dir
+        self.software  = list(software)
+
+    def add_software(self, path):
+        self.software.append(path)
+
+    # Hashing --------------------------------------------------------------------------------------
+
+    def _hash_file(self, h, filename, strip_dates=False):
+        with open(filename, "rb") as f:
+            data = f.read()
+        if strip_dates:
+            data = self.date_stamp.sub(b"", data)
+        h.update(os.path.basename(filename).encode())
+        h.update(hashlib.sha256(data).digest())
+
+    def _hash_tree(self, h, path, exts, skip=()):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(exts) and not name.endswith(skip):
+                    self._hash_file(h, os.path.join(root, name), strip_dates=True)
+
+    def rom_in_gateware(self):
+        soc = self.builder.soc
+        return getattr(soc, "integrated_rom_size", 0) and getattr(soc, "integrated_rom_initialized", False)
+
+    def gateware_hash(self, **kwargs):
+        h        = hashlib.sha256()
+        platform = self.builder.soc.platform
+        # BIOS contents are covered by software_hash.
+        self._hash_tree(h, self.builder.gateware_dir, self.gateware_exts, skip=("_rom.init",))
+        for source in sorted(platform.sources, key=lambda s: s[0]):
+            self._hash_file(h, source[0])
+        h.update(json.dumps(getattr(platform.toolchain, "options", {}), sort_keys=True, default=str).encode())
+        h.update(json.dumps(kwargs, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def software_hash(self):
+        import litex
+        h = hashlib.sha256()
+        for path in self.software:
+            self._hash_tree(h, path, self.software_exts)
+        self._hash_tree(h, os.path.join(os.path.dirname(litex.__file__), "soc", "software"), self.software_exts)
+        csr_json = os.path.join(self.builder.output_dir, "csr.json")
+        if os.path.exists(csr_json):
+            self._hash_file(h, csr_json)
+        return h.hexdigest()
+
+    # Build ----------------------------------------------------------------------------------------
+
+    def build(self, outputs, **kwargs):
+        """Build through the cache, returns True when the vendor toolchain had to run."""
+        builder = self.builder
+        builder.build(run=False, **kwargs)
+
+        gateware = self.gateware_hash(**kwargs)
+        software = self.software_hash() if self.rom_in_gateware() else "-"
+        key      = hashlib.sha256(f"{gateware}:{software}".encode()).hexdigest()[:16]
+        entry    = os.path.join(self.cache_dir, key)
+        outputs  = sorted(set(outputs))
+
+        cached = [os.path.join(entry, os.path.basename(o)) for o in outputs]
+        if os.path.isdir(entry) and all(os.path.exists(c) for c in cached):
+            print(f"Build cache hit ({key}), skipping synthesis and place and route.")
+            for c, o in zip(cached, outputs):
+                os.makedirs(os.path.dirname(o), exist_ok=True)
+                shutil.copy2(c, o)
+            return False
+
+        print(f"Build cache miss ({key}), running the toolchain.")
+        self.run_toolchain()
+        os.makedirs(entry, exist_ok=True)
+        for c, o in zip(cached, outputs):
+            if os.path.exists(o):
+                shutil.copy2(o, c)
+        with open(os.path.join(entry, "manifest.json"), "w") as f:
+            json.dump({"gateware": gateware, "software": software, "outputs": outputs}, f, indent=4)
+        return True
+
+    def run_toolchain(self):
+        """Runs the build script generated by build(run=False), the SoC can only be elaborated once."""
+        toolchain = self.builder.soc.platform.toolchain
+        cwd = os.getcwd()
+        os.chdir(self.builder.gateware_dir)
+        try:
+            toolchain.run_script(toolchain.build_script())
+        finally:
+            os.chdir(cwd)
+
+def default_cache_dir(name):
+    return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "uob_litex_boards", name)
@@ -0,0 +1,151 @@
+from migen import *
+from migen.genlib.cdc import PulseSynchronizer
+
+from litex.gen import *
+
+from litex.soc.interconnect.csr import CSR, CSRStatus
+
+# Wishbone bus monitor -----------------------------------------------------------------------------
+
+class WishboneBusMonitor(LiteXModule):
+    """Passive performance counters for one Wishbone master.
+
+    A transaction is one assertion of `cyc`, its latency the number of cycles from the first `stb`
+    to the first `ack` and its burst length the number of beats acked before `cyc` drops. Counters
+    run in `clock_domain` (the master's) and are latched into the status registers by a write to
+    `snapshot`, so all the values read back belong to the same instant; a write to `clear` restarts
+    counting. With a clock domain other than sys, the counters are latched in that domain and copied
+    into the status registers once a pulse back into sys says the latch is stable: leave a few
+    microseconds between the snapshot and reading the registers. `trigger` is a sys pulse doing what
+    a write to `snapshot` does, to latch several monitors at once.
+    """
+    def __init__(self, bus, clock_domain="sys", counter_width=32):
+        self.trigger  = Signal()
+        self.clear    = CSR()
+        self.snapshot = CSR()
+
+        self.cycles       = CSRStatus(counter_width, description="Cycles since the last clear.")
+        self.busy         = CSRStatus(counter_width, description="Cycles with ``cyc`` asserted.")
+        self.transactions = CSRStatus(counter_width, description="Bus cycles (``cyc`` assertions).")
+        self.beats        = CSRStatus(counter_width, description="Acked beats.")
+        self.stalls       = CSRStatus(counter_width, description="Cycles with ``stb`` asserted and no ``ack``.")
+        self.latency_min  = CSRStatus(counter_width, description="Shortest ``stb`` to first ``ack`` latency.")
+        self.latency_max  = CSRStatus(counter_width, description="Longest ``stb`` to first ``ack`` latency.")
+        self.latency_sum  = CSRStatus(counter_width, description="Sum of the first beat latencies.")
+        self.burst_max    = CSRStatus(counter_width, description="Most beats in one bus cycle.")
+
+        # # #
+
+        sync = getattr(self.sync, clock_domain)
+
+        # Control pulses into the monitored domain.
+        clear    = Signal()
+        snapshot = Signal()
+        if clock_domain == "sys":
+            self.comb += [
+                clear.eq(self.clear.re),
+                snapshot.eq(self.snapshot.re | self.trigger),
+            ]
+        else:
+            self.clear_ps    = PulseSynchronizer("sys", clock_domain)
+            self.snapshot_ps = PulseSynchronizer("sys", clock_domain)
+            self.comb += [
+                self.clear_ps.i.eq(self.clear.re),
+                self.snapshot_ps.i.eq(self.snapshot.re | self.trigger),
+                clear.eq(self.clear_ps.o),
+                snapshot.eq(self.snapshot_ps.o),
+            ]
+
+        # Counters.
+        def counter(name, reset=0):
+            return Signal(counter_width, name=name, reset=reset)
+        cycles       = counter("cycles")
+        busy         = counter("busy")
+        transactions = counter("transactions")
+        beats        = counter("beats")
+        stalls       = counter("stalls")
+        latency_min  = counter("latency_min", reset=2**counter_width - 1)
+        latency_max  = counter("latency_max")
+        latency_sum  = counter("latency_sum")
+        burst_max    = counter("burst_max")
+
+        active  = Signal() # Inside a bus cycle.
+        waiting = Signal() # First beat of the bus cycle not acked yet.
+        latency = Signal(counter_width)
+        burst   = Signal(counter_width)
+        start   = Signal()
+        first   = Signal()
+        self.comb += [
+            start.eq(bus.cyc & bus.stb & ~active),
+            first.eq(bus.ack & (waiting | start)),
+        ]
+
+        # Latency of the first beat, the cycle the request shows up counts as one.
+        first_latency = Signal(counter_width)
+        self.comb += If(start, first_latency.eq(1)).Else(first_latency.eq(latency + 1))
+
+        sync += [
+            If(clear,
+                cycles.eq(0),
+                busy.eq(0),
+                transactions.eq(0),
+                beats.eq(0),
+                stalls.eq(0),
+                latency_min.eq(2**counter_width - 1),
+                latency_max.eq(0),
+                latency_sum.eq(0),
+                burst_max.eq(0),
+            ).Else(
+                cycles.eq(cycles + 1),
+                If(bus.cyc, busy.eq(busy + 1)),
+                If(start, transactions.eq(transactions + 1)),
+                If(bus.ack, beats.eq(beats + 1)),
+                If(bus.cyc & bus.stb & ~bus.ack, stalls.eq(stalls + 1)),
+                If(first,
+                    latency_sum.eq(latency_sum + first_latency),
+                    If(first_latency < latency_min, latency_min.eq(first_latency)),
+                    If(first_latency > latency_max, latency_max.eq(first_latency)),
+                ),
+                If(burst > burst_max, burst_max.eq(burst)),
+            ),
+
+            # Bus cycle tracking.
+            If(start,
+                active.eq(1),
+                waiting.eq(~bus.ack),
+                latency.eq(1),
+                burst.eq(bus.ack),
+            ).Elif(active,
+                If(~bus.cyc,
+                    active.eq(0),
+                    waiting.eq(0),
+                ).Else(
+                    If(bus.ack,
+                        waiting.eq(0),
+                        burst.eq(burst + 1),
+                    ),
+                    If(waiting, latency.eq(latency + 1)),
+                ),
+            ),
+        ]
+
+        # Snapshot.
+        snapshot_regs = [
+            (cycles,       self.cycles),
+            (busy,         self.busy),
+            (transactions, self.transactions),
+            (beats,        self.beats),
+            (stalls,       self.stalls),
+            (latency_min,  self.latency_min),
+            (latency_max,  self.latency_max),
+            (latency_sum,  self.latency_sum),
+            (burst_max,    self.burst_max),
+        ]
+        if clock_domain == "sys":
+            sync += If(snapshot, [csr.status.eq(value) for value, csr in snapshot_regs])
+        else:
+            shadows = [Signal(counter_width) for _ in snapshot_regs]
+            sync += If(snapshot, [shadow.eq(value) for shadow, (value, _) in zip(shadows, snapshot_regs)])
+            self.latched_ps = PulseSynchronizer(clock_domain, "sys")
+            self.comb += self.latched_ps.i.eq(snapshot)
+            self.sync += If(self.latched_ps.o, [csr.status.eq(shadow) for shadow, (_, csr) in zip(shadows, snapshot_regs)])
@@ -0,0 +1,288 @@
+from migen import *
+
+from litex.gen import *
+
+from litex.soc.interconnect import stream
+
+# Wishbone to LiteDRAM native port bridge ---------------------------------------------------------
+
+class WishboneDRAMPort(LiteXModule):
+    """Connect a Wishbone master straight to its own LiteDRAM crossbar port.
+
+    Addresses are folded into a `size` byte window the same way the SoC bus remaps a master given a
+    region, so a master used to seeing SDRAM at `origin` keeps working unchanged. Linear
+    incrementing bursts (CTI=0b010, BTE=0b00) are prefetched: up to `prefetch` reads are kept in flight on the
+    port and acked back to back as their data returns, the data fetched past the end of a burst is
+    dropped. Writes are posted, one command and data beat per Wishbone beat.
+    """
+    def __init__(self, wishbone, port, size, prefetch=8):
+        assert wishbone.data_width == port.data_width
+        assert wishbone.addressing == "word"
+        dw = port.data_width
+
+        # # #
+
+        adr_mask = size//(dw//8) - 1
+        adr      = Signal(len(port.cmd.addr))
+        self.comb += adr.eq(wishbone.adr & adr_mask)
+
+        rd_fifo  = stream.SyncFIFO([("data", dw)], prefetch, buffered=True)
+        inflight = Signal(max=prefetch + 1)
+        rd_adr   = Signal(len(port.cmd.addr))
+        rd_cmd   = Signal()
+        rd_pop   = Signal()
+        burst    = Signal()
+        issued   = Signal()
+        self.rd_fifo = rd_fifo
+        self.comb += [
+            burst.eq(wishbone.cyc & wishbone.stb & (wishbone.cti == 0b010) & (wishbone.bte == 0b00)),
+            port.rdata.connect(rd_fifo.sink, keep={"valid", "ready"}),
+            rd_fifo.sink.data.eq(port.rdata.data),
+            rd_pop.eq(rd_fifo.source.valid & rd_fifo.source.ready),
+        ]
+        self.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(wishbone.cyc & wishbone.stb,
+                If(wishbone.we,
+                    NextState("WRITE-CMD")
+                ).Else(
+                    NextValue(rd_adr, adr),
+                    NextState("READ")
+                )
+            )
+        )
+        # Reads: keep the port busy while the burst goes on, a classic cycle only needs one command.
+        fsm.act("READ",
+            rd_cmd.eq((inflight < prefetch) & (burst | ~issued)),
+            port.cmd.valid.eq(rd_cmd),
+            port.cmd.we.eq(0),
+            port.cmd.addr.eq(rd_adr),
+            port.cmd.last.eq(1),
+            wishbone.dat_r.eq(rd_fifo.source.data),
+            If(wishbone.cyc & wishbone.stb,
+                wishbone.ack.eq(rd_fifo.source.valid),
+                rd_fifo.source.ready.eq(rd_fifo.source.valid),
+                If(rd_fifo.source.valid & ~burst,
+                    NextState("DRAIN")
+                )
+            ).Else(
+                NextState("DRAIN")
+            )
+        )
+        # Drop what was prefetched past the end of the burst.
+        fsm.act("DRAIN",
+            rd_fifo.source.ready.eq(1),
+            If((inflight == 0) | ((inflight == 1) & rd_pop),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("WRITE-CMD",
+            port.cmd.valid.eq(1),
+            port.cmd.we.eq(1),
+            port.cmd.addr.eq(adr),
+            port.cmd.last.eq(1),
+            If(port.cmd.ready,
+                NextState("WRITE-DATA")
+            )
+        )
+        fsm.act("WRITE-DATA",
+            port.wdata.valid.eq(1),
+            port.wdata.data.eq(wishbone.dat_w),
+            port.wdata.we.eq(wishbone.sel),
+            If(port.wdata.ready,
+                wishbone.ack.eq(1),
+                NextState("IDLE")
+            )
+        )
+
+        self.sync += [
+            If(rd_cmd & port.cmd.ready & ~rd_pop,
+                inflight.eq(inflight + 1)
+            ).Elif(~(rd_cmd & port.cmd.ready) & rd_pop,
+                inflight.eq(inflight - 1)
+            ),
+            If(rd_cmd & port.cmd.ready,
+                rd_adr.eq(rd_adr + 1),
+                issued.eq(1)
+            ).Elif(fsm.ongoing("IDLE"),
+                issued.eq(0)
+            ),
+        ]
+
+# Read mostly line cache on a LiteDRAM port -------------------------------------------------------
+
+class WishboneDRAMLineCache(LiteXModule):
+    """Small line cache with next-line prefetch between a Wishbone master and a LiteDRAM port.
+
+    Meant for latency sensitive masters that mostly read, like the NES core fetching PRG/CHR ROM:
+    hits are acked the cycle after the request whatever the rest of the SoC is doing, a miss fills
+    the whole line with back to back port reads and then queues the next line, which covers the
+    sequential 6502 instruction stream and PPU tile fetches. The cache is direct mapped, with
+    `split_bit` (a byte address bit) the upper half of the lines is reserved for addresses that have
+    it set so CHR fetches cannot evict PRG lines. Writes go through to the port and update a hit
+    line.
+
+    The module runs in the clock domain of `port`, which the crossbar bridges when `get_port` is
+    given a `clock_domain`; assert `flush` (or reset the domain) once the memory contents changed.
+    """
+    def __init__(self, wishbone, port, size, nlines=16, line_words=8, split_bit=None):
+        assert wishbone.addressing == "word"
+        assert port.data_width % wishbone.data_width == 0
+        self.flush = Signal()
+
+        # # #
+
+        dw          = port.data_width
+        ratio       = dw//wishbone.data_width
+        sub_bits    = log2_int(ratio)
+        offset_bits = log2_int(line_words)
+        index_bits  = log2_int(nlines)
+        adr_bits    = log2_int(size//(dw//8))
+
+        # Address decoding.
+        word_adr = Signal(adr_bits)
+        sub      = Signal(max(sub_bits, 1))
+        line     = Signal(adr_bits - offset_bits)
+        self.comb += [
+            word_adr.eq(wishbone.adr >> sub_bits),
+            line.eq(word_adr[offset_bits:]),
+        ]
+        if sub_bits:
+            self.comb += sub.eq(wishbone.adr[:sub_bits])
+
+        def line_index(line):
+            if split_bit is None:
+                return line[:index_bits]
+            split = split_bit - log2_int(dw//8) - offset_bits
+            return Cat(line[:index_bits - 1], line[split])
+
+        tags  = Array(Signal(len(line)) for _ in range(nlines))
+        valid = Array(Signal() for _ in range(nlines))
+        index = Signal(index_bits)
+        hit   = Signal()
+        self.comb += [
+            index.eq(line_index(line)),
+            hit.eq(valid[index] & (tags[index] == line)),
+        ]
+
+        # Storage.
+        mem    = Memory(dw, nlines*line_words)
+        rdport = mem.get_port()
+        wrport = mem.get_port(write_capable=True, we_granularity=8)
+        self.specials += mem, rdport, wrport
+
+        # Hits.
+        hit_ack = Signal()
+        sub_r   = Signal(len(sub))
+        self.fsm = fsm = FSM(reset_state="IDLE")
+        self.comb += [
+            rdport.adr.eq(Cat(word_adr[:offset_bits], index)),
+            wishbone.ack.eq(hit_ack),
+            wishbone.dat_r.eq(Array(rdport.dat_r[i*wishbone.data_width:(i + 1)*wishbone.data_width] for i in range(ratio))[sub_r]),
+        ]
+        self.sync += [
+            hit_ack.eq(fsm.ongoing("IDLE") & wishbone.cyc & wishbone.stb & ~wishbone.we & hit & ~hit_ack),
+            sub_r.eq(sub),
+        ]
+
+        # Line fills.
+        fill_line  = Signal(len(line))
+        fill_index = Signal(index_bits)
+        cmd_count  = Signal(offset_bits + 1)
+        rd_count   = Signal(offset_bits + 1)
+        pf_line    = Signal(len(line))
+        pf_pending = Signal()
+        pf_index   = Signal(index_bits)
+        pf_hit     = Signal()
+        self.comb += [
+            pf_index.eq(line_index(pf_line)),
+            pf_hit.eq(valid[pf_index] & (tags[pf_index] == pf_line)),
+        ]
+
+        # Tag updates, driven by the FSM below.
+        do_flush   = Signal()
+        do_clear   = Signal()
+        clear_idx  = Signal(index_bits)
+        fill_done  = Signal()
+        self.sync += [
+            If(do_flush,
+                [v.eq(0) for v in valid]
+            ).Elif(do_clear,
+                valid[clear_idx].eq(0)
+            ).Elif(fill_done,
+                tags[fill_index].eq(fill_line),
+                valid[fill_index].eq(1)
+            )
+        ]
+
+        wr_we = Signal(dw//8)
+        self.comb += Case(sub, {i: wr_we.eq(wishbone.sel << (i*len(wishbone.sel))) for i in range(ratio)})
+
+        fsm.act("IDLE",
+            NextValue(cmd_count, 0),
+            NextValue(rd_count, 0),
+            If(self.flush,
+                do_flush.eq(1),
+                NextValue(pf_pending, 0)
+            ).Elif(wishbone.cyc & wishbone.stb & wishbone.we,
+                NextState("WRITE-CMD")
+            ).Elif(wishbone.cyc & wishbone.stb & ~hit & ~hit_ack,
+                NextValue(fill_line, line),
+                NextValue(fill_index, index),
+                do_clear.eq(1),
+                clear_idx.eq(index),
+                NextValue(pf_line, line + 1),
+                NextValue(pf_pending, 1),
+                NextState("FILL")
+            ).Elif(pf_pending & ~(wishbone.cyc & wishbone.stb),
+                NextValue(pf_pending, 0),
+                If(~pf_hit,
+                    NextValue(fill_line, pf_line),
+                    NextValue(fill_index, pf_index),
+                    do_clear.eq(1),
+                    clear_idx.eq(pf_index),
+                    NextState("FILL")
+                )
+            )
+        )
+        fsm.act("FILL",
+            port.cmd.valid.eq(~cmd_count[offset_bits]),
+            port.cmd.we.eq(0),
+            port.cmd.addr.eq(Cat(cmd_count[:offset_bits], fill_line)),
+            port.cmd.last.eq(1),
+            If(port.cmd.valid & port.cmd.ready,
+                NextValue(cmd_count, cmd_count + 1)
+            ),
+            port.rdata.ready.eq(1),
+            wrport.adr.eq(Cat(rd_count[:offset_bits], fill_index)),
+            wrport.dat_w.eq(port.rdata.data),
+            If(port.rdata.valid,
+                wrport.we.eq(2**len(wrport.we) - 1),
+                NextValue(rd_count, rd_count + 1),
+                If(rd_count == (line_words - 1),
+                    fill_done.eq(1),
+                    NextState("IDLE")
+                )
+            )
+        )
+        fsm.act("WRITE-CMD",
+            port.cmd.valid.eq(1),
+            port.cmd.we.eq(1),
+            port.cmd.addr.eq(word_adr),
+            port.cmd.last.eq(1),
+            If(port.cmd.ready,
+                NextState("WRITE-DATA")
+            )
+        )
+        fsm.act("WRITE-DATA",
+            port.wdata.valid.eq(1),
+            port.wdata.data.eq(Replicate(wishbone.dat_w, ratio)),
+            port.wdata.we.eq(wr_we),
+            wrport.adr.eq(Cat(word_adr[:offset_bits], index)),
+            wrport.dat_w.eq(Replicate(wishbone.dat_w, ratio)),
+            If(port.wdata.ready,
+                If(hit, wrport.we.eq(wr_we)),
+                wishbone.ack.eq(1),
+                NextState("IDLE")
+            )
+        )
@@ -0,0 +1,95 @@
+from migen import *
+
+from litex.gen import *
+
+from litex.soc.interconnect import wishbone
+from litex.soc.cores.hyperbus import HyperRAM
+
+# Striped burst bridge -----------------------------------------------------------------------------
+
+class _StripedBurst(LiteXModule):
+    """Splits each access of a wide `master` into one incrementing burst per slave, all at once.
+
+    Slave n holds the n-th slice of every master word; its burst is len(slice)/len(slave.dat_w)
+    beats long, starting at the master address times that length.
+    """
+    def __init__(self, master, slaves):
+        chunk = len(master.dat_w)//len(slaves)
+        ack   = Signal()
+        dones = []
+        datas = []
+
+        # # #
+
+        self.sync += ack.eq(0)
+        for slave in slaves:
+            dw    = len(slave.dat_w)
+            beats = chunk//dw
+            beat  = Signal(max=beats)
+            done  = Signal()
+            dat_r = Signal(chunk)
+            n     = len(datas)
+            dat_w = master.dat_w[n*chunk:(n + 1)*chunk]
+            sel   = master.sel[n*chunk//8:(n + 1)*chunk//8]
+            self.comb += [
+                slave.adr.eq(Cat(beat, master.adr)),
+                slave.dat_w.eq(Array(dat_w[i*dw:(i + 1)*dw] for i in range(beats))[beat]),
+                slave.sel.eq(Array(sel[i*dw//8:(i + 1)*dw//8] for i in range(beats))[beat]),
+                slave.we.eq(master.we),
+                slave.cyc.eq(master.cyc & master.stb & ~done & ~ack),
+                slave.stb.eq(master.cyc & master.stb & ~done & ~ack),
+                slave.cti.eq(Mux(beat == (beats - 1), wishbone.CTI_BURST_END, wishbone.CTI_BURST_INCREMENTING)),
+                slave.bte.eq(0),
+            ]
+            self.sync += If(slave.stb & slave.ack,
+                Case(beat, {i: dat_r[i*dw:(i + 1)*dw].eq(slave.dat_r) for i in range(beats)}),
+                If(beat == (beats - 1),
+                    beat.eq(0),
+                    done.eq(1),
+                ).Else(
+                    beat.eq(beat + 1),
+                )
+            )
+            dones.append(done)
+            datas.append(dat_r)
+
+        all_done = Signal()
+        self.comb += [
+            all_done.eq(Cat(*dones) == (2**len(dones) - 1)),
+            master.ack.eq(ack),
+            master.dat_r.eq(Cat(*datas)),
+        ]
+        self.sync += If(all_done,
+            ack.eq(1),
+            [done.eq(0) for done in dones],
+        )
+
+# Interleaved HyperRAM -----------------------------------------------------------------------------
+
+class InterleavedHyperRAM(LiteXModule):
+    """Two HyperRAM chips behind one write-back cache, striped so every line transfer uses both.
+
+    Each `line_bytes` cache line is split in half between the chips and refilled or written back as
+    two concurrent bursts, so a line moves in the time one chip takes for half of it. The bus sees
+    one memory of twice the chip size. Accesses from every master go through the cache, so DMA and
+    the CPU stay coherent; a write miss still refills its line before merging.
+    """
+    def __init__(self, pads, sys_clk_freq, chip_size=8*2**20, cache_size=8192, line_bytes=32, latency=7):
+        nchips     = len(pads)
+        line_words = line_bytes//4
+        size       = nchips*chip_size
+        assert line_words % nchips == 0
+
+        self.bus = wishbone.Interface(data_width=32, address_width=log2_int(size//4), addressing="word")
+
+        # # #
+
+        chips = []
+        for n, chip_pads in enumerate(pads):
+            chip = HyperRAM(chip_pads, latency=latency, sys_clk_freq=sys_clk_freq, with_bursting=True)
+            setattr(self, f"hyperram{n}", chip)
+            chips.append(chip.bus)
+
+        self.line = line = wishbone.Interface(data_width=8*line_bytes, address_width=log2_int(size//line_bytes), addressing="word")
+        self.cache   = wishbone.Cache(cachesize=cache_size//4, master=self.bus, slave=line, reverse=False)
+        self.striper = _StripedBurst(line, chips)
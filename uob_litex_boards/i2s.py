@@ -1,5 +1,170 @@
+from migen import *
+from migen.genlib.cdc import MultiReg
+
 from litex.gen import *
 
+from litex.soc.interconnect import stream, wishbone
+from litex.soc.interconnect.csr import CSRStorage, CSRStatus, CSRField
+from litex.soc.interconnect.csr_eventmanager import EventManager, EventSourcePulse
+from litex.soc.cores.dma import WishboneDMAWriter
+
+# I2S Master ---------------------------------------------------------------------------------------
+
 class I2SMaster(LiteXModule):
-    def __init__(self, pads):
-        pass
\ No newline at end of file
+    """I2S clock master and multi-lane receiver with a DMA ring buffer.
+
+    `sck` and `ws` are generated from sys by a phase accumulator, 64 bit clocks per frame (two
+    32-bit slots), and shared by every data lane of `pads`. Samples are taken on the falling edge of `sck`,
+    at the end of each bit, so the resynchronizer delay stays inside the bit. Each frame yields one
+    left and one right sample per lane; the slots enabled in `slots` are written to memory in lane
+    order (lane 0 left, lane 0 right, lane 1 left...), either as full 32-bit words or, with
+    `pack16`, as the upper 16 bits of two consecutive slots per word.
+
+    The ring buffer is `length` bytes (a non-zero multiple of 8) at `base`; `enable` has no effect
+    while it is shorter than 8 bytes. The `half` and `full` events fire once the first and second
+    halves have been written, so the CPU only touches whole half buffers. Frames are dropped whole,
+    and counted in `overflows`, when the DMA falls behind.
+    """
+    def __init__(self, pads, sys_clk_freq=75e6, sample_rate=48000, fifo_depth=64):
+        nlanes = len(pads.data)
+        nslots = 2*nlanes
+        assert 2*64*sample_rate < sys_clk_freq
+        assert fifo_depth > nslots
+
+        self.bus = wishbone.Interface(data_width=32, address_width=30, addressing="word")
+
+        self.control = CSRStorage(fields=[
+            CSRField("enable", size=1, description="Generate the I2S clocks and capture (clearing it rewinds the ring buffer)."),
+            CSRField("pack16", size=1, description="Keep the upper 16 bits of each sample, two slots per word."),
+        ])
+        self.slots     = CSRStorage(nslots, reset=2**nslots - 1, description="Captured slots, bits 2n and 2n+1 are lane n left and right.")
+        self.clk_inc   = CSRStorage(32, reset=int(round(2*64*sample_rate/sys_clk_freq*2**32)),
+            description="Phase increment of the ``sck`` generator: 2*64*fs/sys_clk_freq*2**32.")
+        self.base      = CSRStorage(32, description="Ring buffer address.")
+        self.length    = CSRStorage(32, description="Ring buffer length in bytes.")
+        self.offset    = CSRStatus(32,  description="Byte offset of the next word in the ring buffer.")
+        self.frames    = CSRStatus(32,  description="Frames captured since enable.")
+        self.overflows = CSRStatus(32,  description="Frames dropped since enable.")
+
+        self.ev = EventManager()
+        self.ev.half = EventSourcePulse(description="First half of the ring buffer written.")
+        self.ev.full = EventSourcePulse(description="Second half of the ring buffer written.")
+        self.ev.finalize()
+
+        # # #
+
+        # Nothing runs without a ring buffer, a zero length would never wrap.
+        enable = Signal()
+        self.comb += enable.eq(self.control.fields.enable & (self.length.storage[3:] != 0))
+
+        # Clocks.
+        acc  = Signal(32)
+        tick = Signal()
+        sck  = Signal()
+        bit  = Signal(6)
+        fall = Signal()
+        self.sync += Cat(acc, tick).eq(acc + self.clk_inc.storage)
+        self.comb += fall.eq(enable & tick & sck)
+        self.sync += [
+            If(~enable,
+                sck.eq(0),
+                bit.eq(0),
+            ).Elif(tick,
+                sck.eq(~sck),
+                If(sck, bit.eq(bit + 1)),
+            )
+        ]
+        # ws leads the MSB of each slot by one bit.
+        self.comb += [
+            pads.sck.eq(sck),
+            pads.ws.eq(bit[5]),
+        ]
+
+        # Deserializer.
+        data    = Signal(nlanes)
+        shift   = [Signal(32) for _ in range(nlanes)]
+        samples = Array(Signal(32) for _ in range(nslots))
+        started = Signal()
+        done    = Signal()
+        self.specials += MultiReg(pads.data, data)
+        for lane in range(nlanes):
+            word = Cat(data[lane], shift[lane][:-1])
+            self.sync += If(fall,
+                shift[lane].eq(word),
+                If(bit == 32, samples[2*lane].eq(word)),
+                If(bit == 0,  samples[2*lane + 1].eq(word)),
+            )
+        self.sync += [
+            done.eq(fall & (bit == 0) & started),
+            If(~enable,
+                started.eq(0),
+            ).Elif(fall & (bit == 32),
+                started.eq(1),
+            )
+        ]
+
+        # Slot serializer: whole frames into the FIFO, or none of the frame.
+        self.fifo = fifo = stream.SyncFIFO([("data", 32)], fifo_depth, buffered=True)
+        slot     = Signal(max=nslots + 1)
+        busy     = Signal()
+        half     = Signal(16)
+        has_half = Signal()
+        sample   = Signal(32)
+        self.comb += sample.eq(samples[slot])
+        self.sync += [
+            If(~enable,
+                busy.eq(0),
+                has_half.eq(0),
+                self.frames.status.eq(0),
+                self.overflows.status.eq(0),
+            ).Elif(done & ~busy,
+                If(fifo.level <= (fifo_depth - nslots),
+                    busy.eq(1),
+                    slot.eq(0),
+                    self.frames.status.eq(self.frames.status + 1),
+                ).Else(
+                    self.overflows.status.eq(self.overflows.status + 1),
+                )
+            ).Elif(busy,
+                slot.eq(slot + 1),
+                If(slot == (nslots - 1), busy.eq(0)),
+                If((self.slots.storage >> slot)[0] & self.control.fields.pack16,
+                    half.eq(sample[16:]),
+                    has_half.eq(~has_half),
+                )
+            )
+        ]
+        self.comb += [
+            fifo.sink.valid.eq(busy & (self.slots.storage >> slot)[0] & (~self.control.fields.pack16 | has_half)),
+            If(self.control.fields.pack16,
+                fifo.sink.data.eq(Cat(half, sample[16:])),
+            ).Else(
+                fifo.sink.data.eq(sample),
+            ),
+        ]
+
+        # Ring buffer DMA.
+        self.dma = dma = WishboneDMAWriter(self.bus, endianness="little")
+        offset  = Signal(30)
+        written = Signal()
+        self.comb += [
+            dma.sink.valid.eq(fifo.source.valid & enable),
+            fifo.source.ready.eq(dma.sink.ready | ~enable),
+            dma.sink.address.eq(self.base.storage[2:] + offset),
+            dma.sink.data.eq(fifo.source.data),
+            written.eq(dma.sink.valid & dma.sink.ready),
+            self.offset.status.eq(Cat(Constant(0, 2), offset)),
+            self.ev.half.trigger.eq(written & (offset == (self.length.storage[3:] - 1))),
+            self.ev.full.trigger.eq(written & (offset == (self.length.storage[2:] - 1))),
+        ]
+        self.sync += [
+            If(~enable,
+                offset.eq(0),
+            ).Elif(written,
+                If(offset >= (self.length.storage[2:] - 1),
+                    offset.eq(0),
+                ).Else(
+                    offset.eq(offset + 1),
+                )
+            )
+        ]
@@ -1,5 +1,499 @@
+from functools import reduce
+from operator import and_, or_, xor
+
+from migen import *
+from migen.genlib.cdc import MultiReg, BusSynchronizer
+from migen.genlib.resetsync import AsyncResetSynchronizer
+
 from litex.gen import *
 
+from litex.soc.interconnect import stream, wishbone
+from litex.soc.interconnect.csr import CSRStorage, CSRStatus, CSRField
+from litex.soc.interconnect.csr_eventmanager import EventManager, EventSourcePulse
+from litex.soc.cores.dma import WishboneDMAWriter
+
+# CSI-2 helpers ------------------------------------------------------------------------------------
+
+CSI2_FRAME_START = 0x00
+CSI2_FRAME_END   = 0x01
+CSI2_YUV422_8    = 0x1e
+CSI2_RAW8        = 0x2a
+CSI2_RAW10       = 0x2b
+
+# Packet header ECC: parity bit p covers the header bits in _ecc_cover[p].
+_ecc_cover = [
+    [0, 1, 2, 4, 5, 7, 10, 11, 13, 16, 20, 21, 22, 23],
+    [0, 1, 3, 4, 6, 8, 10, 12, 14, 17, 20, 21, 22, 23],
+    [0, 2, 3, 5, 6, 9, 11, 12, 15, 18, 20, 21, 22],
+    [1, 2, 3, 7, 8, 9, 13, 14, 15, 19, 20, 21, 23],
+    [4, 5, 6, 7, 8, 9, 16, 17, 18, 19, 20, 22, 23],
+    [10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 21, 22, 23],
+]
+
+def _ecc_syndrome(bit):
+    return sum(1 << p for p, cover in enumerate(_ecc_cover) if bit in cover)
+
+def _crc16_byte(crc, byte):
+    # Payload CRC: CRC-16/CCITT sent LSB first (x^16 + x^12 + x^5 + 1, reflected 0x8408).
+    crc = [crc[i] for i in range(16)]
+    for i in range(8):
+        fb  = crc[0] ^ byte[i]
+        crc = crc[1:] + [fb]
+        crc[10] = crc[10] ^ fb
+        crc[3]  = crc[3]  ^ fb
+    return Cat(*crc)
+
+# CSI-2 Lane Aligner -------------------------------------------------------------------------------
+
+class CSI2LaneAligner(LiteXModule):
+    """Lines up the lanes of an HS burst on their sync bytes.
+
+    Each lane starts filling its own FIFO after its 0xB8 sync byte, and words are popped once every
+    lane has a byte, which absorbs up to `depth` byte clocks of lane to lane skew. `flush` rises
+    `timeout` cycles after the burst and clears the FIFOs of the trailing bytes; `error` pulses when
+    some lanes synced and the others did not follow within `timeout` cycles.
+    """
+    def __init__(self, nlanes=4, depth=8, timeout=8):
+        self.active = Signal()
+        self.bytes  = Signal(8*nlanes)
+        self.source = stream.Endpoint([("data", 8*nlanes)])
+        self.flush  = Signal()
+        self.error  = Signal()
+
+        # # #
+
+        idle = Signal(max=timeout + 1)
+        self.sync += If(self.active, idle.eq(0)).Elif(~self.flush, idle.eq(idle + 1))
+        self.comb += self.flush.eq(idle == timeout)
+
+        fifos  = []
+        synced = []
+        for lane in range(nlanes):
+            fifo = ResetInserter()(stream.SyncFIFO([("data", 8)], depth))
+            s    = Signal()
+            b    = self.bytes[8*lane:8*(lane + 1)]
+            self.submodules += fifo
+            self.comb += [
+                fifo.reset.eq(self.flush),
+                fifo.sink.valid.eq(self.active & s),
+                fifo.sink.data.eq(b),
+            ]
+            self.sync += If(~self.active, s.eq(0)).Elif(b == 0xb8, s.eq(1))
+            fifos.append(fifo)
+            synced.append(s)
+
+        # The source never stalls: the D-PHY cannot be held off.
+        ready = reduce(and_, [fifo.source.valid for fifo in fifos])
+        self.comb += [
+            self.source.valid.eq(ready),
+            self.source.data.eq(Cat(*[fifo.source.data for fifo in fifos])),
+        ]
+        for fifo in fifos:
+            self.comb += fifo.source.ready.eq(ready)
+
+        skew     = Signal(max=timeout + 1)
+        reported = Signal()
+        some     = Signal()
+        every    = Signal()
+        self.comb += [
+            some.eq(reduce(or_, synced)),
+            every.eq(reduce(and_, synced)),
+            self.error.eq(some & ~every & (skew == timeout) & ~reported),
+        ]
+        self.sync += [
+            If(~some | every,
+                skew.eq(0),
+                reported.eq(0),
+            ).Elif(skew != timeout,
+                skew.eq(skew + 1),
+            ).Else(
+                reported.eq(1),
+            )
+        ]
+
+# CSI-2 Packet Parser ------------------------------------------------------------------------------
+
+class CSI2PacketParser(LiteXModule):
+    """Splits the aligned word stream of a 4-lane link into CSI-2 packets.
+
+    The header is checked and single bit errors corrected with its ECC; long packet payloads are
+    forwarded as words with the number of valid bytes (first/last mark the packet) and checked
+    against their CRC. One packet per HS burst, as the sensors on this board send them.
+    """
+    def __init__(self):
+        self.sink   = stream.Endpoint([("data", 32)])
+        self.flush  = Signal()
+        self.source = stream.Endpoint([("data", 32), ("nbytes", 3)])
+        self.dt     = Signal(6)
+        self.vc     = Signal(2)
+        self.wc     = Signal(16)
+
+        self.frame_start   = Signal()
+        self.frame_end     = Signal()
+        self.ecc_corrected = Signal()
+        self.ecc_error     = Signal()
+        self.crc_error     = Signal()
+
+        # # #
+
+        data = self.sink.data
+        self.comb += self.sink.ready.eq(1)
+
+        # Header ECC.
+        hvalid   = Signal()
+        header   = Signal(24)
+        syndrome = Signal(6)
+        self.comb += syndrome.eq(data[24:30] ^ Cat(*[reduce(xor, [data[b] for b in cover]) for cover in _ecc_cover]))
+        ecc_cases = {0: header.eq(data[:24])}
+        for b in range(24):
+            ecc_cases[_ecc_syndrome(b)] = [header.eq(data[:24] ^ (1 << b)), self.ecc_corrected.eq(hvalid)]
+        for p in range(6):
+            ecc_cases[1 << p] = [header.eq(data[:24]), self.ecc_corrected.eq(hvalid)]
+        ecc_cases["default"] = [header.eq(data[:24]), self.ecc_error.eq(hvalid)]
+        self.comb += Case(syndrome, ecc_cases)
+
+        # Payload CRC: `left` counts the payload and CRC bytes not received yet.
+        left   = Signal(17)
+        crc    = Signal(16)
+        crc_rx = Signal(16)
+        crcs   = [crc]
+        for j in range(4):
+            c = Signal(16)
+            self.comb += c.eq(Mux(left > (j + 2), _crc16_byte(crcs[-1], data[8*j:8*(j + 1)]), crcs[-1]))
+            crcs.append(c)
+        crc_rx_next = Signal(16)
+        self.comb += crc_rx_next.eq(crc_rx)
+        for j in range(4):
+            self.comb += [
+                If(left == (j + 2), crc_rx_next[:8].eq(data[8*j:8*(j + 1)])),
+                If(left == (j + 1), crc_rx_next[8:].eq(data[8*j:8*(j + 1)])),
+            ]
+
+        self.fsm = fsm = FSM(reset_state="HEADER")
+        fsm.act("HEADER",
+            If(self.sink.valid,
+                If(self.ecc_error,
+                    NextState("FLUSH"),
+                ).Elif(header[:6] < 0x10,
+                    self.frame_start.eq(header[:6] == CSI2_FRAME_START),
+                    self.frame_end.eq(header[:6] == CSI2_FRAME_END),
+                    NextState("FLUSH"),
+                ).Else(
+                    NextValue(self.dt, header[:6]),
+                    NextValue(self.vc, header[6:8]),
+                    NextValue(self.wc, header[8:24]),
+                    NextValue(left, header[8:24] + 2),
+                    NextValue(crc, 0xffff),
+                    NextValue(crc_rx, 0),
+                    NextValue(self.source.first, 1),
+                    NextState("PAYLOAD"),
+                )
+            )
+        )
+        fsm.act("PAYLOAD",
+            self.source.valid.eq(self.sink.valid & (left > 2)),
+            self.source.last.eq(left <= 6),
+            self.source.data.eq(data),
+            self.source.nbytes.eq(Mux(left >= 6, 4, left - 2)),
+            If(self.flush,
+                self.crc_error.eq(1),
+                NextState("HEADER"),
+            ).Elif(self.sink.valid,
+                NextValue(crc, crcs[-1]),
+                NextValue(crc_rx, crc_rx_next),
+                NextValue(left, left - 4),
+                NextValue(self.source.first, 0),
+                If(left <= 4, NextState("CHECK")),
+            )
+        )
+        fsm.act("CHECK",
+            self.crc_error.eq(crc != crc_rx),
+            NextState("FLUSH"),
+        )
+        fsm.act("FLUSH",
+            If(self.flush, NextState("HEADER"))
+        )
+        self.comb += hvalid.eq(self.sink.valid & fsm.ongoing("HEADER"))
+
+# CSI-2 Unpacker -----------------------------------------------------------------------------------
+
+class CSI2Unpacker(LiteXModule):
+    """Payload bytes to pixels, four 16-bit MSB aligned pixels per beat.
+
+    RAW8 and RAW10 pixels are left aligned in 16 bits; YUV422 pixels are (chroma, luma) byte pairs,
+    U for even and V for odd pixels. first/last mark the line, `fs` the first beat of a frame. A
+    line tail that does not fill four pixels is dropped. The source never stalls.
+    """
+    def __init__(self):
+        self.sink        = stream.Endpoint([("data", 32), ("nbytes", 3)])
+        self.dt          = Signal(6)
+        self.frame_start = Signal()
+        self.source      = stream.Endpoint([("data", 64), ("fs", 1)])
+
+        # # #
+
+        group = Signal(4)
+        self.comb += Case(self.dt, {
+            CSI2_RAW8     : group.eq(4),
+            CSI2_RAW10    : group.eq(5),
+            CSI2_YUV422_8 : group.eq(8),
+            "default"     : group.eq(0),
+        })
+
+        # Fewer than `group` bytes wait in `buf` between beats.
+        count    = Signal(4)
+        buf      = Signal(56)
+        combined = Signal(88)
+        total    = Signal(4)
+        emit     = Signal()
+        cases    = {0: combined.eq(self.sink.data)}
+        for n in range(1, 8):
+            cases[n] = combined.eq(Cat(buf[:8*n], self.sink.data))
+        self.comb += [
+            Case(count, cases),
+            total.eq(count + Mux(self.sink.valid, self.sink.nbytes, 0)),
+            emit.eq((group != 0) & (total >= group)),
+            self.sink.ready.eq(1),
+        ]
+
+        line_first  = Signal()
+        frame_first = Signal()
+        self.comb += [
+            self.source.valid.eq(emit),
+            self.source.first.eq(line_first | (self.sink.valid & self.sink.first)),
+            self.source.last.eq(self.sink.valid & self.sink.last & ((total - group) < group)),
+            self.source.fs.eq(frame_first),
+            Case(self.dt, {
+                CSI2_RAW8  : self.source.data.eq(Cat(*[Cat(Constant(0, 8), combined[8*i:8*(i + 1)]) for i in range(4)])),
+                CSI2_RAW10 : self.source.data.eq(Cat(*[Cat(Constant(0, 6), combined[32 + 2*i:34 + 2*i], combined[8*i:8*(i + 1)]) for i in range(4)])),
+                "default"  : self.source.data.eq(combined[:64]),
+            }),
+        ]
+        self.sync += [
+            If(emit,
+                count.eq(total - group),
+                Case(group, {
+                    4: buf.eq(combined[32:]),
+                    5: buf.eq(combined[40:]),
+                    8: buf.eq(combined[64:]),
+                }),
+            ).Elif(self.sink.valid,
+                count.eq(total),
+                buf.eq(combined),
+            ),
+            If(self.sink.valid & self.sink.last, count.eq(0)),
+            If(emit,
+                line_first.eq(0),
+            ).Elif(self.sink.valid & self.sink.first,
+                line_first.eq(1),
+            ),
+            If(self.frame_start,
+                frame_first.eq(1),
+            ).Elif(emit,
+                frame_first.eq(0),
+            ),
+        ]
+
+# MIPI CSI-2 Receiver ------------------------------------------------------------------------------
+
 class MipiCsiMaster(LiteXModule):
-    def __init__(self, pads):
-        pass
\ No newline at end of file
+    """CSI-2 camera receiver on the CrossLink-NX hard D-PHY, with double buffered frame DMA.
+
+    The D-PHY is the Radiant D-PHY Receiver IP, generated as `ip_name` with the hard D-PHY, gear 8,
+    the word aligner on and the lane aligner off; lane deskew, packet parsing and checking happen
+    here in the byte clock domain `<name>_byte`. The unpacked pixels are available on `source` in
+    that domain for live video.
+
+    Frames go to memory as their raw CSI-2 payload (the densest form: RAW10 stays 5 bytes per 4
+    pixels), lines back to back with a stride of the word count rounded up to 4 bytes. Each frame is
+    written to the page not holding the last complete frame; `status.page` switches and the `frame`
+    event fires on frame end, so the CPU always reads a whole frame. Frames are dropped when the CDC
+    FIFO overflows or they do not fit in `page_size`.
+    """
+    def __init__(self, pads, name="mipi", ip_name="dphy_rx", fifo_depth=256):
+        nlanes = len(pads.dp)
+        assert nlanes == 4
+        cd = f"{name}_byte"
+        self.clock_domain = cd
+
+        self.bus    = wishbone.Interface(data_width=32, address_width=30, addressing="word")
+        self.source = stream.Endpoint([("data", 64), ("fs", 1)])
+
+        self.control   = CSRStorage(fields=[
+            CSRField("enable", size=1, description="Capture frames to memory."),
+        ])
+        self.page0     = CSRStorage(32, description="Address of frame buffer 0.")
+        self.page1     = CSRStorage(32, description="Address of frame buffer 1.")
+        self.page_size = CSRStorage(32, description="Size of each frame buffer in bytes.")
+        self.status    = CSRStatus(fields=[
+            CSRField("page", size=1, description="Buffer holding the last complete frame."),
+        ])
+        self.frame_size = CSRStatus(32, description="Bytes in the last complete frame.")
+        self.frames     = CSRStatus(32, description="Frames written to memory.")
+        self.dropped    = CSRStatus(32, description="Frames dropped (FIFO overflow or too large).")
+        self.packet     = CSRStatus(fields=[
+            CSRField("dt", size=6,  offset=0,  description="Data type of the last long packet."),
+            CSRField("vc", size=2,  offset=6,  description="Virtual channel of the last long packet."),
+            CSRField("wc", size=16, offset=16, description="Word count of the last long packet."),
+        ])
+        self.lines         = CSRStatus(32, description="Lines in the last frame received.")
+        self.ecc_corrected = CSRStatus(32, description="Packet headers with a corrected bit error.")
+        self.ecc_errors    = CSRStatus(32, description="Packet headers dropped on an ECC error.")
+        self.crc_errors    = CSRStatus(32, description="Long packets with a payload CRC error.")
+        self.deskew_errors = CSRStatus(32, description="HS bursts whose lanes could not be aligned.")
+
+        self.ev = EventManager()
+        self.ev.frame = EventSourcePulse(description="A frame was completely written.")
+        self.ev.finalize()
+
+        # # #
+
+        # D-PHY ------------------------------------------------------------------------------------
+        self.cd_byte = ClockDomain(cd)
+        hs_active = Signal()
+        hs_bytes  = Signal(8*nlanes)
+        self.specials += Instance(ip_name,
+            io_clk_p_io       = pads.clkp,
+            io_clk_n_io       = pads.clkn,
+            io_d_p_io         = pads.dp,
+            io_d_n_io         = pads.dn,
+            i_sync_clk_i      = ClockSignal("sys"),
+            i_sync_rst_i      = ResetSignal("sys"),
+            i_reset_n_i       = ~ResetSignal("sys"),
+            i_reset_byte_n_i  = ~ResetSignal(cd),
+            i_pd_dphy_i       = 0,
+            o_clk_byte_o      = self.cd_byte.clk,
+            o_hs_d_en_o       = hs_active,
+            o_bd_o            = hs_bytes,
+        )
+        self.specials += AsyncResetSynchronizer(self.cd_byte, ResetSignal("sys"))
+
+        # Byte domain pipeline ---------------------------------------------------------------------
+        byte = ClockDomainsRenamer(cd)
+        self.aligner  = aligner  = byte(CSI2LaneAligner(nlanes))
+        self.parser   = parser   = byte(CSI2PacketParser())
+        self.unpacker = unpacker = byte(CSI2Unpacker())
+        self.comb += [
+            aligner.active.eq(hs_active),
+            aligner.bytes.eq(hs_bytes),
+            aligner.source.connect(parser.sink),
+            parser.flush.eq(aligner.flush),
+            parser.source.connect(unpacker.sink, omit={"ready"}),
+            unpacker.dt.eq(parser.dt),
+            unpacker.frame_start.eq(parser.frame_start),
+            unpacker.source.connect(self.source),
+        ]
+
+        # Counters.
+        sync_byte     = getattr(self.sync, cd)
+        lines         = Signal(32)
+        line_count    = Signal(32)
+        ecc_corrected = Signal(32)
+        ecc_errors    = Signal(32)
+        crc_errors    = Signal(32)
+        deskew_errors = Signal(32)
+        sync_byte += [
+            If(parser.frame_start,
+                line_count.eq(0),
+            ).Elif(parser.source.valid & parser.source.last,
+                line_count.eq(line_count + 1),
+            ),
+            If(parser.frame_end, lines.eq(line_count)),
+            If(parser.ecc_corrected, ecc_corrected.eq(ecc_corrected + 1)),
+            If(parser.ecc_error,     ecc_errors.eq(ecc_errors + 1)),
+            If(parser.crc_error,     crc_errors.eq(crc_errors + 1)),
+            If(aligner.error,        deskew_errors.eq(deskew_errors + 1)),
+        ]
+        for value, csr in [
+            (lines,         self.lines.status),
+            (ecc_corrected, self.ecc_corrected.status),
+            (ecc_errors,    self.ecc_errors.status),
+            (crc_errors,    self.crc_errors.status),
+            (deskew_errors, self.deskew_errors.status),
+            (Cat(parser.dt, parser.vc, parser.wc), Cat(self.packet.fields.dt, self.packet.fields.vc, self.packet.fields.wc))]:
+            bs = BusSynchronizer(len(csr), cd, "sys")
+            self.submodules += bs
+            self.comb += [bs.i.eq(value), csr.eq(bs.o)]
+
+        # Byte domain to sys: payload words and frame markers. Once a word is lost the frame is
+        # marked bad, and a frame end waits for room as nothing else is sent before the next frame.
+        layout = [("data", 32), ("fs", 1), ("fe", 1), ("bad", 1)]
+        self.cdc = cdc = stream.ClockDomainCrossing(layout, cd_from=cd, cd_to="sys", depth=fifo_depth)
+        enable     = Signal()
+        lost       = Signal()
+        fe_pending = Signal()
+        self.specials += MultiReg(self.control.fields.enable, enable, cd)
+        self.comb += [
+            If(parser.frame_start,
+                cdc.sink.valid.eq(enable),
+                cdc.sink.fs.eq(1),
+            ).Elif(parser.source.valid,
+                cdc.sink.valid.eq(enable & ~lost),
+                cdc.sink.data.eq(parser.source.data),
+            ).Elif(fe_pending,
+                cdc.sink.valid.eq(1),
+                cdc.sink.fe.eq(1),
+                cdc.sink.bad.eq(lost),
+            ),
+        ]
+        sync_byte += [
+            If(parser.frame_start,
+                lost.eq(~cdc.sink.ready),
+            ).Elif(cdc.sink.valid & ~cdc.sink.ready,
+                lost.eq(1),
+            ),
+            If(parser.frame_end & enable,
+                fe_pending.eq(1),
+            ).Elif(fe_pending & cdc.sink.ready & ~parser.source.valid & ~parser.frame_start,
+                fe_pending.eq(0),
+            ),
+        ]
+
+        # Frame writer -----------------------------------------------------------------------------
+        self.dma = dma = WishboneDMAWriter(self.bus, endianness="little")
+        page   = Signal()
+        offset = Signal(30)
+        bad    = Signal()
+        self.comb += [
+            dma.sink.address.eq(Mux(page, self.page1.storage[2:], self.page0.storage[2:]) + offset),
+            dma.sink.data.eq(cdc.source.data),
+        ]
+        self.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            cdc.source.ready.eq(1),
+            If(cdc.source.valid & cdc.source.fs,
+                NextValue(page, ~self.status.fields.page),
+                NextValue(offset, 0),
+                NextValue(bad, 0),
+                NextState("RUN"),
+            )
+        )
+        fsm.act("RUN",
+            If(cdc.source.fs | cdc.source.fe,
+                cdc.source.ready.eq(1),
+            ).Elif(offset >= self.page_size.storage[2:],
+                cdc.source.ready.eq(1),
+                If(cdc.source.valid, NextValue(bad, 1)),
+            ).Else(
+                dma.sink.valid.eq(cdc.source.valid),
+                cdc.source.ready.eq(dma.sink.ready),
+                If(dma.sink.valid & dma.sink.ready, NextValue(offset, offset + 1)),
+            ),
+            If(cdc.source.valid & cdc.source.fs,
+                # Frame end lost: start over in the same page.
+                NextValue(offset, 0),
+                NextValue(bad, 0),
+                NextValue(self.dropped.status, self.dropped.status + 1),
+            ),
+            If(cdc.source.valid & cdc.source.fe,
+                If(bad | cdc.source.bad,
+                    NextValue(self.dropped.status, self.dropped.status + 1),
+                ).Else(
+                    NextValue(self.status.fields.page, page),
+                    NextValue(self.frame_size.status, Cat(Constant(0, 2), offset)),
+                    NextValue(self.frames.status, self.frames.status + 1),
+                    self.ev.frame.trigger.eq(1),
+                ),
+                NextState("IDLE"),
+            )
+        )
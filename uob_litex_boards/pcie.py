@@ -0,0 +1,468 @@
+from migen import *
+from migen.genlib.cdc import MultiReg
+from migen.genlib.resetsync import AsyncResetSynchronizer
+
+from litex.gen import *
+
+from litex.soc.interconnect import stream, wishbone
+from litex.soc.interconnect.packet import Arbiter
+from litex.soc.interconnect.csr import CSRStorage, CSRStatus, CSRField
+
+# TLPs ---------------------------------------------------------------------------------------------
+
+# TLP streams carry one dword per beat, first/last around each TLP. Header dwords are numeric (DW0
+# bits 31:29 are fmt), payload dwords little endian, as on the transaction interface of the IP. On
+# the transmit side `msi` is a mask of the MSI vectors to raise once the TLP is handed to the IP, so
+# interrupts travel in order with the writes they signal. `bar` 7 is a TLP that hit no BAR.
+tlp_rx_layout = [("dat", 32), ("bar", 3)]
+tlp_tx_layout = [("dat", 32), ("msi", 8)]
+
+TLP_BAR_NONE = 7
+
+TLP_FMT_3DW      = 0b000
+TLP_FMT_4DW      = 0b001
+TLP_FMT_3DW_DATA = 0b010
+TLP_FMT_4DW_DATA = 0b011
+TLP_TYPE_MEM     = 0b00000
+TLP_TYPE_CPL     = 0b01010
+
+CPL_STATUS_SC = 0b000
+CPL_STATUS_UR = 0b001
+
+def tlp_dw0(fmt, tlp_type, length):
+    return (fmt << 29) | (tlp_type << 24) | length
+
+def _be_byte_count(be):
+    # Bytes from the first to the last enabled byte of a one dword request (4 for none).
+    enabled = [i for i in range(4) if be & (1 << i)]
+    return (enabled[-1] - enabled[0] + 1) if enabled else 4
+
+def _be_offset(be):
+    enabled = [i for i in range(4) if be & (1 << i)]
+    return enabled[0] if enabled else 0
+
+# BAR Bridge ---------------------------------------------------------------------------------------
+
+class PCIeBARBridge(LiteXModule):
+    """Host memory requests on the BARs turned into Wishbone accesses.
+
+    `bars` maps a BAR number to the (origin, size) of the SoC bus window it exposes. Writes of any
+    length are posted on the bus a dword at a time; one dword reads are completed with CplD, longer
+    ones and requests to an unknown BAR with an Unsupported Request completion.
+    """
+    def __init__(self, bars):
+        self.sink   = sink   = stream.Endpoint(tlp_rx_layout)
+        self.source = source = stream.Endpoint(tlp_tx_layout)
+        self.bus    = bus    = wishbone.Interface(data_width=32, address_width=30, addressing="word")
+        self.id     = Signal(16) # Completer ID (bus/device/function).
+
+        # # #
+
+        fmt      = Signal(3)
+        tlp_type = Signal(5)
+        length   = Signal(10)
+        bar      = Signal(3)
+        req_id   = Signal(16)
+        tag      = Signal(8)
+        first_be = Signal(4)
+        last_be  = Signal(4)
+        addr     = Signal(30)
+        count    = Signal(10)
+        data     = Signal(32)
+        status   = Signal(3)
+        bar_hit  = Signal()
+
+        # BAR windows.
+        adr   = Signal(30)
+        cases = {"default": bar_hit.eq(0)}
+        for n, (origin, size) in bars.items():
+            cases[n] = [bar_hit.eq(1), adr.eq((origin >> 2) + ((addr + count) & ((size >> 2) - 1)))]
+        self.comb += Case(bar, cases)
+
+        is_write = Signal()
+        is_read  = Signal()
+        self.comb += [
+            is_write.eq((fmt[1] == 1) & (tlp_type == TLP_TYPE_MEM)),
+            is_read.eq((fmt[1] == 0) & (tlp_type == TLP_TYPE_MEM)),
+        ]
+
+        self.fsm = fsm = FSM(reset_state="DW0")
+        fsm.act("DW0",
+            sink.ready.eq(1),
+            If(sink.valid & sink.first,
+                NextValue(fmt,    sink.dat[29:32]),
+                NextValue(tlp_type, sink.dat[24:29]),
+                NextValue(length, sink.dat[0:10]),
+                NextValue(bar,    sink.bar),
+                NextValue(count,  0),
+                If(~sink.last, NextState("DW1")),
+            )
+        )
+        fsm.act("DW1",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(req_id,   sink.dat[16:32]),
+                NextValue(tag,      sink.dat[8:16]),
+                NextValue(last_be,  sink.dat[4:8]),
+                NextValue(first_be, sink.dat[0:4]),
+                If(sink.last,
+                    NextState("DW0"),
+                ).Elif(fmt[0],
+                    NextState("DW2-64"),
+                ).Else(
+                    NextState("ADDRESS"),
+                )
+            )
+        )
+        fsm.act("DW2-64", # Upper address bits, the BAR windows are below 4GB on the SoC side.
+            sink.ready.eq(1),
+            If(sink.valid,
+                If(sink.last, NextState("DW0")).Else(NextState("ADDRESS"))
+            )
+        )
+        fsm.act("ADDRESS",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(addr, sink.dat[2:32]),
+                If(is_write & ~sink.last & bar_hit,
+                    NextState("WRITE"),
+                ).Elif(is_read & sink.last,
+                    If(bar_hit & (length == 1),
+                        NextValue(status, CPL_STATUS_SC),
+                        NextState("READ"),
+                    ).Else(
+                        NextValue(status, CPL_STATUS_UR),
+                        NextState("COMPLETION"),
+                    )
+                ).Elif(~sink.last,
+                    NextState("DROP"),
+                ).Else(
+                    NextState("DW0"),
+                )
+            )
+        )
+        fsm.act("WRITE",
+            bus.stb.eq(sink.valid),
+            bus.cyc.eq(sink.valid),
+            bus.we.eq(1),
+            bus.adr.eq(adr),
+            bus.dat_w.eq(sink.dat),
+            bus.sel.eq(Mux(count == 0, first_be, Mux(sink.last, last_be, 0b1111))),
+            sink.ready.eq(bus.ack),
+            If(sink.valid & bus.ack,
+                NextValue(count, count + 1),
+                If(sink.last, NextState("DW0")),
+            )
+        )
+        fsm.act("READ",
+            bus.stb.eq(1),
+            bus.cyc.eq(1),
+            bus.adr.eq(adr),
+            bus.sel.eq(first_be),
+            If(bus.ack,
+                NextValue(data, bus.dat_r),
+                NextState("COMPLETION"),
+            )
+        )
+        fsm.act("DROP",
+            sink.ready.eq(1),
+            If(sink.valid & sink.last, NextState("DW0"))
+        )
+
+        # Completion: CplD with the dword read, or Cpl with the UR status.
+        byte_count = Signal(12)
+        lower_addr = Signal(7)
+        self.comb += [
+            Case(first_be, {be: byte_count.eq(_be_byte_count(be)) for be in range(16)}),
+            Case(first_be, {be: lower_addr.eq(Cat(Constant(_be_offset(be), 2), addr[:5])) for be in range(16)}),
+        ]
+        has_data = Signal()
+        dw       = Signal(2)
+        self.comb += has_data.eq(status == CPL_STATUS_SC)
+        header = Array([
+            Mux(has_data, tlp_dw0(TLP_FMT_3DW_DATA, TLP_TYPE_CPL, 1), tlp_dw0(TLP_FMT_3DW, TLP_TYPE_CPL, 0)),
+            Cat(byte_count, Constant(0, 1), status, self.id),
+            Cat(lower_addr, Constant(0, 1), tag, req_id),
+            data,
+        ])
+        fsm.act("COMPLETION",
+            source.valid.eq(1),
+            source.first.eq(dw == 0),
+            source.last.eq(dw == Mux(has_data, 3, 2)),
+            source.dat.eq(header[dw]),
+            If(source.ready,
+                NextValue(dw, dw + 1),
+                If(source.last,
+                    NextValue(dw, 0),
+                    NextState("DW0"),
+                )
+            )
+        )
+
+# Scatter-Gather DMA -------------------------------------------------------------------------------
+
+class PCIeDMAWriter(LiteXModule):
+    """Scatter-gather DMA from SoC memory to host memory, with an MSI per flagged descriptor.
+
+    Descriptors are five little endian words in SoC memory, chained through their last word:
+
+    - 0: host address, bits 31:0.
+    - 1: host address, bits 63:32.
+    - 2: SoC address.
+    - 3: length in bytes in bits 23:0, IRQ (bit 31) and LAST (bit 30) flags.
+    - 4: SoC address of the next descriptor.
+
+    Addresses are dword aligned, lengths are rounded up to whole dwords. Each descriptor is sent as
+    memory writes of up to `max_payload` bytes that never cross a 4KB host page; with IRQ, the last
+    write carries MSI vector 0 on `source.msi` (an empty descriptor raises none), and LAST ends the
+    chain. `start` walks the chain from `desc`.
+    """
+    def __init__(self, max_payload=128):
+        self.bus    = bus    = wishbone.Interface(data_width=32, address_width=30, addressing="word")
+        self.source = source = stream.Endpoint(tlp_tx_layout)
+        self.id     = Signal(16) # Requester ID.
+
+        self.desc    = CSRStorage(32, description="SoC address of the first descriptor.")
+        self.control = CSRStorage(fields=[
+            CSRField("start", size=1, pulse=True, description="Walk the descriptor chain from ``desc``."),
+        ])
+        self.status = CSRStatus(fields=[
+            CSRField("busy", size=1, description="Descriptors are being processed."),
+        ])
+        self.completed = CSRStatus(32, description="Descriptors completed since reset.")
+
+        # # #
+
+        max_words = max_payload//4
+        ptr       = Signal(30)
+        fields    = Array(Signal(32) for _ in range(5))
+        index     = Signal(3)
+        host      = Signal(64)
+        local     = Signal(30)
+        remaining = Signal(24)
+        clamped   = Signal(24)
+        chunk     = Signal(24)
+        to_page   = Signal(13)
+        words     = Signal(max=max_words + 1)
+        count     = Signal(max=max_words + 1)
+        flags     = Signal(2)
+        desc_len  = Signal(24)
+
+        self.fifo = fifo = stream.SyncFIFO([("dat", 32)], max_words)
+
+        self.comb += [
+            desc_len.eq(fields[3][:24] + 3),
+            to_page.eq(4096 - host[:12]),
+            clamped.eq(Mux(remaining > max_payload, max_payload, remaining)),
+            chunk.eq(Mux(to_page < clamped, to_page, clamped)),
+        ]
+        # Header of the memory write, 64-bit addressing only above 4GB.
+        is_64 = Signal()
+        dw    = Signal(3)
+        be    = Signal(8)
+        self.comb += [
+            is_64.eq(host[32:] != 0),
+            be.eq(Mux(words == 1, 0x0f, 0xff)),
+        ]
+        header = Array([
+            Mux(is_64, tlp_dw0(TLP_FMT_4DW_DATA, TLP_TYPE_MEM, 0), tlp_dw0(TLP_FMT_3DW_DATA, TLP_TYPE_MEM, 0)) | words,
+            Cat(be, Constant(0, 8), self.id),
+            Mux(is_64, host[32:], host[:32]),
+            host[:32],
+        ])
+
+        self.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(self.control.fields.start,
+                NextValue(ptr, self.desc.storage[2:]),
+                NextValue(index, 0),
+                NextState("FETCH"),
+            )
+        )
+        fsm.act("FETCH",
+            self.status.fields.busy.eq(1),
+            bus.stb.eq(1),
+            bus.cyc.eq(1),
+            bus.adr.eq(ptr + index),
+            bus.sel.eq(0b1111),
+            If(bus.ack,
+                NextValue(index, index + 1),
+                If(index == 4, NextState("SETUP")),
+            )
+        )
+        self.sync += If(fsm.ongoing("FETCH") & bus.ack, fields[index].eq(bus.dat_r))
+        fsm.act("SETUP",
+            self.status.fields.busy.eq(1),
+            NextValue(host, Cat(fields[0], fields[1])),
+            NextValue(local, fields[2][2:]),
+            NextValue(remaining, Cat(Constant(0, 2), desc_len[2:])),
+            NextValue(flags, fields[3][30:32]),
+            NextState("CHUNK"),
+        )
+        fsm.act("CHUNK",
+            self.status.fields.busy.eq(1),
+            NextValue(words, chunk[2:]),
+            NextValue(count, 0),
+            If(remaining == 0,
+                NextState("DESC-DONE"),
+            ).Else(
+                NextState("LOAD"),
+            )
+        )
+        fsm.act("LOAD",
+            self.status.fields.busy.eq(1),
+            bus.stb.eq(1),
+            bus.cyc.eq(1),
+            bus.adr.eq(local + count),
+            bus.sel.eq(0b1111),
+            fifo.sink.valid.eq(bus.ack),
+            fifo.sink.dat.eq(bus.dat_r),
+            If(bus.ack,
+                NextValue(count, count + 1),
+                If(count == (words - 1),
+                    NextValue(dw, 0),
+                    NextState("HEADER"),
+                )
+            )
+        )
+        fsm.act("HEADER",
+            self.status.fields.busy.eq(1),
+            source.valid.eq(1),
+            source.first.eq(dw == 0),
+            source.dat.eq(header[dw]),
+            If(source.ready,
+                NextValue(dw, dw + 1),
+                If(dw == Mux(is_64, 3, 2), NextState("PAYLOAD")),
+            )
+        )
+        fsm.act("PAYLOAD",
+            self.status.fields.busy.eq(1),
+            source.valid.eq(fifo.source.valid),
+            source.last.eq(fifo.level == 1),
+            source.dat.eq(fifo.source.dat),
+            source.msi.eq(source.last & flags[1] & (remaining == Cat(Constant(0, 2), words))),
+            fifo.source.ready.eq(source.ready),
+            If(source.valid & source.ready & source.last,
+                NextValue(host, host + Cat(Constant(0, 2), words)),
+                NextValue(local, local + words),
+                NextValue(remaining, remaining - Cat(Constant(0, 2), words)),
+                NextState("CHUNK"),
+            )
+        )
+        fsm.act("DESC-DONE",
+            self.status.fields.busy.eq(1),
+            NextValue(self.completed.status, self.completed.status + 1),
+            NextValue(ptr, fields[4][2:]),
+            NextValue(index, 0),
+            If(flags[0],
+                NextState("IDLE"),
+            ).Else(
+                NextState("FETCH"),
+            )
+        )
+
+# PCIe Endpoint ------------------------------------------------------------------------------------
+
+class PCIeEndpoint(LiteXModule):
+    """Transaction layer of the endpoint: BAR bridge and `ndma` DMA writers on one TLP link.
+
+    `sink`/`source` are the receive and transmit TLP streams in sys. DMA writer n raises MSI vector
+    n in band on `source`; `msi` pulses with the last beat of those TLPs, for monitoring. Everything
+    in here can be driven from a simulation TLP model without the hard IP.
+    """
+    def __init__(self, bars, ndma=2, max_payload=128):
+        self.sink   = stream.Endpoint(tlp_rx_layout)
+        self.source = stream.Endpoint(tlp_tx_layout)
+        self.id     = Signal(16)
+        self.msi    = Signal(ndma)
+
+        # # #
+
+        self.bridge = PCIeBARBridge(bars)
+        self.comb += [
+            self.sink.connect(self.bridge.sink),
+            self.bridge.id.eq(self.id),
+        ]
+        sources = [self.bridge.source]
+        self.dmas = []
+        for n in range(ndma):
+            dma = PCIeDMAWriter(max_payload=max_payload)
+            setattr(self, f"dma{n}", dma)
+            dma_source = stream.Endpoint(tlp_tx_layout)
+            self.comb += [
+                dma.id.eq(self.id),
+                dma.source.connect(dma_source, omit={"msi"}),
+                dma_source.msi.eq(Mux(dma.source.msi[0], 1 << n, 0)),
+            ]
+            sources.append(dma_source)
+            self.dmas.append(dma)
+        self.arbiter = Arbiter(sources, self.source)
+        self.comb += If(self.source.valid & self.source.ready & self.source.last,
+            self.msi.eq(self.source.msi)
+        )
+
+# CrossLink-NX PCIe PHY ----------------------------------------------------------------------------
+
+class PCIeNXPHY(LiteXModule):
+    """CrossLink-NX hard PCIe block, Gen2 x1, through the Radiant PCIe Endpoint IP.
+
+    The IP is generated as `ip_name` with its TLP transaction interface (32-bit, 125MHz user clock,
+    BAR hit sideband) and MSI request inputs. TLPs cross between its `pcie` clock domain and sys,
+    the MSIs of `sink` are requested as the IP accepts the last beat of their TLP.
+    """
+    def __init__(self, pads, ip_name="pcie_ep", nmsi=2, fifo_depth=64):
+        self.source  = stream.Endpoint(tlp_rx_layout) # Host -> FPGA.
+        self.sink    = stream.Endpoint(tlp_tx_layout) # FPGA -> host.
+        self.id      = Signal(16)
+        self.link_up = Signal()
+
+        self.cd_pcie = ClockDomain()
+
+        # # #
+
+        rx = stream.Endpoint(tlp_rx_layout)
+        tx = stream.Endpoint(tlp_tx_layout)
+        rx_bar = Signal(7)
+        msi    = Signal(nmsi)
+        id     = Signal(16)
+        link   = Signal()
+        self.specials += Instance(ip_name,
+            i_refclkp_i     = pads.refclk_p,
+            i_refclkn_i     = pads.refclk_n,
+            i_rxp_i         = pads.rx_p,
+            i_rxn_i         = pads.rx_n,
+            o_txp_o         = pads.tx_p,
+            o_txn_o         = pads.tx_n,
+            i_perst_n_i     = pads.perst_n,
+            o_clk_usr_o     = self.cd_pcie.clk,
+            o_link_up_o     = link,
+            o_bus_dev_fn_o  = id,
+            o_rx_data_o     = rx.dat,
+            o_rx_valid_o    = rx.valid,
+            o_rx_sop_o      = rx.first,
+            o_rx_eop_o      = rx.last,
+            o_rx_bar_hit_o  = rx_bar,
+            i_rx_ready_i    = rx.ready,
+            i_tx_data_i     = tx.dat,
+            i_tx_valid_i    = tx.valid,
+            i_tx_sop_i      = tx.first,
+            i_tx_eop_i      = tx.last,
+            o_tx_ready_o    = tx.ready,
+            i_msi_req_i     = msi,
+        )
+        self.specials += AsyncResetSynchronizer(self.cd_pcie, ~pads.perst_n)
+        self.comb += Case(rx_bar, {**{1 << n: rx.bar.eq(n) for n in range(7)}, "default": rx.bar.eq(TLP_BAR_NONE)})
+
+        self.rx_cdc = stream.ClockDomainCrossing(tlp_rx_layout, cd_from="pcie", cd_to="sys", depth=fifo_depth)
+        self.tx_cdc = stream.ClockDomainCrossing(tlp_tx_layout, cd_from="sys",  cd_to="pcie", depth=fifo_depth)
+        self.comb += [
+            rx.connect(self.rx_cdc.sink),
+            self.rx_cdc.source.connect(self.source),
+            self.sink.connect(self.tx_cdc.sink),
+            self.tx_cdc.source.connect(tx),
+        ]
+        self.comb += If(tx.valid & tx.ready & tx.last, msi.eq(tx.msi))
+        self.specials += [
+            MultiReg(id,   self.id),
+            MultiReg(link, self.link_up),
+        ]
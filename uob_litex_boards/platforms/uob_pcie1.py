@@ -140,7 +140,7 @@ _connectors = [
 # Platform -----------------------------------------------------------------------------------------
 
 class Platform(LatticeNexusPlatform):
-    default_clk_name   = "clk12"
+    default_clk_name   = "clock"
     default_clk_period = 1e9/12e6
 
     def __init__(self, device="LIFCL", toolchain="radiant", **kwargs):
@@ -0,0 +1,104 @@
+// Stand-in for the NES core in simulation.
+//
+// Same ports and parameters as the real core. Every hdmi_line_ready rising
+// edge produces one 256 pixel line, one pixel every other clock. At the start
+// of each line one 16-bit word is read over the ROM bus and mixed into the
+// colour, so ROM fetch latency shows up in the video timing like on hardware.
+
+module Nes #(
+	parameter clockbuf = "none",
+	parameter FREQ = 74250000,
+	parameter sim = 1,
+	parameter softcpu = 0,
+	parameter ramtype = "wishbone",
+	parameter rambits = 3,
+	parameter random_noise = 1
+) (
+	input clock,
+	input reset,
+	output [1:0] testo,
+	output reg [23:0] hdmi_pixel_out,
+	input hdmi_vsync,
+	output reg hdmi_valid_out,
+	input hdmi_pvalid,
+	output reg hdmi_line_done,
+	input hdmi_line_ready,
+	input rom_wb_ack,
+	input [15:0] rom_wb_d_miso,
+	output [15:0] rom_wb_d_mosi,
+	input rom_wb_err,
+	output reg [20:0] rom_wb_addr,
+	output [1:0] rom_wb_bte,
+	output [2:0] rom_wb_cti,
+	output reg rom_wb_cyc,
+	output [1:0] rom_wb_sel,
+	output reg rom_wb_stb,
+	output rom_wb_we,
+	output [1:0] cpu_oe
+);
+
+assign testo = {hdmi_valid_out, hdmi_line_done};
+assign rom_wb_d_mosi = 16'h0000;
+assign rom_wb_bte = 2'b00;
+assign rom_wb_cti = 3'b000;
+assign rom_wb_sel = 2'b11;
+assign rom_wb_we = 1'b0;
+assign cpu_oe = 2'b00;
+
+reg vsync_d;
+reg ready_d;
+reg [7:0] line;
+reg [7:0] frame;
+reg [8:0] x;
+reg phase;
+reg busy;
+reg [15:0] rom_data;
+
+always @(posedge clock) begin
+	vsync_d <= hdmi_vsync;
+	ready_d <= hdmi_line_ready;
+	hdmi_valid_out <= 1'b0;
+	hdmi_line_done <= 1'b0;
+	if (reset) begin
+		line <= 8'd0;
+		frame <= 8'd0;
+		busy <= 1'b0;
+		rom_wb_cyc <= 1'b0;
+		rom_wb_stb <= 1'b0;
+	end else begin
+		if (hdmi_vsync & ~vsync_d) begin
+			line <= 8'd0;
+			frame <= frame + 8'd1;
+		end
+		if (hdmi_line_ready & ~ready_d & ~busy) begin
+			// fetch the line's ROM word first
+			rom_wb_addr <= {5'd0, frame, line};
+			rom_wb_cyc <= 1'b1;
+			rom_wb_stb <= 1'b1;
+			busy <= 1'b1;
+			x <= 9'd0;
+			phase <= 1'b0;
+		end
+		if (rom_wb_cyc & rom_wb_ack) begin
+			rom_wb_cyc <= 1'b0;
+			rom_wb_stb <= 1'b0;
+			rom_data <= rom_wb_d_miso;
+		end
+		if (busy & ~rom_wb_cyc) begin
+			phase <= ~phase;
+			if (phase) begin
+				if (x == 9'd256) begin
+					busy <= 1'b0;
+					hdmi_line_done <= 1'b1;
+					line <= line + 8'd1;
+				end else begin
+					hdmi_pixel_out <= {x[7:0] ^ rom_data[7:0], line + frame, x[7:0] ^ rom_data[15:8]};
+					hdmi_valid_out <= 1'b1;
+					x <= x + 9'd1;
+				end
+			end
+		end
+	end
+end
+
+endmodule
@@ -0,0 +1,126 @@
+// Video sink for simulation.
+//
+// Stores every frame shown on the PHY side of the video pipeline and writes
+// it out as <PREFIX>_m<mode>_<n>.ppm, then prints one line of statistics per
+// frame and a summary each time the video mode changes. The simulation ends
+// after FRAMES frames.
+
+module video_capture #(
+	parameter HRES = 1280,
+	parameter VRES = 720,
+	parameter FRAMES = 8,
+	parameter CLK_FREQ = 74250000,
+	parameter PREFIX = "frame"
+) (
+	input clk,
+	input valid,
+	input de,
+	input hsync,
+	input vsync,
+	input [7:0] r,
+	input [7:0] g,
+	input [7:0] b,
+	input [7:0] mode,
+	input underflow
+);
+
+reg [23:0] image [0:HRES*VRES-1];
+
+reg vsync_d = 1'b0;
+reg de_d = 1'b0;
+reg started = 1'b0;
+// mode of the frame being captured, sampled the cycle after its vsync:
+// the mode input changes on the vsync of the timing generator, which is
+// the very edge seen here when the pipeline is not registered.
+reg [7:0] frame_mode = 8'd0;
+reg latch_mode = 1'b0;
+integer x = 0;
+integer y = 0;
+integer frame = 0;
+integer cycles = 0;
+integer pixels = 0;
+integer underflows = 0;
+
+// per mode totals
+reg [7:0] run_mode = 8'd0;
+integer run_frames = 0;
+integer run_cycles = 0;
+integer run_pixels = 0;
+integer run_underflows = 0;
+
+integer fd;
+integer i;
+reg [8*64-1:0] name;
+
+task summary;
+	begin
+		if (run_frames > 0)
+			$display("[capture] mode %0d: %0d frames, %0.3f ms/frame, %0.2f Mpixel/s, %0d underflows",
+				run_mode, run_frames,
+				1000.0 * run_cycles / run_frames / CLK_FREQ,
+				1.0 * run_pixels / run_cycles * CLK_FREQ / 1000000.0,
+				run_underflows);
+		run_frames = 0;
+		run_cycles = 0;
+		run_pixels = 0;
+		run_underflows = 0;
+	end
+endtask
+
+always @(posedge clk) begin
+	if (started)
+		cycles = cycles + 1;
+	if (underflow)
+		underflows = underflows + 1;
+	if (valid) begin
+		vsync_d <= vsync;
+		de_d <= de;
+		if (latch_mode) begin
+			frame_mode <= mode;
+			latch_mode <= 1'b0;
+		end
+		if (vsync & ~vsync_d) begin
+			if (started) begin
+				$sformat(name, "%0s_m%0d_%03d.ppm", PREFIX, frame_mode, frame);
+				fd = $fopen(name, "wb");
+				$fwrite(fd, "P6\n%0d %0d\n255\n", HRES, VRES);
+				for (i = 0; i < HRES*VRES; i = i + 1)
+					$fwrite(fd, "%c%c%c", image[i][23:16], image[i][15:8], image[i][7:0]);
+				$fclose(fd);
+				$display("[capture] frame %0d mode %0d: %0d cycles, %0d pixels, %0d underflows -> %0s",
+					frame, frame_mode, cycles, pixels, underflows, name);
+
+				if (frame_mode != run_mode)
+					summary();
+				run_mode = frame_mode;
+				run_frames = run_frames + 1;
+				run_cycles = run_cycles + cycles;
+				run_pixels = run_pixels + pixels;
+				run_underflows = run_underflows + underflows;
+
+				frame = frame + 1;
+				if (frame == FRAMES) begin
+					summary();
+					$finish;
+				end
+			end
+			started <= 1'b1;
+			latch_mode <= 1'b1;
+			cycles = 0;
+			pixels = 0;
+			underflows = 0;
+			x = 0;
+			y = 0;
+		end else if (de) begin
+			if ((x < HRES) && (y < VRES))
+				image[y*HRES + x] <= {r, g, b};
+			x = x + 1;
+			pixels = pixels + 1;
+		end else if (de_d) begin
+			x = 0;
+			y = y + 1;
+		end
+	end
+end
+
+endmodule
@@ -6,3 +6,4 @@ def get_software_path(n):
 
 SoftwareWbsdcard=os.path.join(software_path, "wbsdcard")
 SoftwareNes=os.path.join(software_path, "nes")
+SoftwarePerf=os.path.join(software_path, "perf")
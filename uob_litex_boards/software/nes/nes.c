@@ -1,3 +1,16 @@
+/*
+ * NES ROM loader, run by the BIOS before booting.
+ *
+ * The NES core fetches PRG ROM from the start of the SDRAM and CHR ROM from
+ * 512KB up (uob_litex_boards/dram.py, split_bit 19) and is held in reset
+ * from power-on. The loader parses the iNES/NES 2.0 header of NES_ROM_FILE
+ * and reads PRG and CHR straight into that window: once the file position
+ * is sector aligned, f_read() hands the destination to the disk layer and
+ * whole clusters are moved by multi-block DMA, only the part of the sector
+ * holding the header goes through the FatFs window. The core is released
+ * once the ROM is in place.
+ */
+
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
@@ -11,12 +24,186 @@
 #include <libfatfs/diskio.h>
 
 #include <wbsdcard.h>
+#include <boottime.h>
+
+#ifndef NES_ROM_FILE
+#define NES_ROM_FILE         "rom.nes"
+#endif
+
+#define NES_PRG_BASE         (MAIN_RAM_BASE + 0x00000000)
+#define NES_CHR_BASE         (MAIN_RAM_BASE + 0x00080000)
+#define NES_PRG_MAX          (NES_CHR_BASE - NES_PRG_BASE)
+#define NES_CHR_MAX          0x00080000
+
+#define INES_HEADER_SIZE     16
+#define INES_TRAINER_SIZE    512
+#define INES_FLAG6_TRAINER   0x04
+#define INES_FLAG7_NES2_MASK 0x0C
+#define INES_FLAG7_NES2      0x08
+
+#define SECTOR_SIZE          512
+
+struct nes_rom {
+    uint32_t prg_size;
+    uint32_t chr_size;
+    uint32_t offset;    /* PRG in the file */
+    uint8_t mapper;
+    int nes2;
+};
 
 void bios_external_preboot(void);
 
+static void nes_hold(int hold)
+{
+#ifdef CSR_NES_CONTROL_ADDR
+    nes_control_write(hold); /* reset is bit 0, the only field */
+#endif
+}
+
+/* Free running count of sys clock cycles, from timer0 */
+static void nes_timer_start(void)
+{
+#ifdef CSR_TIMER0_BASE
+    timer0_en_write(0);
+    timer0_reload_write(0);
+    timer0_load_write(0xFFFFFFFF);
+    timer0_en_write(1);
+#endif
+}
+
+static uint32_t nes_timer_elapsed(void)
+{
+#ifdef CSR_TIMER0_BASE
+    timer0_update_value_write(1);
+    return 0xFFFFFFFF - timer0_value_read();
+#else
+    return 0;
+#endif
+}
+
+static int nes_parse_header(const uint8_t *h, struct nes_rom *rom)
+{
+    uint32_t prg_units = h[4];
+    uint32_t chr_units = h[5];
+
+    if (memcmp(h, "NES\x1a", 4) != 0) {
+        printf("nes: %s is not an iNES ROM\n", NES_ROM_FILE);
+        return -1;
+    }
+    rom->nes2 = (h[7] & INES_FLAG7_NES2_MASK) == INES_FLAG7_NES2;
+    if (rom->nes2) {
+        /* Exponent-multiplier sizes (MSB nibble 0xF) are far above the window */
+        if (((h[9] & 0x0F) == 0x0F) || ((h[9] >> 4) == 0x0F)) {
+            printf("nes: ROM size notation not supported\n");
+            return -1;
+        }
+        prg_units |= (h[9] & 0x0F) << 8;
+        chr_units |= (h[9] >> 4) << 8;
+    }
+    rom->prg_size = prg_units * 0x4000;
+    rom->chr_size = chr_units * 0x2000;
+    rom->mapper = (h[7] & 0xF0) | (h[6] >> 4);
+    rom->offset = INES_HEADER_SIZE + ((h[6] & INES_FLAG6_TRAINER) ? INES_TRAINER_SIZE : 0);
+
+    if (rom->prg_size == 0 || rom->prg_size > NES_PRG_MAX || rom->chr_size > NES_CHR_MAX) {
+        printf("nes: PRG %lukB / CHR %lukB does not fit the ROM window\n",
+            (unsigned long)(rom->prg_size >> 10), (unsigned long)(rom->chr_size >> 10));
+        return -1;
+    }
+    return 0;
+}
+
+/*
+ * Reads len bytes at the current file position to dst. The head up to the
+ * next sector boundary is copied from the FatFs window, the rest is read in
+ * place.
+ */
+static int nes_read(FIL *fp, uint8_t *dst, uint32_t len)
+{
+    uint32_t head = (SECTOR_SIZE - (f_tell(fp) % SECTOR_SIZE)) % SECTOR_SIZE;
+    UINT br;
+
+    if (head > len)
+        head = len;
+    if (head && (f_read(fp, dst, head, &br) != FR_OK || br != head))
+        return -1;
+    if ((len - head) && (f_read(fp, dst + head, len - head, &br) != FR_OK || br != len - head))
+        return -1;
+    return 0;
+}
+
+static int nes_load(void)
+{
+    static uint8_t header[INES_HEADER_SIZE] __attribute__((aligned(4)));
+    struct nes_rom rom;
+    FATFS fs;
+    FIL file;
+    UINT br;
+    uint32_t cycles, total, rate;
+    int ret = -1;
+
+    if (f_mount(&fs, "", 1) != FR_OK) {
+        printf("nes: no FAT volume on the SDCard\n");
+        return -1;
+    }
+    boottime_stamp("fat_mount");
+    if (f_open(&file, NES_ROM_FILE, FA_READ) != FR_OK) {
+        printf("nes: %s not found\n", NES_ROM_FILE);
+        goto unmount;
+    }
+
+    nes_timer_start();
+    if (f_read(&file, header, INES_HEADER_SIZE, &br) != FR_OK || br != INES_HEADER_SIZE)
+        goto close;
+    if (nes_parse_header(header, &rom))
+        goto close;
+    boottime_stamp("nes_header");
+    if (f_lseek(&file, rom.offset) != FR_OK)
+        goto close;
+    if (nes_read(&file, (uint8_t *)NES_PRG_BASE, rom.prg_size) ||
+        nes_read(&file, (uint8_t *)NES_CHR_BASE, rom.chr_size)) {
+        printf("nes: read error\n");
+        goto close;
+    }
+    /* The core reads through its own port, behind the L2 cache */
+    flush_cpu_dcache();
+#ifdef CONFIG_L2_SIZE
+    flush_l2_cache();
+#endif
+    cycles = nes_timer_elapsed();
+    boottime_stamp("nes_rom_loaded");
+
+    total = rom.prg_size + rom.chr_size;
+    printf("nes: %s, %s mapper %d, PRG %lukB, CHR %lukB\n", NES_ROM_FILE,
+        rom.nes2 ? "NES 2.0" : "iNES", rom.mapper,
+        (unsigned long)(rom.prg_size >> 10), (unsigned long)(rom.chr_size >> 10));
+    if (cycles) {
+        /* kB/s, kept in 32 bits */
+        rate = (uint32_t)(((uint64_t)total * (CONFIG_CLOCK_FREQUENCY / 1000)) / cycles);
+        printf("nes: loaded in %lu ms, %lu.%02lu MB/s\n",
+            (unsigned long)(cycles / (CONFIG_CLOCK_FREQUENCY / 1000)),
+            (unsigned long)(rate / 1000), (unsigned long)((rate % 1000) / 10));
+    }
+    ret = 0;
+
+close:
+    f_close(&file);
+unmount:
+    f_mount(NULL, "", 0);
+    return ret;
+}
+
 void bios_external_preboot()
 {
-    printf("Ran the nes function\n");
+    /* Everything before this point is BIOS init, SDRAM calibration included */
+    boottime_reset();
+    boottime_stamp("preboot");
     fatfs_set_ops_wbsdcard();
-    wbsdcard_test();
+    nes_hold(1);
+    if (nes_load() == 0) {
+        nes_hold(0);
+        boottime_stamp("nes_release");
+    } else
+        printf("nes: no ROM loaded, the NES core stays in reset\n");
+    boottime_stamp("preboot_done");
 }
@@ -0,0 +1,68 @@
+/*
+ * BIOS command for the health counters of the NES video path
+ * (VideoHealthMonitor in uob_litex_boards/video.py).
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <generated/csr.h>
+#include <generated/soc.h>
+#include <system.h>
+
+#include "bios/command.h"
+
+#ifdef CSR_NES_HEALTH_BASE
+
+/* Counters run on the 74.25MHz pixel clock */
+#define VIDEO_CLK_MHZ_X100	7425
+
+static void print_us(const char *label, uint32_t cycles)
+{
+	uint32_t ns10 = (uint32_t)(((uint64_t)cycles * 100000) / VIDEO_CLK_MHZ_X100);
+
+	printf("%-18s %10lu cycles %7lu.%02lu us\n", label, (unsigned long)cycles,
+		(unsigned long)(ns10 / 1000), (unsigned long)((ns10 % 1000) / 10));
+}
+
+static void videohealth_cmd(int nb_params, char **params)
+{
+	uint32_t frames, lines;
+
+	if (nb_params > 0) {
+		if (strcmp(params[0], "clear") != 0) {
+			printf("videohealth [clear]\n");
+			return;
+		}
+		nes_health_clear_write(1);
+		return;
+	}
+
+	nes_health_snapshot_write(1);
+	//the counters latch a few pixel clocks later
+	busy_wait_us(10);
+
+	frames = nes_health_frames_read();
+	lines = nes_health_lines_read();
+	printf("%-18s %10lu\n", "frames", (unsigned long)frames);
+	printf("%-18s %10lu (%lu torn frames)\n", "underflows",
+		(unsigned long)nes_health_underflows_read(), (unsigned long)nes_health_underflow_frames_read());
+	printf("%-18s %10lu\n", "fb underflows", (unsigned long)nes_health_fb_underflows_read());
+	printf("%-18s %10lu (%lu missed)\n", "lines", (unsigned long)lines,
+		(unsigned long)nes_health_lines_missed_read());
+	if (lines) {
+		print_us("line latency min", nes_health_line_latency_min_read());
+		print_us("line latency max", nes_health_line_latency_max_read());
+	}
+	if (frames > 1) {
+		printf("%-18s %10lu / %lu\n", "lines per frame", (unsigned long)nes_health_frame_lines_min_read(),
+			(unsigned long)nes_health_frame_lines_max_read());
+		print_us("frame period min", nes_health_frame_cycles_min_read());
+		print_us("frame period max", nes_health_frame_cycles_max_read());
+	}
+}
+
+define_command(videohealth, videohealth_cmd, "Show NES video path health counters", MISC_CMDS);
+
+#endif
@@ -0,0 +1,134 @@
+/*
+ * BIOS command for the Wishbone bus monitors (uob_litex_boards/busmon.py).
+ *
+ * All monitors are snapshotted together, so the figures of different masters
+ * cover the same window, and printed one master per line.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <generated/csr.h>
+#include <generated/soc.h>
+#include <system.h>
+
+#include "bios/command.h"
+
+struct busmon {
+	const char *name;
+	unsigned long clear;
+	unsigned long snapshot;
+	unsigned long cycles;
+	unsigned long busy;
+	unsigned long transactions;
+	unsigned long beats;
+	unsigned long stalls;
+	unsigned long latency_min;
+	unsigned long latency_max;
+	unsigned long latency_sum;
+	unsigned long burst_max;
+};
+
+#define BUSMON(label, p) { label, \
+	CSR_##p##_CLEAR_ADDR, CSR_##p##_SNAPSHOT_ADDR, CSR_##p##_CYCLES_ADDR, \
+	CSR_##p##_BUSY_ADDR, CSR_##p##_TRANSACTIONS_ADDR, CSR_##p##_BEATS_ADDR, \
+	CSR_##p##_STALLS_ADDR, CSR_##p##_LATENCY_MIN_ADDR, CSR_##p##_LATENCY_MAX_ADDR, \
+	CSR_##p##_LATENCY_SUM_ADDR, CSR_##p##_BURST_MAX_ADDR }
+
+static const struct busmon busmons[] = {
+#ifdef CSR_BUSMON_CPU_IBUS_BASE
+	BUSMON("cpu.ibus", BUSMON_CPU_IBUS),
+#endif
+#ifdef CSR_BUSMON_CPU_DBUS_BASE
+	BUSMON("cpu.dbus", BUSMON_CPU_DBUS),
+#endif
+#ifdef CSR_BUSMON_SDCARD_BASE
+	BUSMON("sdcard", BUSMON_SDCARD),
+#endif
+#ifdef CSR_BUSMON_NES_BASE
+	BUSMON("nes", BUSMON_NES),
+#endif
+#ifdef CSR_BUSMON_MIPI0_BASE
+	BUSMON("mipi0", BUSMON_MIPI0),
+	BUSMON("mipi1", BUSMON_MIPI1),
+	BUSMON("mipi2", BUSMON_MIPI2),
+#endif
+#ifdef CSR_BUSMON_I2S_QUAD_0_BASE
+	BUSMON("i2s0", BUSMON_I2S_QUAD_0),
+	BUSMON("i2s1", BUSMON_I2S_QUAD_1),
+	BUSMON("i2s2", BUSMON_I2S_QUAD_2),
+#endif
+#ifdef CSR_BUSMON_PCIE_BAR_BASE
+	BUSMON("pcie.bar", BUSMON_PCIE_BAR),
+#endif
+#ifdef CSR_BUSMON_PCIE_DMA0_BASE
+	BUSMON("pcie.dma0", BUSMON_PCIE_DMA0),
+#endif
+#ifdef CSR_BUSMON_PCIE_DMA1_BASE
+	BUSMON("pcie.dma1", BUSMON_PCIE_DMA1),
+#endif
+	{ NULL }
+};
+
+/* a * scale / b with one decimal, kept in 32 bits */
+static void print_ratio(uint32_t a, uint32_t b, uint32_t scale)
+{
+	scale *= 10;
+	while (a > 0xFFFFFFFF / scale) {
+		a >>= 1;
+		b >>= 1;
+	}
+	if (b == 0) {
+		printf("%9s", "-");
+		return;
+	}
+	a = (a * scale + b / 2) / b;
+	printf("%7lu.%lu", (unsigned long)(a / 10), (unsigned long)(a % 10));
+}
+
+static void busmon_cmd(int nb_params, char **params)
+{
+	const struct busmon *m;
+	uint32_t cycles, transactions, latency_min;
+
+	if (busmons[0].name == NULL) {
+		printf("No bus monitors\n");
+		return;
+	}
+
+	if (nb_params > 0) {
+		if (strcmp(params[0], "clear") != 0) {
+			printf("busmon [clear]\n");
+			return;
+		}
+		for (m = busmons; m->name; m++)
+			csr_write_simple(1, m->clear);
+		return;
+	}
+
+	for (m = busmons; m->name; m++)
+		csr_write_simple(1, m->snapshot);
+	//monitors outside the sys domain latch a few of their cycles later
+	busy_wait_us(10);
+
+	printf("%-10s%9s %9s %9s%9s %3s%9s %9s%9s %4s\n", "master", "busy%", "trans", "beats",
+		"burst", "max", "stall%", "lat min", "avg", "max");
+	for (m = busmons; m->name; m++) {
+		cycles = csr_read_simple(m->cycles);
+		transactions = csr_read_simple(m->transactions);
+		latency_min = transactions ? csr_read_simple(m->latency_min) : 0;
+		printf("%-10s", m->name);
+		print_ratio(csr_read_simple(m->busy), cycles, 100);
+		printf(" %9lu %9lu", (unsigned long)transactions,
+			(unsigned long)csr_read_simple(m->beats));
+		print_ratio(csr_read_simple(m->beats), transactions, 1);
+		printf(" %3lu", (unsigned long)csr_read_simple(m->burst_max));
+		print_ratio(csr_read_simple(m->stalls), cycles, 100);
+		printf(" %9lu", (unsigned long)latency_min);
+		print_ratio(csr_read_simple(m->latency_sum), transactions, 1);
+		printf(" %4lu\n", (unsigned long)csr_read_simple(m->latency_max));
+	}
+}
+
+define_command(busmon, busmon_cmd, "Show Wishbone bus monitor counters", MISC_CMDS);
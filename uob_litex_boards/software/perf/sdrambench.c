@@ -0,0 +1,393 @@
+/*
+ * BIOS command measuring the SDRAM with the LiteDRAM BIST generator and
+ * checker, each on its own crossbar port (--with-sdram-bist).
+ *
+ * The generator writes pseudo-random data and the checker reads it back and
+ * compares, so the figures are those of the controller and the PHY, without
+ * the main bus or the L2 cache. Transfers are timed with timer0 from their
+ * start to their done flag, less the cost of reading the timer and polling:
+ * the tick counters of the BIST cores only count the cycles in which they
+ * issue commands, not the time the data takes. Three patterns run over the
+ * test window:
+ *
+ *  - sequential: bursts of the given length covering the window in order,
+ *    each written then read back.
+ *  - random: L2 line sized bursts (L2_LINE_BYTES, from the target) at
+ *    pseudo-random offsets in the window.
+ *  - mixed: the generator writes the next burst while the checker reads the
+ *    previous one, both ports competing in the crossbar.
+ *
+ * Latency is that of single beat transfers at random offsets, to the
+ * resolution of the polling loop.
+ *
+ * The cpu_seq and cpu_random patterns time CPU word accesses with timer0,
+ * through the main bus and the L2 cache, loop overhead included: what the
+ * L2 size changes.
+ *
+ * The window sits between the boot log and the framebuffer pages and is
+ * overwritten.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <generated/csr.h>
+#include <generated/mem.h>
+#include <generated/soc.h>
+#include <system.h>
+
+#include "bios/command.h"
+
+#if defined(CSR_SDRAM_GENERATOR_BASE) && defined(CSR_SDRAM_CHECKER_BASE) && defined(CSR_TIMER0_BASE)
+
+#include <generated/sdram_phy.h>
+
+/* Offsets from the start of the SDRAM */
+#define BENCH_BASE	0x00200000
+#define BENCH_SIZE	0x00200000
+
+#define BENCH_BEAT	(SDRAM_PHY_DFI_DATABITS / 8 * SDRAM_PHY_PHASES)
+#define BENCH_BURST	256	/* beats, power of 2, default of the sequential and mixed patterns */
+#ifdef L2_LINE_BYTES
+/* beats, random pattern: one L2 line, what a miss moves */
+#define BENCH_LINE	(L2_LINE_BYTES > BENCH_BEAT ? L2_LINE_BYTES / BENCH_BEAT : 1)
+#else
+#define BENCH_LINE	1
+#endif
+#define BENCH_LATENCY	256	/* single beat transfers per direction */
+#define BENCH_CPU_SIZE	0x00040000	/* bytes, above the largest L2 */
+
+#define BIST_RANDOM_DATA	1
+
+struct bench {
+	uint64_t wr_bytes;
+	uint64_t wr_ticks;
+	uint64_t rd_bytes;
+	uint64_t rd_ticks;
+	uint64_t ticks;		/* wall time, overlapping transfers counted once */
+	uint32_t errors;
+};
+
+static uint32_t bench_seed;
+static uint32_t bench_overhead;
+
+static uint32_t bench_random(void)
+{
+	bench_seed ^= bench_seed << 13;
+	bench_seed ^= bench_seed >> 17;
+	bench_seed ^= bench_seed << 5;
+	return bench_seed;
+}
+
+/* Sys cycles, timer0 runs free for the whole command */
+static void bench_timer_start(void)
+{
+	timer0_en_write(0);
+	timer0_reload_write(0);
+	timer0_load_write(0xFFFFFFFF);
+	timer0_en_write(1);
+}
+
+static uint32_t bench_now(void)
+{
+	timer0_update_value_write(1);
+	return 0xFFFFFFFF - timer0_value_read();
+}
+
+static uint32_t bench_elapsed(uint32_t t0)
+{
+	uint32_t t = bench_now() - t0;
+
+	return t > bench_overhead ? t - bench_overhead : 0;
+}
+
+/* Cost of a timer read and a done poll, taken off every measure */
+static void bench_calibrate(void)
+{
+	uint32_t i, t0, t;
+
+	bench_overhead = 0xFFFFFFFF;
+	for (i = 0; i < 16; i++) {
+		t0 = bench_now();
+		(void)sdram_generator_done_read();
+		t = bench_now() - t0;
+		if (t < bench_overhead)
+			bench_overhead = t;
+	}
+}
+
+static uint32_t bench_write_start(uint32_t base, uint32_t length)
+{
+	sdram_generator_reset_write(1);
+	sdram_generator_random_write(BIST_RANDOM_DATA);
+	sdram_generator_base_write(base);
+	sdram_generator_end_write(base + length);
+	sdram_generator_length_write(length);
+	sdram_generator_start_write(1);
+	return bench_now();
+}
+
+static uint32_t bench_read_start(uint32_t base, uint32_t length)
+{
+	sdram_checker_reset_write(1);
+	sdram_checker_random_write(BIST_RANDOM_DATA);
+	sdram_checker_base_write(base);
+	sdram_checker_end_write(base + length);
+	sdram_checker_length_write(length);
+	sdram_checker_start_write(1);
+	return bench_now();
+}
+
+static void bench_write_done(struct bench *b, uint32_t length, uint32_t ticks)
+{
+	b->wr_bytes += length;
+	b->wr_ticks += ticks;
+}
+
+static void bench_read_done(struct bench *b, uint32_t length, uint32_t ticks)
+{
+	b->rd_bytes += length;
+	b->rd_ticks += ticks;
+	b->errors += sdram_checker_errors_read();
+}
+
+static uint32_t bench_write(struct bench *b, uint32_t base, uint32_t length)
+{
+	uint32_t t0 = bench_write_start(base, length);
+	uint32_t ticks;
+
+	while (sdram_generator_done_read() == 0);
+	ticks = bench_elapsed(t0);
+	bench_write_done(b, length, ticks);
+	return ticks;
+}
+
+static uint32_t bench_read(struct bench *b, uint32_t base, uint32_t length)
+{
+	uint32_t t0 = bench_read_start(base, length);
+	uint32_t ticks;
+
+	while (sdram_checker_done_read() == 0);
+	ticks = bench_elapsed(t0);
+	bench_read_done(b, length, ticks);
+	return ticks;
+}
+
+/* Write then read back, one burst at a time */
+static void bench_burst(struct bench *b, uint32_t base, uint32_t length)
+{
+	b->ticks += bench_write(b, base, length);
+	b->ticks += bench_read(b, base, length);
+}
+
+static void bench_sequential(struct bench *b, uint32_t length)
+{
+	uint32_t offset;
+
+	for (offset = 0; offset + length <= BENCH_SIZE; offset += length)
+		bench_burst(b, BENCH_BASE + offset, length);
+}
+
+static void bench_random_bursts(struct bench *b, uint32_t length)
+{
+	uint32_t i;
+
+	for (i = 0; i < BENCH_SIZE / length / 16; i++)
+		bench_burst(b, BENCH_BASE + (bench_random() % (BENCH_SIZE / length)) * length, length);
+}
+
+static void bench_mixed(struct bench *b, uint32_t length)
+{
+	struct bench prime;
+	uint32_t offset, tw, tr, wr, rd;
+	int wr_done, rd_done;
+
+	memset(&prime, 0, sizeof(prime));
+	bench_write(&prime, BENCH_BASE, length);
+	for (offset = length; offset + length <= BENCH_SIZE; offset += length) {
+		tw = bench_write_start(BENCH_BASE + offset, length);
+		tr = bench_read_start(BENCH_BASE + offset - length, length);
+		wr = rd = 0;
+		for (wr_done = rd_done = 0; !wr_done || !rd_done;) {
+			if (!wr_done && sdram_generator_done_read()) {
+				wr = bench_elapsed(tw);
+				wr_done = 1;
+			}
+			if (!rd_done && sdram_checker_done_read()) {
+				rd = bench_elapsed(tr);
+				rd_done = 1;
+			}
+		}
+		bench_write_done(b, length, wr);
+		bench_read_done(b, length, rd);
+		/* Wall time from the first start to the last done */
+		b->ticks += wr > rd + (tr - tw) ? wr : rd + (tr - tw);
+	}
+}
+
+static void cpu_flush(void)
+{
+	flush_cpu_dcache();
+#ifdef CONFIG_L2_SIZE
+	flush_l2_cache();
+#endif
+}
+
+static void bench_cpu_sequential(struct bench *b)
+{
+	volatile uint32_t *p = (volatile uint32_t *)(MAIN_RAM_BASE + BENCH_BASE);
+	uint32_t i, t0, ticks;
+
+	cpu_flush();
+	t0 = bench_now();
+	for (i = 0; i < BENCH_CPU_SIZE / 4; i++)
+		p[i] = i ^ 0x5A5A5A5A;
+	/* Written back to the SDRAM */
+	cpu_flush();
+	ticks = bench_elapsed(t0);
+	b->wr_bytes += BENCH_CPU_SIZE;
+	b->wr_ticks += ticks;
+	b->ticks += ticks;
+
+	t0 = bench_now();
+	for (i = 0; i < BENCH_CPU_SIZE / 4; i++)
+		if (p[i] != (i ^ 0x5A5A5A5A))
+			b->errors++;
+	ticks = bench_elapsed(t0);
+	b->rd_bytes += BENCH_CPU_SIZE;
+	b->rd_ticks += ticks;
+	b->ticks += ticks;
+}
+
+static void bench_cpu_random(struct bench *b)
+{
+	volatile uint32_t *p = (volatile uint32_t *)(MAIN_RAM_BASE + BENCH_BASE);
+	uint32_t i, t0, ticks, sum = 0;
+
+	cpu_flush();
+	t0 = bench_now();
+	for (i = 0; i < BENCH_CPU_SIZE / 4 / 16; i++)
+		sum += p[bench_random() % (BENCH_SIZE / 4)];
+	ticks = bench_elapsed(t0);
+	b->rd_bytes += BENCH_CPU_SIZE / 16;
+	b->rd_ticks += ticks;
+	b->ticks += ticks;
+	(void)sum;
+}
+
+/* MB/s with two decimals, from bytes moved in ticks sys cycles */
+static void print_rate(uint64_t bytes, uint64_t ticks)
+{
+	uint32_t rate;
+
+	if (ticks == 0) {
+		printf(" %10s", "-");
+		return;
+	}
+	rate = (uint32_t)((bytes * (CONFIG_CLOCK_FREQUENCY / 10000)) / ticks);
+	printf(" %7lu.%02lu", (unsigned long)(rate / 100), (unsigned long)(rate % 100));
+}
+
+static void print_bench(const char *name, uint32_t beats, struct bench *b)
+{
+	printf("%-10s %5lu", name, (unsigned long)beats);
+	print_rate(b->wr_bytes, b->wr_ticks);
+	print_rate(b->rd_bytes, b->rd_ticks);
+	print_rate(b->wr_bytes + b->rd_bytes, b->ticks);
+	printf(" %8lu\n", (unsigned long)b->errors);
+}
+
+static void print_latency(const char *name, uint32_t min, uint32_t max, uint64_t sum)
+{
+	uint32_t avg10 = (uint32_t)((sum * 10) / BENCH_LATENCY);
+
+	printf("%-10s %5lu %5lu.%lu %5lu cycles, %lu-%lu ns\n", name,
+		(unsigned long)min, (unsigned long)(avg10 / 10), (unsigned long)(avg10 % 10),
+		(unsigned long)max,
+		(unsigned long)((uint64_t)min * 1000000000 / CONFIG_CLOCK_FREQUENCY),
+		(unsigned long)((uint64_t)max * 1000000000 / CONFIG_CLOCK_FREQUENCY));
+}
+
+static void bench_latency(void)
+{
+	struct bench b;
+	uint32_t i, base, ticks;
+	uint32_t wr_min = 0xFFFFFFFF, wr_max = 0, rd_min = 0xFFFFFFFF, rd_max = 0;
+
+	memset(&b, 0, sizeof(b));
+	for (i = 0; i < BENCH_LATENCY; i++) {
+		base = BENCH_BASE + (bench_random() % (BENCH_SIZE / BENCH_BEAT)) * BENCH_BEAT;
+		ticks = bench_write(&b, base, BENCH_BEAT);
+		wr_min = ticks < wr_min ? ticks : wr_min;
+		wr_max = ticks > wr_max ? ticks : wr_max;
+		ticks = bench_read(&b, base, BENCH_BEAT);
+		rd_min = ticks < rd_min ? ticks : rd_min;
+		rd_max = ticks > rd_max ? ticks : rd_max;
+	}
+	printf("%-10s %5s %7s %5s\n", "latency", "min", "avg", "max");
+	print_latency("write", wr_min, wr_max, b.wr_ticks);
+	print_latency("read", rd_min, rd_max, b.rd_ticks);
+	if (b.errors)
+		printf("latency pass: %lu errors\n", (unsigned long)b.errors);
+}
+
+static void sdrambench_cmd(int nb_params, char **params)
+{
+	struct bench b;
+	uint32_t burst = BENCH_BURST;
+	uint32_t peak;
+	char *c;
+
+	if (nb_params > 0) {
+		burst = strtoul(params[0], &c, 0);
+		/* The BIST cores mask addresses with end - base */
+		if (*c != 0 || burst == 0 || (burst & (burst - 1)) != 0 ||
+		    burst * BENCH_BEAT > BENCH_SIZE / 2) {
+			printf("sdrambench [burst beats, power of 2]\n");
+			return;
+		}
+	}
+	bench_seed = 0x2545F491;
+	bench_timer_start();
+	bench_calibrate();
+
+	peak = (uint32_t)(((uint64_t)BENCH_BEAT * CONFIG_CLOCK_FREQUENCY) / 10000);
+	printf("SDRAM 0x%08lx-0x%08lx, %d byte beats, peak %lu.%02lu MB/s\n",
+		(unsigned long)(MAIN_RAM_BASE + BENCH_BASE), (unsigned long)(MAIN_RAM_BASE + BENCH_BASE + BENCH_SIZE),
+		BENCH_BEAT, (unsigned long)(peak / 100), (unsigned long)(peak % 100));
+	printf("%-10s %5s %10s %10s %10s %8s\n", "pattern", "burst", "write MB/s", "read MB/s",
+		"total MB/s", "errors");
+
+	memset(&b, 0, sizeof(b));
+	bench_sequential(&b, burst * BENCH_BEAT);
+	print_bench("sequential", burst, &b);
+
+	memset(&b, 0, sizeof(b));
+	bench_random_bursts(&b, BENCH_LINE * BENCH_BEAT);
+	print_bench("random", BENCH_LINE, &b);
+
+	memset(&b, 0, sizeof(b));
+	bench_mixed(&b, burst * BENCH_BEAT);
+	print_bench("mixed", burst, &b);
+
+	memset(&b, 0, sizeof(b));
+	bench_cpu_sequential(&b);
+	print_bench("cpu_seq", 1, &b);
+
+	memset(&b, 0, sizeof(b));
+	bench_cpu_random(&b);
+	print_bench("cpu_random", 1, &b);
+
+	bench_latency();
+
+	/* The ports write behind the CPU caches */
+	flush_cpu_dcache();
+#ifdef CONFIG_L2_SIZE
+	flush_l2_cache();
+#endif
+}
+
+define_command(sdrambench, sdrambench_cmd, "Measure SDRAM bandwidth and latency with the BIST ports", LITEDRAM_CMDS);
+
+#endif
@@ -0,0 +1,76 @@
+/*
+ * BIOS command printing the boot timeline (boottime.h), with the stages only
+ * the gateware sees merged in, in time order.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <generated/csr.h>
+#include <generated/soc.h>
+#include <system.h>
+
+#include "boottime.h"
+
+#include "bios/command.h"
+
+#if defined(CSR_BOOTTIME_BASE) && defined(BOOTLOG_BASE)
+
+struct boottime_stage {
+	uint64_t cycles;
+	const char *name;
+};
+
+/* Stage time in microseconds */
+static uint32_t boottime_us(uint64_t cycles)
+{
+	return (uint32_t)(cycles / (CONFIG_CLOCK_FREQUENCY / 1000000));
+}
+
+static void boottime_cmd(int nb_params, char **params)
+{
+	struct boottime_stage stages[BOOTLOG_ENTRIES + 1];
+	struct boottime_stage t;
+	uint64_t prev = 0;
+	uint32_t n = 0, i, j, us;
+
+	if (bootlog->magic != BOOTLOG_MAGIC) {
+		printf("No boot log\n");
+		return;
+	}
+	for (i = 0; i < bootlog->count && i < BOOTLOG_ENTRIES; i++) {
+		stages[n].cycles = ((uint64_t)bootlog->entries[i].cycles_hi << 32) | bootlog->entries[i].cycles_lo;
+		stages[n].name = (const char *)bootlog->entries[i].name;
+		n++;
+	}
+#ifdef CSR_BOOTTIME_NES_FRAME_ADDR
+	if (boottime_nes_frame_read()) {
+		stages[n].cycles = boottime_nes_frame_read();
+		stages[n].name = "nes_frame (gateware)";
+		n++;
+	}
+#endif
+	/* Insertion sort, a handful of entries */
+	for (i = 1; i < n; i++) {
+		t = stages[i];
+		for (j = i; j > 0 && stages[j - 1].cycles > t.cycles; j--)
+			stages[j] = stages[j - 1];
+		stages[j] = t;
+	}
+
+	printf("%-24s %14s %12s %12s\n", "stage", "cycles", "time (ms)", "delta (ms)");
+	for (i = 0; i < n; i++) {
+		us = boottime_us(stages[i].cycles);
+		/* 32 bits of cycles cover the first 40s of boot, well past the preboot */
+		printf("%-24s %14lu %8lu.%03lu", stages[i].name, (unsigned long)stages[i].cycles,
+			(unsigned long)(us / 1000), (unsigned long)(us % 1000));
+		us = boottime_us(stages[i].cycles - prev);
+		printf(" %8lu.%03lu\n", (unsigned long)(us / 1000), (unsigned long)(us % 1000));
+		prev = stages[i].cycles;
+	}
+}
+
+define_command(boottime, boottime_cmd, "Show the boot timeline", SYSTEM_CMDS);
+
+#endif
@@ -0,0 +1,84 @@
+#ifndef __BOOTTIME_H
+#define __BOOTTIME_H
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include <stdint.h>
+#include <string.h>
+
+#include <generated/csr.h>
+#include <generated/soc.h>
+
+/*
+ * Boot timeline, kept in a reserved page of the SDRAM so the BIOS command
+ * and the host tool (uob_litex_boards/tools/boottime.py) can read it back.
+ * Each stage stamps the cycle counter of the BootTimestamp core (cycles
+ * since the sys reset). The layout is shared with the host tool.
+ */
+#define BOOTLOG_MAGIC		0x544f4f42	/* "BOOT" */
+#define BOOTLOG_ENTRIES		32
+#define BOOTLOG_NAME_LEN	24
+
+struct bootlog_entry {
+	uint32_t cycles_lo;
+	uint32_t cycles_hi;
+	char name[BOOTLOG_NAME_LEN];
+};
+
+struct bootlog {
+	uint32_t magic;
+	uint32_t count;
+	uint32_t clk_freq;
+	uint32_t reserved;
+	struct bootlog_entry entries[BOOTLOG_ENTRIES];
+};
+
+#if defined(CSR_BOOTTIME_BASE) && defined(BOOTLOG_BASE)
+
+#define bootlog ((volatile struct bootlog *)BOOTLOG_BASE)
+
+static inline uint64_t boottime_cycles(void)
+{
+	boottime_latch_write(1);
+	return boottime_cycles_read();
+}
+
+/* Starts a new log, the previous boot's one is dropped */
+static inline void boottime_reset(void)
+{
+	bootlog->count = 0;
+	bootlog->clk_freq = CONFIG_CLOCK_FREQUENCY;
+	bootlog->magic = BOOTLOG_MAGIC;
+}
+
+static inline void boottime_stamp(const char *name)
+{
+	uint64_t cycles = boottime_cycles();
+	volatile struct bootlog_entry *e;
+	uint32_t i;
+
+	if (bootlog->magic != BOOTLOG_MAGIC || bootlog->count >= BOOTLOG_ENTRIES)
+		return;
+	e = &bootlog->entries[bootlog->count];
+	e->cycles_lo = (uint32_t)cycles;
+	e->cycles_hi = (uint32_t)(cycles >> 32);
+	for (i = 0; i < BOOTLOG_NAME_LEN - 1 && name[i]; i++)
+		e->name[i] = name[i];
+	e->name[i] = 0;
+	bootlog->count++;
+}
+
+#else
+
+static inline void boottime_reset(void) {}
+static inline void boottime_stamp(const char *name) {}
+
+#endif
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif /* __BOOTTIME_H */
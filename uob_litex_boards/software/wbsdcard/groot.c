@@ -10,6 +10,7 @@
 #include <libfatfs/ff.h>
 #include <libfatfs/diskio.h>
 #include "wbsdcard.h"
+#include "sdcache.h"
 
 #include "bios/command.h"
 
@@ -19,3 +20,47 @@ static void sdcard_test(int nb_params, char **params)
 }
 
 define_command(groot_detect, sdcard_test, "Detect groot", LITESDCARD_CMDS);
+
+#if WBSDCARD_CACHE_SECTORS > 0
+static void sdcache_cmd(int nb_params, char **params)
+{
+	struct sdcache_stats stats;
+	uint32_t lookups;
+
+	if (nb_params > 0) {
+		if (strcmp(params[0], "reset") == 0) {
+			sdcache_reset_stats();
+			return;
+		}
+		if (strcmp(params[0], "flush") == 0) {
+			if (sdcache_flush())
+				printf("Flush failed\n");
+			return;
+		}
+		printf("sdcache [reset|flush]\n");
+		return;
+	}
+
+	sdcache_get_stats(&stats);
+	lookups = stats.hits + stats.misses;
+	printf("Sectors:    %d (%d KiB), read-ahead %d\n", WBSDCARD_CACHE_SECTORS,
+		WBSDCARD_CACHE_SECTORS / 2, WBSDCARD_CACHE_RA_SECTORS);
+	printf("Hits:       %lu\n", (unsigned long)stats.hits);
+	printf("Misses:     %lu\n", (unsigned long)stats.misses);
+	if (lookups) {
+		uint32_t hits = stats.hits;
+		//stay in 32 bits for the percentage
+		while (lookups > 0x01000000) {
+			hits >>= 8;
+			lookups >>= 8;
+		}
+		printf("Hit rate:   %lu%%\n", (unsigned long)(hits * 100 / lookups));
+	}
+	printf("Read-ahead: %lu\n", (unsigned long)stats.readahead);
+	printf("Bypassed:   %lu\n", (unsigned long)stats.bypass);
+	printf("Evictions:  %lu\n", (unsigned long)stats.evictions);
+	printf("Writebacks: %lu\n", (unsigned long)stats.writebacks);
+}
+
+define_command(sdcache, sdcache_cmd, "Show SD sector cache statistics", LITESDCARD_CMDS);
+#endif
@@ -23,22 +23,52 @@
  * MA 02111-1307 USA
  */
 
-#include <config.h>
-#include <common.h>
-#include <command.h>
-#include <mmc.h>
-#include <part.h>
-#include <malloc.h>
-#include <linux/list.h>
-#include <div64.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+
+#include <system.h>
+
+#include "mmc.h"
+
+//#define DEBUG
+
+#ifdef DEBUG
+#define _DEBUG	1
+#else
+#define _DEBUG	0
+#endif
+
+#define debug(fmt, args...)			\
+	do {					\
+		if (_DEBUG)			\
+			printf(fmt, ##args);	\
+	} while (0)
+
+/* u-boot compatibility */
+typedef uint8_t u8;
+typedef uint64_t u64;
+typedef unsigned long ulong;
+typedef unsigned int uint;
+
+#define udelay(us)	busy_wait_us(us)
+#define roundup(x, y)	((((x) + ((y) - 1)) / (y)) * (y))
+#define __be32_to_cpu(x)	__builtin_bswap32(x)
+#define ALLOC_CACHE_ALIGN_BUFFER(type, name, size) \
+	type name[size] __attribute__((aligned(ARCH_DMA_MINALIGN)))
 
 /* Set block count limit because of 16 bit register limit on some hardware*/
 #ifndef CONFIG_SYS_MMC_MAX_BLK_COUNT
 #define CONFIG_SYS_MMC_MAX_BLK_COUNT 65535
 #endif
 
-static struct list_head mmc_devices;
-static int cur_dev_num = -1;
+/*
+ * The controller DMA master can only reach the main_ram window, so anything
+ * outside of it (stack, sram) goes through a bounce buffer taken from the
+ * host driver's preallocated pool in that window.
+ */
+#define CONFIG_MMC_BOUNCE_BUFFER
 
 int __board_mmc_getcd(struct mmc *mmc) {
 	return -1;
@@ -68,6 +98,11 @@ static int mmc_bounce_need_bounce(struct mmc_data *orig)
 		return 1;
 	}
 
+	if (!mmc_dma_reachable(addr, len)) {
+		debug("MMC: Data buffer %08lx outside the DMA window!\n", addr);
+		return 1;
+	}
+
 	return 0;
 }
 
@@ -87,7 +122,7 @@ static int mmc_bounce_buffer_start(struct mmc_data *backup,
 
 	origlen = orig->blocksize * orig->blocks;
 	len = roundup(origlen, ARCH_DMA_MINALIGN);
-	buffer = memalign(ARCH_DMA_MINALIGN, len);
+	buffer = mmc_dma_alloc(len);
 	if (!buffer) {
 		puts("MMC: Error allocating MMC bounce buffer!\n");
 		return 1;
@@ -117,10 +152,10 @@ static void mmc_bounce_buffer_stop(struct mmc_data *backup,
 	if (backup->flags & MMC_DATA_READ) {
 		len = backup->blocksize * backup->blocks;
 		memcpy(backup->dest, orig->dest, len);
-		free(orig->dest);
+		mmc_dma_free(orig->dest);
 		orig->dest = backup->dest;
 	} else {
-		free((void *)orig->src);
+		mmc_dma_free((void *)orig->src);
 		orig->src = backup->src;
 	}
 
@@ -255,24 +290,7 @@ int mmc_set_blocklen(struct mmc *mmc, int len)
 	return mmc_send_cmd(mmc, &cmd, NULL);
 }
 
-struct mmc *find_mmc_device(int dev_num)
-{
-	struct mmc *m;
-	struct list_head *entry;
-
-	list_for_each(entry, &mmc_devices) {
-		m = list_entry(entry, struct mmc, link);
-
-		if (m->block_dev.dev == dev_num)
-			return m;
-	}
-
-	printf("MMC Device %d not found\n", dev_num);
-
-	return NULL;
-}
-
-static ulong mmc_erase_t(struct mmc *mmc, ulong start, lbaint_t blkcnt)
+ulong mmc_erase_t(struct mmc *mmc, ulong start, lbaint_t blkcnt)
 {
 	struct mmc_cmd cmd;
 	ulong end;
@@ -323,51 +341,16 @@ err_out:
 	return err;
 }
 
-static unsigned long
-mmc_berase(int dev_num, unsigned long start, lbaint_t blkcnt)
-{
-	int err = 0;
-	struct mmc *mmc = find_mmc_device(dev_num);
-	lbaint_t blk = 0, blk_r = 0;
-	int timeout = 1000;
-
-	if (!mmc)
-		return -1;
-
-	if ((start % mmc->erase_grp_size) || (blkcnt % mmc->erase_grp_size))
-		printf("\n\nCaution! Your devices Erase group is 0x%x\n"
-			"The erase range would be change to 0x%lx~0x%lx\n\n",
-		       mmc->erase_grp_size, start & ~(mmc->erase_grp_size - 1),
-		       ((start + blkcnt + mmc->erase_grp_size)
-		       & ~(mmc->erase_grp_size - 1)) - 1);
-
-	while (blk < blkcnt) {
-		blk_r = ((blkcnt - blk) > mmc->erase_grp_size) ?
-			mmc->erase_grp_size : (blkcnt - blk);
-		err = mmc_erase_t(mmc, start + blk, blk_r);
-		if (err)
-			break;
-
-		blk += blk_r;
-
-		/* Waiting for the ready status */
-		if (mmc_send_status(mmc, timeout))
-			return 0;
-	}
-
-	return blk;
-}
-
-static ulong
+ulong
 mmc_write_blocks(struct mmc *mmc, ulong start, lbaint_t blkcnt, const void*src)
 {
 	struct mmc_cmd cmd;
 	struct mmc_data data;
 	int timeout = 1000;
 
-	if ((start + blkcnt) > mmc->block_dev.lba) {
+	if ((start + blkcnt) > mmc->lba) {
 		printf("MMC: block number 0x%lx exceeds max(0x%lx)\n",
-			start + blkcnt, mmc->block_dev.lba);
+			start + blkcnt, (ulong)mmc->lba);
 		return 0;
 	}
 
@@ -413,35 +396,17 @@ mmc_write_blocks(struct mmc *mmc, ulong start, lbaint_t blkcnt, const void*src)
 	return blkcnt;
 }
 
-static ulong
-mmc_bwrite(int dev_num, ulong start, lbaint_t blkcnt, const void*src)
-{
-	lbaint_t cur, blocks_todo = blkcnt;
-
-	struct mmc *mmc = find_mmc_device(dev_num);
-	if (!mmc)
-		return 0;
-
-	if (mmc_set_blocklen(mmc, mmc->write_bl_len))
-		return 0;
-
-	do {
-		cur = (blocks_todo > mmc->b_max) ?  mmc->b_max : blocks_todo;
-		if(mmc_write_blocks(mmc, start, cur, src) != cur)
-			return 0;
-		blocks_todo -= cur;
-		start += cur;
-		src += cur * mmc->write_bl_len;
-	} while (blocks_todo > 0);
-
-	return blkcnt;
-}
-
 int mmc_read_blocks(struct mmc *mmc, void *dst, ulong start, lbaint_t blkcnt)
 {
 	struct mmc_cmd cmd;
 	struct mmc_data data;
 
+	if ((start + blkcnt) > mmc->lba) {
+		printf("MMC: block number 0x%lx exceeds max(0x%lx)\n",
+			start + blkcnt, (ulong)mmc->lba);
+		return 0;
+	}
+
 	if (blkcnt > 1)
 		cmd.cmdidx = MMC_CMD_READ_MULTIPLE_BLOCK;
 	else
@@ -475,38 +440,6 @@ int mmc_read_blocks(struct mmc *mmc, void *dst, ulong start, lbaint_t blkcnt)
 	return blkcnt;
 }
 
-static ulong mmc_bread(int dev_num, ulong start, lbaint_t blkcnt, void *dst)
-{
-	lbaint_t cur, blocks_todo = blkcnt;
-
-	if (blkcnt == 0)
-		return 0;
-
-	struct mmc *mmc = find_mmc_device(dev_num);
-	if (!mmc)
-		return 0;
-
-	if ((start + blkcnt) > mmc->block_dev.lba) {
-		printf("MMC: block number 0x%lx exceeds max(0x%lx)\n",
-			start + blkcnt, mmc->block_dev.lba);
-		return 0;
-	}
-
-	if (mmc_set_blocklen(mmc, mmc->read_bl_len))
-		return 0;
-
-	do {
-		cur = (blocks_todo > mmc->b_max) ?  mmc->b_max : blocks_todo;
-		if(mmc_read_blocks(mmc, dst, start, cur) != cur)
-			return 0;
-		blocks_todo -= cur;
-		start += cur;
-		dst += cur * mmc->read_bl_len;
-	} while (blocks_todo > 0);
-
-	return blkcnt;
-}
-
 int mmc_go_idle(struct mmc* mmc)
 {
 	struct mmc_cmd cmd;
@@ -748,18 +681,6 @@ int mmc_change_freq(struct mmc *mmc)
 	return 0;
 }
 
-int mmc_switch_part(int dev_num, unsigned int part_num)
-{
-	struct mmc *mmc = find_mmc_device(dev_num);
-
-	if (!mmc)
-		return -1;
-
-	return mmc_switch(mmc, EXT_CSD_CMD_SET_NORMAL, EXT_CSD_PART_CONF,
-			  (mmc->part_config & ~PART_ACCESS_MASK)
-			  | (part_num & PART_ACCESS_MASK));
-}
-
 int mmc_getcd(struct mmc *mmc)
 {
 	int cd;
@@ -1221,21 +1142,8 @@ int mmc_startup(struct mmc *mmc)
 
 	mmc_set_clock(mmc, mmc->tran_speed);
 
-	/* fill in device description */
-	mmc->block_dev.lun = 0;
-	mmc->block_dev.type = 0;
-	mmc->block_dev.blksz = mmc->read_bl_len;
-	mmc->block_dev.lba = lldiv(mmc->capacity, mmc->read_bl_len);
-	sprintf(mmc->block_dev.vendor, "Man %06x Snr %08x", mmc->cid[0] >> 8,
-			(mmc->cid[2] << 8) | (mmc->cid[3] >> 24));
-	sprintf(mmc->block_dev.product, "%c%c%c%c%c", mmc->cid[0] & 0xff,
-			(mmc->cid[1] >> 24), (mmc->cid[1] >> 16) & 0xff,
-			(mmc->cid[1] >> 8) & 0xff, mmc->cid[1] & 0xff);
-	sprintf(mmc->block_dev.revision, "%d.%d", mmc->cid[2] >> 28,
-			(mmc->cid[2] >> 24) & 0xf);
-#if !defined(CONFIG_SPL_BUILD) || defined(CONFIG_SPL_LIBDISK_SUPPORT)
-	init_part(&mmc->block_dev);
-#endif
+	/* read_bl_len is a power of two, avoid a 64 bit division */
+	mmc->lba = mmc->capacity >> __builtin_ctz(mmc->read_bl_len);
 
 	return 0;
 }
@@ -1265,34 +1173,13 @@ int mmc_send_if_cond(struct mmc *mmc)
 
 int mmc_register(struct mmc *mmc)
 {
-	/* Setup the universal parts of the block interface just once */
-	mmc->block_dev.if_type = IF_TYPE_MMC;
-	mmc->block_dev.dev = cur_dev_num++;
-	mmc->block_dev.removable = 1;
-	mmc->block_dev.block_read = mmc_bread;
-	mmc->block_dev.block_write = mmc_bwrite;
-	mmc->block_dev.block_erase = mmc_berase;
 	if (!mmc->b_max)
 		mmc->b_max = CONFIG_SYS_MMC_MAX_BLK_COUNT;
-
-	INIT_LIST_HEAD (&mmc->link);
-
-	list_add_tail (&mmc->link, &mmc_devices);
+	mmc->has_init = 0;
 
 	return 0;
 }
 
-#ifdef CONFIG_PARTITIONS
-block_dev_desc_t *mmc_get_dev(int dev)
-{
-	struct mmc *mmc = find_mmc_device(dev);
-	if (!mmc || mmc_init(mmc))
-		return NULL;
-
-	return &mmc->block_dev;
-}
-#endif
-
 int mmc_init(struct mmc *mmc)
 {
 	int err;
@@ -1346,51 +1233,3 @@ int mmc_init(struct mmc *mmc)
 		mmc->has_init = 1;
 	return err;
 }
-
-/*
- * CPU and board-specific MMC initializations.  Aliased function
- * signals caller to move on
- */
-static int __def_mmc_init(bd_t *bis)
-{
-	return -1;
-}
-
-int cpu_mmc_init(bd_t *bis) __attribute__((weak, alias("__def_mmc_init")));
-int board_mmc_init(bd_t *bis) __attribute__((weak, alias("__def_mmc_init")));
-
-void print_mmc_devices(char separator)
-{
-	struct mmc *m;
-	struct list_head *entry;
-
-	list_for_each(entry, &mmc_devices) {
-		m = list_entry(entry, struct mmc, link);
-
-		printf("%s: %d", m->name, m->block_dev.dev);
-
-		if (entry->next != &mmc_devices)
-			printf("%c ", separator);
-	}
-
-	printf("\n");
-}
-
-int get_mmc_num(void)
-{
-	return cur_dev_num;
-}
-
-int mmc_initialize(bd_t *bis)
-{
-	INIT_LIST_HEAD (&mmc_devices);
-	cur_dev_num = 0;
-
-	if (board_mmc_init(bis) < 0)
-		cpu_mmc_init(bis);
-
-	print_mmc_devices(',');
-
-	return 0;
-}
-
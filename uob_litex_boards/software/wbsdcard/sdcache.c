@@ -0,0 +1,376 @@
+/*
+ * LRU sector cache for the wbsdcard FatFs layer.
+ *
+ * Lines are keyed by LBA through a small hash table and kept on a doubly
+ * linked LRU list. Writes are buffered (write-back) until sdcache_flush(),
+ * which FatFs triggers through disk_ioctl(CTRL_SYNC), or until the line is
+ * evicted. Runs of consecutive misses are fetched with one CMD18 into a
+ * staging area, which is extended by read-ahead once the access pattern is
+ * sequential.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <generated/mem.h>
+
+#include "wbsdcard.h"
+#include "sdcache.h"
+
+#if WBSDCARD_CACHE_SECTORS > 0
+
+#ifndef WBSDCARD_CACHE_BASE
+#define WBSDCARD_CACHE_BASE	(MAIN_RAM_BASE + 0x00110000)
+#endif
+
+#define SECTOR_SIZE	512
+#define NIL		0xFFFF
+#define HASH_SIZE	(2 * WBSDCARD_CACHE_SECTORS)
+
+#define LINE_VALID	0x01
+#define LINE_DIRTY	0x02
+
+struct sdcache_line {
+	uint32_t lba;
+	uint16_t prev;
+	uint16_t next;
+	uint16_t hnext;
+	uint8_t flags;
+	uint8_t pad;
+};
+
+struct sdcache {
+	uint16_t head;		/* most recently used */
+	uint16_t tail;		/* least recently used */
+	uint32_t next_lba;	/* end of the previous read request */
+	uint32_t sequential;	/* consecutive sequential read requests */
+	struct sdcache_stats stats;
+	uint16_t hash[HASH_SIZE];
+	struct sdcache_line lines[WBSDCARD_CACHE_SECTORS];
+};
+
+/* Layout of the cache region, data is kept sector aligned */
+#define CACHE_META_SIZE		((sizeof(struct sdcache) + SECTOR_SIZE - 1) & ~(SECTOR_SIZE - 1))
+#define CACHE_STAGING_BASE	(WBSDCARD_CACHE_BASE + CACHE_META_SIZE)
+#define CACHE_DATA_BASE		(CACHE_STAGING_BASE + WBSDCARD_CACHE_RA_SECTORS * SECTOR_SIZE)
+
+static struct sdcache * const cache = (struct sdcache *)WBSDCARD_CACHE_BASE;
+static uint8_t * const staging = (uint8_t *)CACHE_STAGING_BASE;
+
+static inline uint8_t *line_data(uint16_t idx)
+{
+	return (uint8_t *)(CACHE_DATA_BASE + idx * SECTOR_SIZE);
+}
+
+static inline uint32_t hash_lba(uint32_t lba)
+{
+	return (lba ^ (lba >> 11)) % HASH_SIZE;
+}
+
+static void lru_unlink(uint16_t idx)
+{
+	struct sdcache_line *l = &cache->lines[idx];
+
+	if (l->prev != NIL)
+		cache->lines[l->prev].next = l->next;
+	else
+		cache->head = l->next;
+	if (l->next != NIL)
+		cache->lines[l->next].prev = l->prev;
+	else
+		cache->tail = l->prev;
+}
+
+static void lru_push_head(uint16_t idx)
+{
+	struct sdcache_line *l = &cache->lines[idx];
+
+	l->prev = NIL;
+	l->next = cache->head;
+	if (cache->head != NIL)
+		cache->lines[cache->head].prev = idx;
+	cache->head = idx;
+	if (cache->tail == NIL)
+		cache->tail = idx;
+}
+
+static void lru_touch(uint16_t idx)
+{
+	if (cache->head == idx)
+		return;
+	lru_unlink(idx);
+	lru_push_head(idx);
+}
+
+static uint16_t lookup(uint32_t lba)
+{
+	uint16_t idx = cache->hash[hash_lba(lba)];
+
+	while (idx != NIL) {
+		if (cache->lines[idx].lba == lba)
+			return idx;
+		idx = cache->lines[idx].hnext;
+	}
+	return NIL;
+}
+
+static void hash_remove(uint16_t idx)
+{
+	uint16_t *link = &cache->hash[hash_lba(cache->lines[idx].lba)];
+
+	while (*link != NIL) {
+		if (*link == idx) {
+			*link = cache->lines[idx].hnext;
+			return;
+		}
+		link = &cache->lines[*link].hnext;
+	}
+}
+
+static void hash_insert(uint16_t idx)
+{
+	uint32_t h = hash_lba(cache->lines[idx].lba);
+
+	cache->lines[idx].hnext = cache->hash[h];
+	cache->hash[h] = idx;
+}
+
+/* Write a run of dirty lines starting at lba with a single CMD25 */
+static int writeback_run(uint32_t lba)
+{
+	uint32_t n = 0;
+	uint16_t idx;
+
+	while (n < WBSDCARD_CACHE_RA_SECTORS) {
+		idx = lookup(lba + n);
+		if ((idx == NIL) || !(cache->lines[idx].flags & LINE_DIRTY))
+			break;
+		memcpy(staging + n * SECTOR_SIZE, line_data(idx), SECTOR_SIZE);
+		n++;
+	}
+	if (n == 0)
+		return 0;
+	if (wbsdcard_write_blocks(staging, lba, n))
+		return -1;
+	cache->stats.writebacks += n;
+	while (n--)
+		cache->lines[lookup(lba + n)].flags &= ~LINE_DIRTY;
+	return 0;
+}
+
+/* Take the least recently used line, writing it back first if needed */
+static uint16_t evict(void)
+{
+	uint16_t idx = cache->tail;
+	struct sdcache_line *l = &cache->lines[idx];
+
+	//the staging area may be in use, write the line from where it is
+	if (l->flags & LINE_DIRTY) {
+		if (wbsdcard_write_blocks(line_data(idx), l->lba, 1))
+			return NIL;
+		cache->stats.writebacks++;
+	}
+	if (l->flags & LINE_VALID) {
+		hash_remove(idx);
+		cache->stats.evictions++;
+	}
+	l->flags = 0;
+	return idx;
+}
+
+/* Returns the line holding lba, allocating one if it is not cached */
+static uint16_t insert(uint32_t lba)
+{
+	uint16_t idx = lookup(lba);
+
+	if (idx != NIL) {
+		lru_touch(idx);
+		return idx;
+	}
+	idx = evict();
+	if (idx == NIL)
+		return NIL;
+	cache->lines[idx].lba = lba;
+	cache->lines[idx].flags = LINE_VALID;
+	hash_insert(idx);
+	lru_touch(idx);
+	return idx;
+}
+
+void sdcache_init(void)
+{
+	uint32_t i;
+
+	memset(cache, 0, sizeof(struct sdcache));
+	for (i = 0; i < HASH_SIZE; i++)
+		cache->hash[i] = NIL;
+	cache->head = NIL;
+	cache->tail = NIL;
+	for (i = 0; i < WBSDCARD_CACHE_SECTORS; i++) {
+		cache->lines[i].hnext = NIL;
+		lru_push_head(i);
+	}
+}
+
+/* Copy dirty cached sectors over data that was read around the cache */
+static void overlay_dirty(uint8_t *buf, uint32_t lba, uint32_t count)
+{
+	uint32_t i;
+	uint16_t idx;
+
+	for (i = 0; i < count; i++) {
+		idx = lookup(lba + i);
+		if ((idx != NIL) && (cache->lines[idx].flags & LINE_DIRTY))
+			memcpy(buf + i * SECTOR_SIZE, line_data(idx), SECTOR_SIZE);
+	}
+}
+
+/* Fetch a run of missing sectors, plus read-ahead, and copy out the request */
+static int fill(uint8_t *buf, uint32_t lba, uint32_t want, uint32_t ahead)
+{
+	uint32_t total = want + ahead;
+	uint32_t limit = wbsdcard_sector_count();
+	uint32_t i;
+	uint16_t idx;
+
+	if (total > WBSDCARD_CACHE_RA_SECTORS)
+		total = WBSDCARD_CACHE_RA_SECTORS;
+	if (lba + total > limit)
+		total = limit - lba;
+	if (total < want)
+		return -1;
+
+	if (wbsdcard_read_blocks(staging, lba, total))
+		return -1;
+	cache->stats.misses += want;
+	cache->stats.readahead += total - want;
+
+	for (i = 0; i < total; i++) {
+		idx = lookup(lba + i);
+		if (idx != NIL) {
+			//read-ahead over a cached sector keeps the cached copy
+			if (i < want)
+				memcpy(buf + i * SECTOR_SIZE, line_data(idx), SECTOR_SIZE);
+			continue;
+		}
+		idx = insert(lba + i);
+		if (idx == NIL)
+			return -1;
+		memcpy(line_data(idx), staging + i * SECTOR_SIZE, SECTOR_SIZE);
+		if (i < want)
+			memcpy(buf + i * SECTOR_SIZE, line_data(idx), SECTOR_SIZE);
+	}
+	return 0;
+}
+
+int sdcache_read(uint8_t *buf, uint32_t lba, uint32_t count)
+{
+	uint32_t run, ahead;
+	uint16_t idx;
+
+	if (lba == cache->next_lba)
+		cache->sequential++;
+	else
+		cache->sequential = 0;
+	cache->next_lba = lba + count;
+
+	//large requests go straight to the caller's buffer as one CMD18
+	if (count >= WBSDCARD_CACHE_RA_SECTORS) {
+		if (wbsdcard_read_blocks(buf, lba, count))
+			return -1;
+		overlay_dirty(buf, lba, count);
+		cache->stats.bypass += count;
+		return 0;
+	}
+
+	while (count) {
+		idx = lookup(lba);
+		if (idx != NIL) {
+			memcpy(buf, line_data(idx), SECTOR_SIZE);
+			lru_touch(idx);
+			cache->stats.hits++;
+			run = 1;
+		} else {
+			//collect the run of consecutive misses
+			for (run = 1; run < count; run++) {
+				if (lookup(lba + run) != NIL)
+					break;
+			}
+			ahead = 0;
+			if (cache->sequential && (run == count))
+				ahead = WBSDCARD_CACHE_RA_SECTORS - run;
+			if (fill(buf, lba, run, ahead))
+				return -1;
+		}
+		buf += run * SECTOR_SIZE;
+		lba += run;
+		count -= run;
+	}
+	return 0;
+}
+
+int sdcache_write(const uint8_t *buf, uint32_t lba, uint32_t count)
+{
+	uint32_t i;
+	uint16_t idx;
+
+	//large writes go through, cached copies are refreshed
+	if (count >= WBSDCARD_CACHE_RA_SECTORS) {
+		if (wbsdcard_write_blocks(buf, lba, count))
+			return -1;
+		for (i = 0; i < count; i++) {
+			idx = lookup(lba + i);
+			if (idx != NIL) {
+				memcpy(line_data(idx), buf + i * SECTOR_SIZE, SECTOR_SIZE);
+				cache->lines[idx].flags &= ~LINE_DIRTY;
+			}
+		}
+		cache->stats.bypass += count;
+		return 0;
+	}
+
+	for (i = 0; i < count; i++) {
+		idx = insert(lba + i);
+		if (idx == NIL)
+			return -1;
+		memcpy(line_data(idx), buf + i * SECTOR_SIZE, SECTOR_SIZE);
+		cache->lines[idx].flags |= LINE_DIRTY;
+	}
+	return 0;
+}
+
+int sdcache_flush(void)
+{
+	uint32_t i;
+	struct sdcache_line *l;
+
+	for (i = 0; i < WBSDCARD_CACHE_SECTORS; i++) {
+		//runs are capped, so a line may take more than one pass
+		while (cache->lines[i].flags & LINE_DIRTY) {
+			//start the run at its lowest dirty sector
+			l = &cache->lines[i];
+			while (l->lba > 0) {
+				uint16_t prev = lookup(l->lba - 1);
+				if ((prev == NIL) || !(cache->lines[prev].flags & LINE_DIRTY))
+					break;
+				l = &cache->lines[prev];
+			}
+			if (writeback_run(l->lba))
+				return -1;
+		}
+	}
+	return 0;
+}
+
+void sdcache_get_stats(struct sdcache_stats *stats)
+{
+	memcpy(stats, &cache->stats, sizeof(struct sdcache_stats));
+}
+
+void sdcache_reset_stats(void)
+{
+	memset(&cache->stats, 0, sizeof(struct sdcache_stats));
+}
+
+#endif
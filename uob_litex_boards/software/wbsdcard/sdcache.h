@@ -0,0 +1,48 @@
+#ifndef __SDCACHE_H
+#define __SDCACHE_H
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include <stdint.h>
+
+/*
+ * Sector cache between the FatFs disk ops and the MMC layer.
+ *
+ * Everything, including the bookkeeping, lives in SDRAM inside the
+ * controller DMA window, so misses are DMAed without a bounce buffer.
+ * With the defaults the cache takes about 150KB of the 8MB SDRAM, starting
+ * right after the wbsdcard bounce buffer.
+ * Set WBSDCARD_CACHE_SECTORS to 0 to build without the cache.
+ */
+#ifndef WBSDCARD_CACHE_SECTORS
+#define WBSDCARD_CACHE_SECTORS		256
+#endif
+
+/* Sectors fetched by one CMD18 when sequential access is detected */
+#ifndef WBSDCARD_CACHE_RA_SECTORS
+#define WBSDCARD_CACHE_RA_SECTORS	32
+#endif
+
+struct sdcache_stats {
+	uint32_t hits;
+	uint32_t misses;
+	uint32_t readahead;	/* sectors fetched ahead of a request */
+	uint32_t bypass;	/* sectors of large requests moved without the cache */
+	uint32_t evictions;
+	uint32_t writebacks;	/* dirty sectors written to the card */
+};
+
+void sdcache_init(void);
+int sdcache_read(uint8_t *buf, uint32_t lba, uint32_t count);
+int sdcache_write(const uint8_t *buf, uint32_t lba, uint32_t count);
+int sdcache_flush(void);
+void sdcache_get_stats(struct sdcache_stats *stats);
+void sdcache_reset_stats(void);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif /* __SDCACHE_H */
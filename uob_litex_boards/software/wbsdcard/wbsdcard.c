@@ -14,11 +14,13 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <stddef.h>
 
 #include <generated/csr.h>
 #include <generated/mem.h>
 #include <generated/soc.h>
 #include <system.h>
+#include <irq.h>
 
 #include <libfatfs/ff.h>
 #include <libfatfs/diskio.h>
@@ -26,6 +28,8 @@
 
 #include "mmc.h"
 #include "mmc_voltages.h"
+#include "sdcache.h"
+#include "boottime.h"
 
 #ifdef DEBUG
 #define _DEBUG	1
@@ -96,6 +100,31 @@ void fatfs_set_ops_sdcard(void);
 #define OCSDC_DATA_INT_STATUS_CCRCE  0x0008
 #define OCSDC_DATA_INT_STATUS_CFE    0x0010
 
+/*
+ * Window reachable by the controller DMA master, this matches the region
+ * given to its bus master in the gateware.
+ */
+#ifndef WBSDCARD_DMA_BASE
+#define WBSDCARD_DMA_BASE	MAIN_RAM_BASE
+#endif
+#ifndef WBSDCARD_DMA_SIZE
+#define WBSDCARD_DMA_SIZE	0x00800000
+#endif
+
+#ifndef WBSDCARD_DMA_POOL_BASE
+#define WBSDCARD_DMA_POOL_BASE	(WBSDCARD_DMA_BASE + 0x00100000)
+#endif
+
+/* VexRiscv data cache geometry, used to bound ranged cache maintenance */
+#ifndef WBSDCARD_DCACHE_SIZE
+#define WBSDCARD_DCACHE_SIZE	4096
+#endif
+#ifndef WBSDCARD_DCACHE_LINE
+#define WBSDCARD_DCACHE_LINE	32
+#endif
+
+#define WBSDCARD_SECTOR_SIZE	512
+
 struct ocsdc {
 	uint32_t *iobase;
 	int clk_freq;
@@ -104,8 +133,100 @@ struct ocsdc {
 	struct mmc_cmd cmd;
 };
 
+#define to_ocsdc(m) ((struct ocsdc *)((char *)(m) - offsetof(struct ocsdc, mmc)))
+
 static struct ocsdc driver_data;
 
+/* One bit per pool buffer, set while the buffer is handed out */
+static uint32_t dma_pool_used;
+
+int mmc_dma_reachable(unsigned long addr, unsigned long len)
+{
+	return (addr >= WBSDCARD_DMA_BASE) &&
+		((addr + len) <= (WBSDCARD_DMA_BASE + WBSDCARD_DMA_SIZE));
+}
+
+void *wbsdcard_dma_buf_get(void)
+{
+	int i;
+
+	for (i = 0; i < WBSDCARD_DMA_POOL_BUFS; i++) {
+		if (!(dma_pool_used & (1 << i))) {
+			dma_pool_used |= (1 << i);
+			return (void *)(WBSDCARD_DMA_POOL_BASE + i * WBSDCARD_DMA_BUF_SIZE);
+		}
+	}
+	return NULL;
+}
+
+void wbsdcard_dma_buf_put(void *buf)
+{
+	uint32_t i = ((uint32_t)buf - WBSDCARD_DMA_POOL_BASE) / WBSDCARD_DMA_BUF_SIZE;
+
+	if (i < WBSDCARD_DMA_POOL_BUFS)
+		dma_pool_used &= ~(1 << i);
+}
+
+/* Bounce buffers for the MMC layer come from the same pool */
+void *mmc_dma_alloc(size_t len)
+{
+	if (len > WBSDCARD_DMA_BUF_SIZE)
+		return NULL;
+	return wbsdcard_dma_buf_get();
+}
+
+void mmc_dma_free(void *buf)
+{
+	wbsdcard_dma_buf_put(buf);
+}
+
+/*
+ * With WBSDCARD_DMA_DRAM_PORT the controller has its own LiteDRAM port and
+ * no longer goes through the L2 cache in front of the CPU. Dirty L2 lines are
+ * written back before every transfer, so an eviction cannot land on top of
+ * DMA data, and stale ones are dropped again once a read has completed.
+ */
+static inline void ocsdc_l2_sync(void)
+{
+#ifdef WBSDCARD_DMA_DRAM_PORT
+	flush_l2_cache();
+#endif
+}
+
+/*
+ * Make DMA written memory visible to the CPU. The VexRiscv cache management
+ * instruction takes the line address in rs1, cores without single line
+ * support flush the whole cache instead, which is still correct.
+ */
+static void ocsdc_dcache_invalidate(uint32_t addr, uint32_t len)
+{
+#if defined(__vexriscv__)
+	uint32_t line;
+
+	ocsdc_l2_sync();
+	if (len >= WBSDCARD_DCACHE_SIZE) {
+		flush_cpu_dcache();
+		return;
+	}
+	for (line = addr & ~(WBSDCARD_DCACHE_LINE - 1); line < addr + len; line += WBSDCARD_DCACHE_LINE)
+		asm volatile(".insn i 0x0F, 5, x0, %0, 0" : : "r"(line) : "memory");
+#else
+	ocsdc_l2_sync();
+	flush_cpu_dcache();
+#endif
+}
+
+/* Make CPU written memory visible to the DMA master */
+static void ocsdc_dcache_writeback(uint32_t addr, uint32_t len)
+{
+#if defined(__vexriscv__)
+	//the VexRiscv data cache is write-through, memory is already up to date
+#else
+	flush_cpu_dcache();
+#endif
+	ocsdc_l2_sync();
+}
+
 int ocsdc_mmc_init(uint8_t dev_num, int base_addr, int sdclk_freq);
 
 static inline uint32_t ocsdc_read(struct ocsdc *dev, int offset)
@@ -167,25 +288,39 @@ static void ocsdc_set_buswidth(struct ocsdc * dev, uint32_t width) {
 		ocsdc_write(dev, OCSDC_CONTROL, 0);
 }
 
-static void ocsdc_set_timeout(struct ocsdc * dev)
+/* The divider register is 8 bits wide, sd_clk = clk_freq / (2 * (div + 1)) */
+#define OCSDC_CLOCK_DIVIDER_MAX	255
+
+/* Timeouts, in ms of card clock cycles */
+#define OCSDC_CMD_TIMEOUT_MS	2
+#define OCSDC_DATA_TIMEOUT_MS	250	/* covers the SD write busy limit */
+
+static uint32_t ocsdc_sd_clock(struct ocsdc * dev)
 {
-	const float timeout_us = 2000.0;
-	float clk_freq = ((float)dev->clk_freq) / (2 * (dev->clk_div + 1));
-	uint32_t timeout_reg = timeout_us * (clk_freq / 1e6);
-	if (timeout_reg > 0xFFFF)
-		timeout_reg = 0xFFFF;
+	return dev->clk_freq / (2 * (dev->clk_div + 1));
+}
 
-	debug("ocsdc_set_timeout 0x%x\n", timeout_reg);
-	ocsdc_write(dev, OCSDC_CMD_TIMEOUT, 0xFFFF);
-	ocsdc_write(dev, OCSDC_DATA_TIMEOUT, 0xFFFFFF);
+static void ocsdc_set_timeout(struct ocsdc * dev)
+{
+	uint32_t khz = ocsdc_sd_clock(dev) / 1000;
+	uint32_t cmd_timeout = OCSDC_CMD_TIMEOUT_MS * khz;
+	uint32_t data_timeout = OCSDC_DATA_TIMEOUT_MS * khz;
+
+	if (cmd_timeout > 0xFFFF)
+		cmd_timeout = 0xFFFF;
+	if (data_timeout > 0xFFFFFF)
+		data_timeout = 0xFFFFFF;
+
+	debug("ocsdc_set_timeout cmd 0x%x data 0x%x\n", cmd_timeout, data_timeout);
+	ocsdc_write(dev, OCSDC_CMD_TIMEOUT, cmd_timeout);
+	ocsdc_write(dev, OCSDC_DATA_TIMEOUT, data_timeout);
 }
 
-/* Set clock prescalar value based on the required clock in HZ */
-static void ocsdc_set_clock(struct ocsdc * dev, uint32_t clock)
+static void ocsdc_set_divider(struct ocsdc * dev, int div)
 {
-	dev->clk_div = dev->clk_freq / (2.0 * clock) - 1;
+	dev->clk_div = div;
 
-	debug("ocsdc_set_clock %d, div %d\n", clock, dev->clk_div);
+	debug("ocsdc_set_divider %d, %d Hz\n", div, ocsdc_sd_clock(dev));
 	//software reset
 	ocsdc_write(dev, OCSDC_SOFTWARE_RESET, 1);
 	//set clock devider
@@ -196,11 +331,111 @@ static void ocsdc_set_clock(struct ocsdc * dev, uint32_t clock)
 	ocsdc_set_timeout(dev);
 }
 
+/* Smallest divider whose clock does not exceed the requested one */
+static uint32_t ocsdc_clock_divider(struct ocsdc *dev, uint32_t clock)
+{
+	uint32_t div = (dev->clk_freq + 2 * clock - 1) / (2 * clock);
+
+	if (div > 0)
+		div--;
+	if (div > OCSDC_CLOCK_DIVIDER_MAX)
+		div = OCSDC_CLOCK_DIVIDER_MAX;
+	return div;
+}
+
+/* Set clock prescalar value based on the required clock in HZ */
+static void ocsdc_set_clock(struct ocsdc * dev, uint32_t clock)
+{
+	ocsdc_set_divider(dev, ocsdc_clock_divider(dev, clock));
+}
+
+#if defined(CSR_WBSDCARD_EV_PENDING_ADDR) && defined(WBSDCARD_INTERRUPT)
+#define OCSDC_USE_IRQ
+#endif
+
+#ifdef OCSDC_USE_IRQ
+// Event sources, in the order they are declared in the WbSdcard EventManager
+#define WBSDCARD_EV_DATA (1 << 0)
+#define WBSDCARD_EV_CMD  (1 << 1)
+
+/* Status latched by the interrupt handler, consumed by ocsdc_wait_status() */
+static volatile uint32_t ocsdc_cmd_status;
+static volatile uint32_t ocsdc_dat_status;
+
+static void ocsdc_isr(void)
+{
+	struct ocsdc *dev = &driver_data;
+	uint32_t pending = wbsdcard_ev_pending_read();
+	uint32_t status;
+
+	//latch and clear the controller status first, so int_cmd/int_data drop
+	//before the event is acknowledged
+	status = ocsdc_read(dev, OCSDC_CMD_INT_STATUS);
+	if (status) {
+		ocsdc_cmd_status |= status;
+		ocsdc_write(dev, OCSDC_CMD_INT_STATUS, 0);
+	}
+	status = ocsdc_read(dev, OCSDC_DAT_INT_STATUS);
+	if (status) {
+		ocsdc_dat_status |= status;
+		ocsdc_write(dev, OCSDC_DAT_INT_STATUS, 0);
+	}
+	wbsdcard_ev_pending_write(pending);
+}
+
+/*
+ * Default idle hook, called while a command or data transfer is in flight.
+ * Interrupts are masked while it runs, but a pending interrupt still wakes
+ * the core from wfi, so the wakeup can not be lost between the status check
+ * and going to sleep.
+ */
+void __attribute__((weak)) wbsdcard_idle(void)
+{
+#if defined(__riscv)
+	asm volatile("wfi");
+#endif
+}
+
+static uint32_t ocsdc_wait_status(volatile uint32_t *status)
+{
+	uint32_t ret;
+	unsigned int ie = irq_getie();
+
+	irq_setie(0);
+	while ((ret = *status) == 0) {
+		wbsdcard_idle();
+		//let the pending interrupt be serviced
+		irq_setie(1);
+		irq_setie(0);
+	}
+	*status = 0;
+	irq_setie(ie);
+	return ret;
+}
+
+static void ocsdc_irq_init(struct ocsdc *dev)
+{
+	ocsdc_cmd_status = 0;
+	ocsdc_dat_status = 0;
+	irq_attach(WBSDCARD_INTERRUPT, ocsdc_isr);
+	wbsdcard_ev_pending_write(wbsdcard_ev_pending_read());
+	wbsdcard_ev_enable_write(WBSDCARD_EV_DATA | WBSDCARD_EV_CMD);
+	irq_setmask(irq_getmask() | (1 << WBSDCARD_INTERRUPT));
+	//enable every completion and error source in the controller
+	ocsdc_write(dev, OCSDC_CMD_INT_ENABLE, 0x1F);
+	ocsdc_write(dev, OCSDC_DAT_INT_ENABLE, 0x1F);
+}
+#endif
+
 static int ocsdc_finish(struct ocsdc * dev, struct mmc_cmd *cmd) 
 {
 	int retval = 0;
 	while (1) {
+#ifdef OCSDC_USE_IRQ
+		int int_stat = ocsdc_wait_status(&ocsdc_cmd_status);
+#else
 		int int_stat = ocsdc_read(dev, OCSDC_CMD_INT_STATUS);
+#endif
 		//debug("ocsdc_finish: cmd %d, status %x\n", cmd->cmdidx, r2);
 		if (int_stat & OCSDC_CMD_INT_STATUS_EI) {
 			//clear interrupts
@@ -234,8 +469,12 @@ static int ocsdc_finish(struct ocsdc * dev, struct mmc_cmd *cmd)
 static int ocsdc_data_finish(struct ocsdc * dev) {
 	int status;
 
+#ifdef OCSDC_USE_IRQ
+    status = ocsdc_wait_status(&ocsdc_dat_status);
+#else
     while ((status = ocsdc_read(dev, OCSDC_DAT_INT_STATUS)) == 0);
     ocsdc_write(dev, OCSDC_DAT_INT_STATUS, 0);
+#endif
 
     if (status & OCSDC_DATA_INT_STATUS_CC) {
     	debug("ocsdc_data_finish: ok\n");
@@ -249,13 +488,13 @@ static int ocsdc_data_finish(struct ocsdc * dev) {
 
 static void ocsdc_setup_data_xfer(struct ocsdc *dev, struct mmc_cmd *cmd, struct mmc_data *data) {
 
-	//invalidate cache
+	//reads are invalidated once the data has landed, see ocsdc_send_cmd
 	if (data->flags & MMC_DATA_READ) {
-		flush_cpu_dcache();
+		ocsdc_l2_sync();
 		ocsdc_write(dev, OCSDC_DST_SRC_ADDR, (uint32_t)data->dest);
 	}
 	else {
-		flush_cpu_dcache();
+		ocsdc_dcache_writeback((uint32_t)data->src, data->blocksize * data->blocks);
 		ocsdc_write(dev, OCSDC_DST_SRC_ADDR, (uint32_t)data->src);
 	}
 	ocsdc_write(dev, OCSDC_BLOCK_SIZE, data->blocksize-1);
@@ -299,11 +538,21 @@ ocsdc_send_cmd(struct ocsdc *dev, struct mmc *mmc, struct mmc_cmd *cmd, struct m
 
 //	getc();
 
+#ifdef OCSDC_USE_IRQ
+	ocsdc_cmd_status = 0;
+	ocsdc_dat_status = 0;
+#endif
+
 	ocsdc_write(dev, OCSDC_COMMAND, command);
 	ocsdc_write(dev, OCSDC_ARGUMENT, cmd->cmdarg);
 
 	if (ocsdc_finish(dev, cmd) < 0) return -1;
-	if (data && data->blocks) return ocsdc_data_finish(dev);
+	if (data && data->blocks) {
+		int ret = ocsdc_data_finish(dev);
+		if (data->flags & MMC_DATA_READ)
+			ocsdc_dcache_invalidate((uint32_t)data->dest, data->blocksize * data->blocks);
+		return ret;
+	}
 	else return 0;
 }
 
@@ -316,12 +565,28 @@ static int ocsdc_init(struct ocsdc *dev, struct mmc *mmc)
 	//clear all interrupts
 	ocsdc_write(dev, OCSDC_CMD_INT_STATUS, 0);
 	ocsdc_write(dev, OCSDC_DAT_INT_STATUS, 0);
-	//set clock to maximum (devide by 2)
-	ocsdc_set_clock(dev, dev->clk_freq/2);
+#ifdef OCSDC_USE_IRQ
+	//completion is signalled through the wbsdcard event manager
+	ocsdc_irq_init(dev);
+#endif
+	//identification runs at the slowest clock until mmc_startup negotiates
+	ocsdc_set_clock(dev, mmc->f_min);
 
 	return 0;
 }
 
+static int ocsdc_mmc_send_cmd(struct mmc *mmc, struct mmc_cmd *cmd, struct mmc_data *data)
+{
+	return ocsdc_send_cmd(to_ocsdc(mmc), mmc, cmd, data);
+}
+
+static int ocsdc_mmc_init_host(struct mmc *mmc)
+{
+	return ocsdc_init(to_ocsdc(mmc), mmc);
+}
+
+static void ocsdc_mmc_set_ios(struct mmc *mmc);
+
 /* Set buswidth or clock as indicated by the GENERIC_MMC framework */
 static void ocsdc_set_ios(struct ocsdc *dev)
 {
@@ -333,6 +598,11 @@ static void ocsdc_set_ios(struct ocsdc *dev)
 		ocsdc_set_clock(dev, dev->mmc.clock);
 }
 
+static void ocsdc_mmc_set_ios(struct mmc *mmc)
+{
+	ocsdc_set_ios(to_ocsdc(mmc));
+}
+
 /* Called from board_mmc_init during startup. Can be called multiple times
  * depending on the number of slots available on board and controller
  */
@@ -347,21 +617,22 @@ int ocsdc_mmc_init(uint8_t dev_num, int base_addr, int sdclk_freq)
 	priv->clk_div = -1;
 
 	sprintf(priv->mmc.name, "ocsdc");
-	//priv->mmc.send_cmd = ocsdc_send_cmd;
-	//priv->mmc.set_ios = ocsdc_set_ios;
-	//priv->mmc.init = ocsdc_init;
+	priv->mmc.send_cmd = ocsdc_mmc_send_cmd;
+	priv->mmc.set_ios = ocsdc_mmc_set_ios;
+	priv->mmc.init = ocsdc_mmc_init_host;
 	priv->mmc.getcd = NULL;
 
-	priv->mmc.f_min = priv->clk_freq/64; /*maximum clock division by 64 */
+	priv->mmc.f_min = priv->clk_freq/(2 * (OCSDC_CLOCK_DIVIDER_MAX + 1));
 	priv->mmc.f_max = priv->clk_freq/2; /*minimum clock division by 2 */
 	priv->mmc.voltages = ocsdc_get_voltage(priv);
 	priv->mmc.host_caps = MMC_MODE_4BIT;
+	//High Speed only pays off when the controller can clock above 25MHz
+	if (priv->mmc.f_max > 25000000)
+		priv->mmc.host_caps |= MMC_MODE_HS | MMC_MODE_HS_52MHz;
 
 	priv->mmc.b_max = 0xFFFF;
 
-	//mmc_register(mmc);
-
-	return 0;
+	return mmc_register(&priv->mmc);
 }
 
 void wbsdcard_test(void)
@@ -371,14 +642,82 @@ void wbsdcard_test(void)
 
 static DSTATUS sdcardstatus = STA_NOINIT;
 
+/* Sectors read at every candidate divider by ocsdc_autotune() */
+#define OCSDC_TUNE_SECTORS	8
+
+/* A multi-block read that failed leaves the card in the data state */
+static void ocsdc_stop_transmission(struct mmc *mmc)
+{
+	struct mmc_cmd cmd;
+
+	cmd.cmdidx = MMC_CMD_STOP_TRANSMISSION;
+	cmd.cmdarg = 0;
+	cmd.resp_type = MMC_RSP_R1b;
+	mmc_send_cmd(mmc, &cmd, NULL);
+	mmc_send_status(mmc, 100);
+}
+
+/*
+ * Pick the fastest divider, starting at the card's negotiated transfer
+ * speed, that reads a multi-block run CRC-clean and identical to a
+ * reference read done at a quarter of that speed.
+ */
+static int ocsdc_autotune(struct ocsdc *dev)
+{
+	struct mmc *mmc = &dev->mmc;
+	uint8_t *ref = wbsdcard_dma_buf_get();
+	uint8_t *test = wbsdcard_dma_buf_get();
+	uint32_t len = OCSDC_TUNE_SECTORS * WBSDCARD_SECTOR_SIZE;
+	int safe_div = ocsdc_clock_divider(dev, mmc->tran_speed / 4);
+	int div = ocsdc_clock_divider(dev, mmc->tran_speed);
+
+	if (!ref || !test)
+		goto out;
+
+	ocsdc_set_divider(dev, safe_div);
+	if (mmc_read_blocks(mmc, ref, 0, OCSDC_TUNE_SECTORS) != OCSDC_TUNE_SECTORS)
+		goto out;
+
+	for (; div < safe_div; div++) {
+		ocsdc_set_divider(dev, div);
+		memset(test, 0, len);
+		if ((mmc_read_blocks(mmc, test, 0, OCSDC_TUNE_SECTORS) == OCSDC_TUNE_SECTORS) &&
+		    (memcmp(ref, test, len) == 0))
+			break;
+		debug("ocsdc_autotune: divider %d failed\n", div);
+		ocsdc_set_divider(dev, safe_div);
+		ocsdc_stop_transmission(mmc);
+	}
+	ocsdc_set_divider(dev, div);
+
+out:
+	if (ref)
+		wbsdcard_dma_buf_put(ref);
+	if (test)
+		wbsdcard_dma_buf_put(test);
+	printf("wbsdcard: %d-bit bus%s, %lu Hz (divider %d)\n", mmc->bus_width,
+		(mmc->card_caps & MMC_MODE_HS) ? " High Speed" : "",
+		(unsigned long)ocsdc_sd_clock(dev), dev->clk_div);
+	return 0;
+}
+
 static int wbsdcard_init()
 {
-    int ret = 0;
-    if (ocsdc_mmc_init(0, SDCARD_BASE, CONFIG_CLOCK_FREQUENCY) == 0)
-    {
-        ret = 1;
+    struct mmc *mmc = &driver_data.mmc;
+
+    boottime_stamp("sd_init");
+    if (ocsdc_mmc_init(0, SDCARD_BASE, CONFIG_CLOCK_FREQUENCY) != 0)
+        return 0;
+    if (mmc_init(mmc) != 0) {
+        printf("wbsdcard: card init failed\n");
+        return 0;
     }
-    return ret;
+    boottime_stamp("sd_card_ready");
+    if (mmc_set_blocklen(mmc, WBSDCARD_SECTOR_SIZE) != 0)
+        return 0;
+    ocsdc_autotune(&driver_data);
+    boottime_stamp("sd_tuned");
+    return 1;
 }
 
 static DSTATUS sd_disk_status(BYTE drv) {
@@ -388,20 +727,136 @@ static DSTATUS sd_disk_status(BYTE drv) {
 
 static DSTATUS sd_disk_initialize(BYTE drv) {
 	if (drv) return STA_NOINIT;
-	if (sdcardstatus)
+	if (sdcardstatus) {
 		sdcardstatus = wbsdcard_init() ? 0 : STA_NOINIT;
+#if WBSDCARD_CACHE_SECTORS > 0
+		sdcache_init();
+#endif
+	}
 	return sdcardstatus;
 }
 
-static DRESULT sd_disk_read(BYTE drv, BYTE *buf, LBA_t block, uint32_t count) {
-	//sdcard_read(block, count, buf);
-	return RES_OK;
+/*
+ * Largest run of sectors moved by one CMD18/CMD25. Buffers in the DMA window
+ * are transferred in place, anything else is limited to a pool buffer.
+ */
+static uint32_t sd_chunk_sectors(const void *buf, uint32_t count)
+{
+	uint32_t max = driver_data.mmc.b_max;
+
+	if (((uint32_t)buf % ARCH_DMA_MINALIGN) ||
+	    !mmc_dma_reachable((unsigned long)buf, count * WBSDCARD_SECTOR_SIZE))
+		max = WBSDCARD_DMA_BUF_SIZE / WBSDCARD_SECTOR_SIZE;
+	return (count > max) ? max : count;
+}
+
+int wbsdcard_read_blocks(void *buf, uint32_t lba, uint32_t count) {
+	struct mmc *mmc = &driver_data.mmc;
+	uint8_t *dst = buf;
+	uint32_t cur;
+
+	while (count) {
+		cur = sd_chunk_sectors(dst, count);
+		if (mmc_read_blocks(mmc, dst, lba, cur) != cur)
+			return -1;
+		dst += cur * WBSDCARD_SECTOR_SIZE;
+		lba += cur;
+		count -= cur;
+	}
+	return 0;
+}
+
+int wbsdcard_write_blocks(const void *buf, uint32_t lba, uint32_t count) {
+	struct mmc *mmc = &driver_data.mmc;
+	const uint8_t *src = buf;
+	uint32_t cur;
+
+	while (count) {
+		cur = sd_chunk_sectors(src, count);
+		if (mmc_write_blocks(mmc, lba, cur, src) != cur)
+			return -1;
+		src += cur * WBSDCARD_SECTOR_SIZE;
+		lba += cur;
+		count -= cur;
+	}
+	return 0;
+}
+
+uint32_t wbsdcard_sector_count(void) {
+	return driver_data.mmc.lba;
+}
+
+static DRESULT sd_disk_read(BYTE drv, BYTE *buf, LBA_t block, UINT count) {
+	int ret;
+
+	if (drv || !count) return RES_PARERR;
+	if (sdcardstatus & STA_NOINIT) return RES_NOTRDY;
+
+#if WBSDCARD_CACHE_SECTORS > 0
+	ret = sdcache_read(buf, block, count);
+#else
+	ret = wbsdcard_read_blocks(buf, block, count);
+#endif
+	return ret ? RES_ERROR : RES_OK;
+}
+
+static DRESULT sd_disk_write(BYTE drv, const BYTE *buf, LBA_t block, UINT count) {
+	int ret;
+
+	if (drv || !count) return RES_PARERR;
+	if (sdcardstatus & STA_NOINIT) return RES_NOTRDY;
+
+#if WBSDCARD_CACHE_SECTORS > 0
+	ret = sdcache_write(buf, block, count);
+#else
+	ret = wbsdcard_write_blocks(buf, block, count);
+#endif
+	return ret ? RES_ERROR : RES_OK;
+}
+
+static DRESULT sd_disk_ioctl(BYTE drv, BYTE cmd, void *buff) {
+	struct mmc *mmc = &driver_data.mmc;
+
+	if (drv) return RES_PARERR;
+	if (sdcardstatus & STA_NOINIT) return RES_NOTRDY;
+
+	switch (cmd) {
+	case CTRL_SYNC:
+#if WBSDCARD_CACHE_SECTORS > 0
+		if (sdcache_flush())
+			return RES_ERROR;
+#endif
+		return RES_OK;
+	case GET_SECTOR_COUNT:
+		*(LBA_t *)buff = mmc->lba;
+		return RES_OK;
+	case GET_SECTOR_SIZE:
+		*(WORD *)buff = WBSDCARD_SECTOR_SIZE;
+		return RES_OK;
+	case GET_BLOCK_SIZE:
+		*(DWORD *)buff = mmc->erase_grp_size;
+		return RES_OK;
+	case CTRL_TRIM: {
+		LBA_t *range = buff;
+#if WBSDCARD_CACHE_SECTORS > 0
+		if (sdcache_flush())
+			return RES_ERROR;
+#endif
+		if (mmc_erase_t(mmc, range[0], range[1] - range[0] + 1))
+			return RES_ERROR;
+		return RES_OK;
+	}
+	default:
+		return RES_PARERR;
+	}
 }
 
 static DISKOPS SdCardDiskOps = {
 	.disk_initialize = sd_disk_initialize,
 	.disk_status = sd_disk_status,
 	.disk_read = sd_disk_read,
+	.disk_write = sd_disk_write,
+	.disk_ioctl = sd_disk_ioctl,
 };
 
 void fatfs_set_ops_wbsdcard(void) {
@@ -7,7 +7,30 @@ extern "C" {
 
 #include <generated/csr.h>
 
+/*
+ * Preallocated buffers inside the controller DMA window. Data read into or
+ * written from them is transferred in place, without a bounce copy.
+ */
+#ifndef WBSDCARD_DMA_POOL_BUFS
+#define WBSDCARD_DMA_POOL_BUFS	4
+#endif
+#ifndef WBSDCARD_DMA_BUF_SIZE
+#define WBSDCARD_DMA_BUF_SIZE	0x4000
+#endif
+
+void *wbsdcard_dma_buf_get(void);
+void wbsdcard_dma_buf_put(void *buf);
+
+/* Uncached sector access, returns 0 on success */
+int wbsdcard_read_blocks(void *buf, uint32_t lba, uint32_t count);
+int wbsdcard_write_blocks(const void *buf, uint32_t lba, uint32_t count);
+uint32_t wbsdcard_sector_count(void);
+
 void wbsdcard_test(void);
+void fatfs_set_ops_wbsdcard(void);
+
+/* Called while waiting for a command or data transfer to complete. */
+void wbsdcard_idle(void);
 
 #ifdef __cplusplus
 }
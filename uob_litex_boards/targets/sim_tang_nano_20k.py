@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+#
+# Verilator simulation of the Tang Nano 20K SoC video path.
+#
+# Builds the SoC of sipeed_tang_nano_20k.py around a simulated SDRAM: NesInst and its ROM cache,
+# the optional framebuffer and the 1280x720 timing generator, with the NES core replaced by a stub
+# (or the real core with --nes-model=verilog). Frames reaching the HDMI PHY are written to PPM files
+# and each vid_select mode in --modes is shown for --frames-per-mode frames, with frame time, pixel
+# throughput and video underflows reported per frame and per mode.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+
+from migen import *
+
+from litex.gen import *
+
+from litex.build.generic_platform import *
+from litex.build.sim import SimPlatform
+from litex.build.sim.config import SimConfig
+
+from litex.soc.integration.soc_core import *
+from litex.soc.integration.builder import *
+from litex.soc.cores.video import VideoTimingGenerator
+
+from litedram.modules import M12L64322A
+from litedram.phy.model import SDRAMPHYModel, get_sdram_phy_settings
+
+from litex_boards.platforms import sipeed_tang_nano_20k
+
+from uob_litex_boards.dram import WishboneDRAMLineCache
+from uob_litex_boards.video import VideoDoubleFrameBuffer
+from uob_litex_boards.targets.sipeed_tang_nano_20k import NesInst, solve_clock_plan
+
+sim_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sim")
+
+# IOs ----------------------------------------------------------------------------------------------
+
+_io = [
+    ("sys_clk",  0, Pins(1)),
+    ("sys_rst",  0, Pins(1)),
+    ("hdmi_clk", 0, Pins(1)),
+    ("serial", 0,
+        Subsignal("source_valid", Pins(1)),
+        Subsignal("source_ready", Pins(1)),
+        Subsignal("source_data",  Pins(8)),
+        Subsignal("sink_valid",   Pins(1)),
+        Subsignal("sink_ready",   Pins(1)),
+        Subsignal("sink_data",    Pins(8)),
+    ),
+]
+
+class Platform(SimPlatform):
+    def __init__(self):
+        SimPlatform.__init__(self, "SIM", _io)
+
+# CRG ----------------------------------------------------------------------------------------------
+
+class _CRG(LiteXModule):
+    def __init__(self, platform):
+        self.cd_sys  = ClockDomain()
+        self.cd_hdmi = ClockDomain()
+
+        # # #
+
+        rst = platform.request("sys_rst")
+        self.comb += [
+            self.cd_sys.clk.eq(platform.request("sys_clk")),
+            self.cd_sys.rst.eq(rst),
+            self.cd_hdmi.clk.eq(platform.request("hdmi_clk")),
+            self.cd_hdmi.rst.eq(rst),
+        ]
+
+# NES ROM ------------------------------------------------------------------------------------------
+
+def nes_rom_image(filename, chr_offset=0x80000):
+    """SDRAM contents for an iNES/NES 2.0 file: PRG at 0, CHR at chr_offset, as 32-bit words."""
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data[0:4] != b"NES\x1a":
+        raise ValueError(f"{filename} is not an iNES file.")
+    prg_size = data[4]*16*1024
+    chr_size = data[5]*8*1024
+    offset   = 16 + (512 if data[6] & 0x04 else 0) # Skip the trainer.
+    prg      = data[offset:offset + prg_size]
+    chr      = data[offset + prg_size:offset + prg_size + chr_size]
+    if prg_size > chr_offset:
+        raise ValueError(f"{filename}: PRG does not fit below CHR.")
+    image = bytearray(chr_offset + len(chr))
+    image[0:len(prg)]  = prg
+    image[chr_offset:] = chr
+    image += bytes(-len(image) % 4)
+    return [int.from_bytes(image[i:i+4], "little") for i in range(0, len(image), 4)]
+
+# Clocks -------------------------------------------------------------------------------------------
+
+def board_sys_clk_freq():
+    """Default sys frequency of the board, from the clock plan of sipeed_tang_nano_20k.py."""
+    return solve_clock_plan(sipeed_tang_nano_20k.Platform().device)["sys"]
+
+# SimSoC -------------------------------------------------------------------------------------------
+
+class SimSoC(SoCCore):
+    def __init__(self, sys_clk_freq=None,
+        modes            = (0, 1, 2, 3, 4),
+        frames_per_mode  = 2,
+        nes_model        = "stub",
+        sdram_init       = None,
+        with_framebuffer = False,
+        capture_prefix   = "frame",
+        **kwargs):
+        platform = Platform()
+        if sys_clk_freq is None:
+            sys_clk_freq = board_sys_clk_freq()
+
+        # CRG --------------------------------------------------------------------------------------
+        self.crg = _CRG(platform)
+
+        # SoCCore ----------------------------------------------------------------------------------
+        SoCCore.__init__(self, platform, sys_clk_freq, ident="LiteX SoC on Tang Nano 20K (simulation)", **kwargs)
+
+        # SDR SDRAM --------------------------------------------------------------------------------
+        sdram_module = M12L64322A(sys_clk_freq, "1:1")
+        phy_settings = get_sdram_phy_settings(
+            memtype    = sdram_module.memtype,
+            data_width = 32,
+            clk_freq   = sys_clk_freq)
+        self.sdrphy = SDRAMPHYModel(
+            module    = sdram_module,
+            settings  = phy_settings,
+            clk_freq  = sys_clk_freq,
+            init      = [] if sdram_init is None else sdram_init)
+        self.add_sdram("sdram",
+            phy           = self.sdrphy,
+            module        = sdram_module,
+            l2_cache_size = 128,
+        )
+
+        # Video mode sequencer ---------------------------------------------------------------------
+        # Frames are counted from vsync to vsync like the capture does, the picture shown from reset
+        # up to the first vsync is not captured and does not count.
+        self.video_vtg = vtg = ClockDomainsRenamer("hdmi")(VideoTimingGenerator(default_video_timings="1280x720@60Hz"))
+        mode       = Signal(8, reset=modes[0])
+        mode_index = Signal(max=len(modes) + 1)
+        mode_frame = Signal(max=frames_per_mode + 1)
+        vsync_d    = Signal()
+        started    = Signal()
+        self.sync.hdmi += If(vtg.source.valid & vtg.source.ready,
+            vsync_d.eq(vtg.source.vsync),
+            If(vtg.source.vsync & ~vsync_d,
+                started.eq(1),
+                If(started,
+                    If(mode_frame == (frames_per_mode - 1),
+                        mode_frame.eq(0),
+                        mode_index.eq(mode_index + 1),
+                        mode.eq(Array(Constant(m, 8) for m in list(modes) + [modes[-1]])[mode_index + 1]),
+                    ).Else(
+                        mode_frame.eq(mode_frame + 1),
+                    )
+                )
+            )
+        )
+
+        # NES --------------------------------------------------------------------------------------
+        self.framebuffer = None
+        if with_framebuffer:
+            self.framebuffer = VideoDoubleFrameBuffer(
+                read_port      = self.sdram.crossbar.get_port(mode="read",  data_width=32),
+                write_port     = self.sdram.crossbar.get_port(mode="write", data_width=32),
+                default_enable = 1,
+                clock_domain   = "hdmi",
+            )
+        self.nes = NesInst(self, platform, sys_clk_freq,
+            framebuffer = self.framebuffer,
+            nes_sources = nes_model == "verilog",
+            mode        = mode,
+            reset_held  = False, # ROM preloaded in the SDRAM model.
+        )
+        if nes_model == "stub":
+            platform.add_source(os.path.join(sim_path, "nes_stub.v"))
+        nes_rom_port = self.sdram.crossbar.get_port(data_width=32, clock_domain="hdmi")
+        self.nes_rom = ClockDomainsRenamer("hdmi")(WishboneDRAMLineCache(self.nes.wb_rom, nes_rom_port,
+            size      = 0x00800000,
+            split_bit = 19,
+        ))
+        self.comb += vtg.source.connect(self.nes.vin)
+
+        # Frame capture ----------------------------------------------------------------------------
+        underflow = Signal()
+        self.comb += underflow.eq(self.nes.scaler.underflow)
+        if self.framebuffer is not None:
+            self.comb += If(self.framebuffer.underflow, underflow.eq(1))
+        platform.add_source(os.path.join(sim_path, "video_capture.v"))
+        self.comb += self.nes.vout.ready.eq(1)
+        self.specials += Instance("video_capture",
+            p_HRES      = 1280,
+            p_VRES      = 720,
+            p_FRAMES    = len(modes)*frames_per_mode,
+            p_CLK_FREQ  = 74250000,
+            p_PREFIX    = capture_prefix,
+            i_clk       = ClockSignal("hdmi"),
+            i_valid     = self.nes.vout.valid,
+            i_de        = self.nes.vout.de,
+            i_hsync     = self.nes.vout.hsync,
+            i_vsync     = self.nes.vout.vsync,
+            i_r         = self.nes.vout.r,
+            i_g         = self.nes.vout.g,
+            i_b         = self.nes.vout.b,
+            i_mode      = mode,
+            i_underflow = underflow,
+        )
+
+# Build --------------------------------------------------------------------------------------------
+
+def main():
+    from litex.build.parser import LiteXArgumentParser
+    parser = LiteXArgumentParser(platform=Platform, description="Tang Nano 20K SoC video simulation (Verilator).")
+    parser.add_target_argument("--sys-clk-freq",     default=None, type=float, help="System clock frequency (default: the one of the board).")
+    parser.add_target_argument("--nes-model",        default="stub", choices=["stub", "verilog"], help="NES core: Verilog stub or the real core.")
+    parser.add_target_argument("--nes-rom",          default=None,         help="iNES file preloaded in the SDRAM ROM window.")
+    parser.add_target_argument("--modes",            default="0,1,2,3,4",  help="vid_select modes to run, in order.")
+    parser.add_target_argument("--frames-per-mode",  default=2, type=int,  help="Frames captured in each mode.")
+    parser.add_target_argument("--with-framebuffer", action="store_true",  help="Add the SDRAM framebuffer (mode 5).")
+    parser.add_target_argument("--capture-dir",      default="capture",    help="Directory for the captured frames.")
+    args = parser.parse_args()
+
+    soc_kwargs = parser.soc_argdict
+    soc_kwargs["uart_name"] = "sim"
+
+    sys_clk_freq = args.sys_clk_freq if args.sys_clk_freq is not None else board_sys_clk_freq()
+    capture_dir  = os.path.abspath(args.capture_dir)
+    os.makedirs(capture_dir, exist_ok=True)
+
+    sim_config = SimConfig()
+    sim_config.add_clocker("sys_clk",  freq_hz=int(sys_clk_freq))
+    sim_config.add_clocker("hdmi_clk", freq_hz=74250000)
+    sim_config.add_module("serial2console", "serial")
+
+    soc = SimSoC(
+        sys_clk_freq     = sys_clk_freq,
+        modes            = [int(m) for m in args.modes.split(",")],
+        frames_per_mode  = args.frames_per_mode,
+        nes_model        = args.nes_model,
+        sdram_init       = None if args.nes_rom is None else nes_rom_image(args.nes_rom),
+        with_framebuffer = args.with_framebuffer,
+        capture_prefix   = os.path.join(capture_dir, "frame"),
+        **soc_kwargs
+    )
+    builder = Builder(soc, **parser.builder_argdict)
+    builder.build(sim_config=sim_config, **parser.toolchain_argdict)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+#
+# TLP level simulation of the UOB PCIE1 endpoint, without the hard IP.
+#
+# A host model stands in for the root complex: it issues memory write and read TLPs to the BARs,
+# answers nothing but collects every memory write the endpoint posts into a host memory, and records
+# MSI requests. The script loads a descriptor chain and a test pattern into board memory through
+# BAR2, starts a DMA writer and checks the host copy, the chunking at the 4KB boundaries and the
+# MSIs, then reports the link throughput in dwords per cycle.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import argparse
+
+from migen import *
+
+from litex.gen import *
+
+from litex.soc.interconnect import wishbone
+
+from uob_litex_boards.pcie import *
+
+# Host Model ---------------------------------------------------------------------------------------
+
+class PCIeHostModel:
+    """Root complex side of a TLP link: requests on `sink`, posted writes and completions from `source`."""
+    def __init__(self, sink, source, msi, requester_id=0x0000):
+        self.sink         = sink
+        self.source       = source
+        self.msi          = msi
+        self.requester_id = requester_id
+        self.memory       = {} # Host memory, dword address -> data.
+        self.completions  = []
+        self.writes       = [] # (cycle, byte address, dwords) of every memory write received.
+        self.msis         = [] # (cycle, vector).
+        self.cycle        = 0
+        self.tag          = 0
+
+    # Requests -------------------------------------------------------------------------------------
+
+    def _send(self, bar, dwords):
+        for i, dw in enumerate(dwords):
+            yield self.sink.valid.eq(1)
+            yield self.sink.first.eq(i == 0)
+            yield self.sink.last.eq(i == len(dwords) - 1)
+            yield self.sink.dat.eq(dw)
+            yield self.sink.bar.eq(bar)
+            yield
+            while not (yield self.sink.ready):
+                yield
+        yield self.sink.valid.eq(0)
+
+    def write(self, bar, addr, data):
+        """Memory write of the `data` dwords at `addr` within `bar`."""
+        last_be = 0xf if len(data) > 1 else 0x0
+        yield from self._send(bar, [
+            tlp_dw0(TLP_FMT_3DW_DATA, TLP_TYPE_MEM, len(data)),
+            (self.requester_id << 16) | (last_be << 4) | 0xf,
+            addr,
+        ] + list(data))
+
+    def read32(self, bar, addr, be=0xf):
+        """One dword memory read, returns (status, data)."""
+        tag = self.tag = (self.tag + 1) % 256
+        yield from self._send(bar, [
+            tlp_dw0(TLP_FMT_3DW, TLP_TYPE_MEM, 1),
+            (self.requester_id << 16) | (tag << 8) | be,
+            addr,
+        ])
+        while True:
+            for cpl in self.completions:
+                if (cpl[2] >> 8) & 0xff == tag:
+                    self.completions.remove(cpl)
+                    status = (cpl[1] >> 13) & 0x7
+                    return status, (cpl[3] if len(cpl) > 3 else None)
+            yield
+
+    # Monitors -------------------------------------------------------------------------------------
+
+    @passive
+    def monitor(self):
+        tlp = []
+        yield self.source.ready.eq(1)
+        while True:
+            self.cycle += 1
+            if (yield self.source.valid):
+                tlp.append((yield self.source.dat))
+                if (yield self.source.last):
+                    self._receive(tlp)
+                    tlp = []
+            for n in range(len(self.msi)):
+                if (yield self.msi[n]):
+                    self.msis.append((self.cycle, n))
+            yield
+
+    def _receive(self, tlp):
+        fmt, tlp_type, length = tlp[0] >> 29, (tlp[0] >> 24) & 0x1f, tlp[0] & 0x3ff
+        if tlp_type == TLP_TYPE_CPL:
+            self.completions.append(tlp)
+        elif tlp_type == TLP_TYPE_MEM and fmt in [TLP_FMT_3DW_DATA, TLP_FMT_4DW_DATA]:
+            nheader = 4 if fmt == TLP_FMT_4DW_DATA else 3
+            addr    = (tlp[2] << 32 | tlp[3]) if nheader == 4 else tlp[2]
+            data    = tlp[nheader:]
+            assert len(data) == length, f"MWr length {length} with {len(data)} dwords."
+            assert (addr & 0xfff) + 4*length <= 4096, f"MWr at {addr:#x} crosses a 4KB boundary."
+            for i, dw in enumerate(data):
+                self.memory[addr//4 + i] = dw
+            self.writes.append((self.cycle, addr, length))
+        else:
+            raise ValueError(f"Unexpected TLP {[hex(dw) for dw in tlp]}.")
+
+# Design -------------------------------------------------------------------------------------------
+
+class SimPCIe(LiteXModule):
+    def __init__(self, mem_size=0x10000, max_payload=128):
+        self.endpoint = PCIeEndpoint(bars={2: (0, mem_size)}, ndma=2, max_payload=max_payload)
+        self.mem      = wishbone.SRAM(mem_size, bus=wishbone.Interface(data_width=32, address_width=30, addressing="word"))
+        self.arbiter  = wishbone.Arbiter([self.endpoint.bridge.bus] + [dma.bus for dma in self.endpoint.dmas], self.mem.bus)
+        self.comb += self.endpoint.id.eq(0x0100)
+
+# Test ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="TLP level simulation of the UOB PCIE1 endpoint.")
+    parser.add_argument("--max-payload", default=128,    type=int,             help="Max payload size in bytes.")
+    parser.add_argument("--host-addr",   default="0x1ff00f00",                 help="Host buffer address (crosses 4KB pages on purpose).")
+    parser.add_argument("--length",      default=8192,   type=int,             help="Bytes to transfer, over two descriptors.")
+    parser.add_argument("--vcd",         action="store_true",                  help="Write pcie.vcd.")
+    args = parser.parse_args()
+
+    dut  = SimPCIe(max_payload=args.max_payload)
+    ep   = dut.endpoint
+    dma  = ep.dmas[0]
+    host = PCIeHostModel(ep.sink, ep.source, ep.msi)
+
+    host_addr = int(args.host_addr, 0)
+    half      = args.length//2
+    pattern   = [(0x5a000000 + i*0x01010101) & 0xffffffff for i in range(args.length//4)]
+    data_base = 0x1000
+    descs     = [
+        # host lo, host hi, local, length | flags, next.
+        [host_addr & 0xffffffff,          host_addr >> 32,          data_base,        half,                 0x120],
+        [(host_addr + half) & 0xffffffff, (host_addr + half) >> 32, data_base + half, half | (3 << 30),     0x000],
+    ]
+    results = {}
+
+    def generator():
+        # Descriptors at 0x100, pattern at 0x1000, written from the host through BAR2.
+        for n, desc in enumerate(descs):
+            yield from host.write(2, 0x100 + 0x20*n, desc)
+        for i in range(0, len(pattern), 32):
+            yield from host.write(2, data_base + 4*i, pattern[i:i + 32])
+
+        # Read back through completions, and an unsupported request.
+        status, data = yield from host.read32(2, data_base + 4)
+        assert (status, data) == (CPL_STATUS_SC, pattern[1]), (status, data)
+        status, data = yield from host.read32(5, 0)
+        assert status == CPL_STATUS_UR, status
+
+        # Scatter-gather DMA to the host.
+        yield from dma.desc.write(0x100)
+        start = host.cycle
+        yield from dma.control.write(1)
+        yield
+        while (yield dma.status.fields.busy):
+            yield
+        results["cycles"] = host.cycle - start
+        for _ in range(16):
+            yield
+
+    run_simulation(dut, [generator(), host.monitor()], vcd_name="pcie.vcd" if args.vcd else None)
+
+    received = [host.memory.get(host_addr//4 + i) for i in range(len(pattern))]
+    assert received == pattern, "Host copy differs from board memory."
+    assert host.msis and host.msis[0][1] == 0, host.msis
+    assert host.msis[0][0] >= host.writes[-1][0], "MSI ahead of the data it signals."
+    assert all(4*length <= args.max_payload for _, _, length in host.writes)
+    print(f"{args.length} bytes in {len(host.writes)} MWr TLPs, {results['cycles']} cycles "
+          f"({args.length/4/results['cycles']:.2f} dwords/cycle), MSIs: {host.msis}.")
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@
 
 from migen import *
 from migen.fhdl.specials import Tristate
+from migen.genlib.cdc import MultiReg
 from migen.genlib.resetsync import AsyncResetSynchronizer
 
 from litex.gen import *
@@ -21,29 +22,148 @@ from litex.soc.integration.soc_core import *
 from litex.soc.integration.soc import SoCRegion
 from litex.soc.integration.builder import *
 from litex.soc.interconnect import wishbone
-from litex.soc.interconnect.csr import CSRStorage
+from litex.soc.interconnect.csr import CSRStorage, CSRField
 from litex.soc.interconnect.csr_eventmanager import EventManager, EventSourcePulse
-from litex.soc.interconnect.stream import Endpoint, SyncFIFO
+from litex.soc.interconnect.stream import Endpoint
 from litex.soc.cores.gpio import GPIOIn
 from litex.soc.cores.led import LedChaser, WS2812
 from litex.soc.cores.prbs import PRBS31Generator
 from litex.soc.cores.video import VideoGowinHDMIPHY, video_timing_layout, video_data_layout;
 
 from litedram.frontend.wishbone import LiteDRAMWishbone2Native
-from litedram.modules import M12L64322A  # FIXME: use the real model number
+from litedram import modules as litedram_modules
 from litedram.phy import GENSDRPHY
 
 from litex_boards.platforms import sipeed_tang_nano_20k
 
-from uob_litex_boards.software.constants import SoftwareWbsdcard, SoftwareNes
-
-from nes import Nes
-from opencores_sdcard import SdCard
+from uob_litex_boards.software.constants import SoftwareWbsdcard, SoftwareNes, SoftwarePerf
+from uob_litex_boards.dram import WishboneDRAMPort, WishboneDRAMLineCache
+from uob_litex_boards.busmon import WishboneBusMonitor
+from uob_litex_boards.boottime import BootTimestamp
+from uob_litex_boards.telemetry import TelemetrySnapshot
+from uob_litex_boards.video import LineScaler, VideoDoubleFrameBuffer, VideoHealthMonitor
+from uob_litex_boards.buildcache import BuildCache, default_cache_dir
+
+# Peripherals --------------------------------------------------------------------------------------
+
+class Peripheral:
+    """Optional block of the SoC, enabled with --with-<name>.
+
+    `imports` are the external Python packages its gateware comes from, only imported once the block
+    is enabled, `requires` the other blocks it needs and `software` the BIOS packages it brings, as
+    (name, path, cmd_srcs, json) tuples.
+    """
+    def __init__(self, help, imports=(), requires=(), software=()):
+        self.help     = help
+        self.imports  = imports
+        self.requires = requires
+        self.software = software
+
+peripherals = {
+    "nes"            : Peripheral("NES core on the HDMI output (ROM loaded from the SDCard).",
+        imports  = ["nes"],
+        requires = ["wb_sdcard"],
+        software = [("libnes", SoftwareNes, ["videohealth.o"], "whatever.json")]),
+    "wb_sdcard"      : Peripheral("SDCard support with a wishbone slave.",
+        imports  = ["opencores_sdcard"],
+        software = [("libwbsdcard", SoftwareWbsdcard, ["groot.o", "boottime.o"], None)]),
+    "video_terminal" : Peripheral("Video Terminal (HDMI)."),
+    "framebuffer"    : Peripheral("double buffered SDRAM framebuffer (vid_select 5).",
+        requires = ["nes"]),
+    "rgb_led"        : Peripheral("RGB led."),
+    "busmon"         : Peripheral("Wishbone bus monitors on the CPU, SDCard DMA and NES ROM masters.",
+        software = [("libperf", SoftwarePerf, ["busmon.o"], None)]),
+    "sdram_bist"     : Peripheral("LiteDRAM BIST generator/checker on the SDRAM crossbar (sdrambench command).",
+        software = [("libperf", SoftwarePerf, ["sdrambench.o"], None)]),
+}
+
+def add_peripheral_arguments(parser):
+    for name, peripheral in peripherals.items():
+        parser.add_target_argument(f"--with-{name.replace('_', '-')}", action="store_true", help=f"Enable {peripheral.help}")
+
+def resolve_peripherals(args):
+    """Enabled peripherals from the parsed arguments, with their dependencies."""
+    import importlib.util
+    enabled = {name for name in peripherals if getattr(args, f"with_{name}")}
+    pending = list(enabled)
+    while pending:
+        for dep in peripherals[pending.pop()].requires:
+            if dep not in enabled:
+                enabled.add(dep)
+                pending.append(dep)
+    for name in sorted(enabled):
+        for module in peripherals[name].imports:
+            if importlib.util.find_spec(module) is None:
+                raise ValueError(f"--with-{name.replace('_', '-')} needs the {module} Python package.")
+    return enabled
+
+def add_peripheral_software(builder, enabled, cache=None):
+    # Blocks can share a package, each bringing its own commands.
+    packages = {}
+    for name in peripherals:
+        if name not in enabled:
+            continue
+        for lib, path, cmd_srcs, json in peripherals[name].software:
+            package = packages.setdefault(lib, (path, [], []))
+            package[1].extend(cmd_srcs)
+            if json is not None:
+                package[2].append(json)
+    for lib, (path, cmd_srcs, jsons) in packages.items():
+        builder.add_external_software_package(lib, path, cmd_srcs=cmd_srcs)
+        builder.add_software_library(lib)
+        for json in jsons:
+            builder.add_json(os.path.join(path, json))
+        if cache is not None:
+            cache.add_software(path)
+
+# SDRAM --------------------------------------------------------------------------------------------
+
+sdram_module_default = "M12L64322A" # FIXME: use the real model number
+
+def get_sdram_module(name):
+    """LiteDRAM SDR module class from its name, to build timing variants of the board."""
+    module = getattr(litedram_modules, name, None)
+    if not (isinstance(module, type) and issubclass(module, litedram_modules.SDRModule)):
+        raise ValueError(f"{name} is not a LiteDRAM SDR module.")
+    return module
+
+# Clock Plan ---------------------------------------------------------------------------------------
+
+sdram_clk_max = 100e6 # M12L64322A at CAS latency 2, as driven by GENSDRPHY.
+
+def solve_clock_plan(device, sys_clk_freq=None, clkin_freq=27e6, hdmi_freq=74.25e6):
+    """Pick how sys is generated next to the exact HDMI clocks of the first PLL.
+
+    sys comes from hdmi/2 through a GW2ADIV when that is what is asked for, from a second PLL on the
+    27MHz clock otherwise: exactly `sys_clk_freq`, or with None the highest frequency up to
+    `sdram_clk_max`. Returns a dict with the sys frequency, its source and the PLL dividers.
+    """
+    if sys_clk_freq == hdmi_freq/2:
+        return {"sys": sys_clk_freq, "source": "hdmi/2"}
+    vco_min, vco_max = GW2APLL.get_vco_freq_range(device)
+    pfd_min, pfd_max = GW2APLL.get_pfd_freq_range(device)
+    target = sdram_clk_max if sys_clk_freq is None else sys_clk_freq
+    best   = None
+    for idiv in range(1, 64):
+        if not (pfd_min <= clkin_freq/idiv <= pfd_max):
+            continue
+        for fdiv in range(1, 64):
+            freq = clkin_freq*fdiv/idiv
+            if freq > target*(1 + 1e-6):
+                continue
+            if not any(vco_min <= freq*odiv <= vco_max for odiv in [2, 4, 8, 16, 32, 48, 64, 80, 96, 112, 128]):
+                continue
+            if best is None or freq > best["sys"]:
+                best = {"sys": freq, "source": "pll", "idiv": idiv, "fdiv": fdiv}
+    if best is None or (sys_clk_freq is not None and abs(best["sys"] - sys_clk_freq) > sys_clk_freq*1e-6):
+        nearest = "none" if best is None else f"{best['sys']/1e6:.3f}MHz"
+        raise ValueError(f"No exact PLL config for a {sys_clk_freq/1e6:.3f}MHz sys clock (nearest below: {nearest}).")
+    return best
 
 # CRG ----------------------------------------------------------------------------------------------
 
 class _CRG(LiteXModule):
-    def __init__(self, platform, sys_clk_freq, reset=None):
+    def __init__(self, platform, clock_plan, reset=None):
         self.inclock = Signal()
         self.rst      = Signal()
         clki = Signal()
@@ -76,9 +196,11 @@ class _CRG(LiteXModule):
         self.comb += self.cd_hdmi.clk.eq(self.div5.clkout)
         self.comb += self.cd_hdmi.rst.eq(self.rst)
         
-        if sys_clk_freq == 37125000:
+        sys_clk_freq = clock_plan["sys"]
+        if clock_plan["source"] == "hdmi/2":
             self.div2 = GW2ADIV(self.div5.clkout, "2")
             self.comb += self.cd_sys.clk.eq(self.div2.clkout)
+            sys_source = "hdmi/2"
         else:
             self.pll2 = pll2 = GW2APLL(devicename=platform.devicename, device=platform.device)
             if reset is not None:
@@ -86,18 +208,23 @@ class _CRG(LiteXModule):
             else:
                 self.comb += pll2.reset.eq(~por_done)
             pll2.register_clkin(self.inclock, 27e6)
-            pll2.create_clkout(self.cd_sys, sys_clk_freq)
+            pll2.create_clkout(self.cd_sys, sys_clk_freq, margin=1e-6)
+            sys_source = f"27MHz*{clock_plan['fdiv']}/{clock_plan['idiv']}"
+        platform.add_period_constraint(self.cd_sys.clk,  1e9/sys_clk_freq)
+        platform.add_period_constraint(self.cd_hdmi.clk, 1e9/74.25e6)
+        print(f"Clock plan: sys {sys_clk_freq/1e6:.3f}MHz ({sys_source}), hdmi 74.250MHz, hdmi5x 371.250MHz.")
 
 class WbSdcard(LiteXModule):
-    def __init__(self, core, platform, sys_clk_freq):
+    def __init__(self, core, platform, sys_clk_freq, dma="bus"):
         self.submodules.ev = EventManager()
         self.ev.int_data = EventSourcePulse()
         self.ev.int_cmd = EventSourcePulse()
         self.ev.finalize()
+        from opencores_sdcard import SdCard
         sdthing = SdCard(platform)
         pads = platform.request("sdcard")
         wb = wishbone.Interface(data_width=32, address_width=11, addressing="word")
-        wbm = wishbone.Interface(data_width=32, address_width=29, addressing="word")
+        self.wbm = wbm = wishbone.Interface(data_width=32, address_width=29, addressing="word")
         sd_cmd_o = Signal()
         sd_cmd_i = Signal()
         sd_cmd_oe = Signal()
@@ -150,26 +277,49 @@ class WbSdcard(LiteXModule):
             origin = 0x3000_0000,
             size   = 1024,
         ))
-        core.bus.add_master(master=wbm, region=SoCRegion(origin=0x40000000, size=0x00800000))
+        # DMA: either shared with the CPU on the main bus or on its own LiteDRAM port, which skips
+        # the bus arbiter and the L2 cache (the driver then keeps the L2 coherent by hand).
+        dma_region = SoCRegion(origin=0x40000000, size=0x00800000)
+        if dma == "dram" and hasattr(core, "sdram"):
+            port = core.sdram.crossbar.get_port(data_width=32)
+            self.dma = WishboneDRAMPort(wbm, port, size=dma_region.size)
+            core.add_constant("WBSDCARD_DMA_DRAM_PORT")
+        else:
+            core.bus.add_master(master=wbm, region=dma_region)
 
 class NesInst(LiteXModule):
-    def __init__(self, core, platform, sys_clk_freq):
-        nes = Nes(platform)
+    def __init__(self, core, platform, sys_clk_freq, framebuffer=None, nes_sources=True, mode=None, reset_held=True):
+        # Simulation brings its own NES model and may drive the video mode itself.
+        if nes_sources:
+            from nes import Nes
+            nes = Nes(platform)
         self.vin = Endpoint(video_timing_layout)
         self.vout = Endpoint(video_data_layout)
         self.testo = Signal(2)
         nes_clk = ClockSignal("hdmi")
-        nes_box_valid1 = Signal()
-        nes_box_valid2 = Signal()
-        nes_picture_box_valid = Signal()
-        video_fifo_read = Signal()
-        self.comb += [
-            If((self.vin.hcount > 255) & (self.vin.hcount < 1024), nes_box_valid1.eq(1)),
-            If(self.vin.vcount < self.vin.vres, nes_box_valid2.eq(1)),
-            nes_picture_box_valid.eq(nes_box_valid1 & nes_box_valid2),
-            video_fifo_read.eq(self.vout.ready & nes_picture_box_valid),
-        ]
         self.vid_select = CSRStorage(8)
+        vid_select = Signal(8)
+        self.control = CSRStorage(fields=[
+            CSRField("reset", size=1, reset=int(reset_held), description="Hold the NES core in reset (from power-on while the ROM is loaded)."),
+        ])
+        # hdmi side of the reset, also meant to flush the ROM cache.
+        self.rom_reset = Signal(reset=int(reset_held))
+        self.specials += MultiReg(self.control.fields.reset, self.rom_reset, "hdmi", reset=int(reset_held))
+        self.scale = CSRStorage(fields=[
+            CSRField("h", size=4, offset=0, reset=3, description="Horizontal scale factor of the NES picture."),
+            CSRField("v", size=4, offset=8, reset=3, description="Vertical scale factor of the NES picture."),
+        ])
+        # The video path runs in hdmi, sys is on its own clock.
+        h_scale = Signal(4, reset=3)
+        v_scale = Signal(4, reset=3)
+        self.specials += [
+            MultiReg(self.scale.fields.h, h_scale, "hdmi", reset=3),
+            MultiReg(self.scale.fields.v, v_scale, "hdmi", reset=3),
+        ]
+        if mode is None:
+            self.specials += MultiReg(self.vid_select.storage, vid_select, "hdmi")
+        else:
+            self.comb += vid_select.eq(mode)
         
         hdmi_data = Signal(24)
         hdmi_row = Signal(11)
@@ -177,12 +327,27 @@ class NesInst(LiteXModule):
         hdmi_data_valid = Signal()
         hdmi_line_done = Signal()
         hdmi_line_ready = Signal()
+        self.scaler = scaler = ClockDomainsRenamer("hdmi")(LineScaler(width=256, height=240))
         self.comb += [
-                If(self.vin.vcount < 720, hdmi_line_ready.eq(self.vin.hsync)),
+            scaler.pixel.eq(hdmi_data),
+            scaler.pixel_valid.eq(hdmi_data_valid),
+            If((vid_select < 2) | (vid_select == 5),
+                hdmi_line_ready.eq(scaler.line_ready),
+            ).Elif(self.vin.vcount < 720,
+                hdmi_line_ready.eq(self.vin.hsync),
+            ),
+            # Mode 1 shows the picture unscaled.
+            If(vid_select == 1,
+                scaler.h_scale.eq(1),
+                scaler.v_scale.eq(1),
+            ).Else(
+                scaler.h_scale.eq(h_scale),
+                scaler.v_scale.eq(v_scale),
+            ),
         ]
         cpu_oe = Signal(2)
         self.wb_rom = wb_rom = wishbone.Interface(data_width=16, address_width=21, addressing="word")
-        nes_reset = ResetSignal("hdmi")
+        nes_reset = ResetSignal("hdmi") | self.rom_reset
         self.specials += Instance("Nes",
             p_clockbuf = "none",
             p_FREQ = 74250000,
@@ -215,44 +380,16 @@ class NesInst(LiteXModule):
         )
         #core.bus.add_master(master=self.wb_rom, region=SoCRegion(origin=0x40000000, size=0x00800000))
         #TODO
-        rgb_layout = [
-                ("r", 8),
-                ("g", 8),
-                ("b", 8)
-        ]
-        fifo = SyncFIFO(rgb_layout, 2048)
         vidtest = PRBS31Generator(24)
         vidtest = ClockDomainsRenamer( {"sys" : "hdmi"} )(vidtest)
-        self.fifo = ClockDomainsRenamer( {"sys": "hdmi"} )(fifo)
-        self.submodules += [vidtest, self.vid_select, self.fifo]
-        self.comb += Case(self.vid_select.storage, {
-                0: [self.vin.ready.eq(self.vout.ready),
-                    self.vout.hsync.eq(self.vin.hsync),
-                    self.vout.vsync.eq(self.vin.vsync),
-                    self.vout.de.eq(self.vin.de),
-                    self.fifo.sink.r.eq(hdmi_data[0:8]),
-                    self.fifo.sink.g.eq(hdmi_data[8:16]),
-                    self.fifo.sink.b.eq(hdmi_data[16:24]),
-                    self.fifo.source.ready.eq(video_fifo_read),
-                    self.fifo.sink.valid.eq(hdmi_data_valid),
-                    self.vout.valid.eq(self.fifo.source.valid),
-                    If(nes_picture_box_valid, [self.vout.r.eq(self.fifo.source.r), 
-                        self.vout.g.eq(self.fifo.source.g), 
-                        self.vout.b.eq(self.fifo.source.b)]),],
-                1: [self.vin.ready.eq(self.vout.ready),
-                    self.vout.hsync.eq(self.vin.hsync),
-                    self.vout.vsync.eq(self.vin.vsync),
-                    self.vout.de.eq(self.vin.de),
-                    self.fifo.sink.r.eq(hdmi_data[0:8]),
-                    self.fifo.sink.g.eq(hdmi_data[8:16]),
-                    self.fifo.sink.b.eq(hdmi_data[16:24]),
-                    self.fifo.source.ready.eq(self.vout.ready),
-                    self.fifo.sink.valid.eq(hdmi_data_valid),
-                    self.vout.valid.eq(self.fifo.source.valid),
-                    self.vout.r.eq(self.fifo.source.r), 
-                    self.vout.g.eq(self.fifo.source.g), 
-                    self.vout.b.eq(self.fifo.source.b)],
+        self.submodules += [vidtest, self.vid_select]
+        modes = {
+                0: [self.vin.connect(scaler.sink),
+                    scaler.source.connect(self.vout)],
+                1: [self.vin.connect(scaler.sink),
+                    scaler.source.connect(self.vout)],
                 2: [self.vin.ready.eq(self.vout.ready),
+                    self.vout.valid.eq(self.vin.valid),
                     self.vout.hsync.eq(self.vin.hsync),
                     self.vout.vsync.eq(self.vin.vsync),
                     self.vout.de.eq(self.vin.de),
@@ -268,6 +405,7 @@ class NesInst(LiteXModule):
                     self.vout.g.eq(hdmi_data[8:16]), 
                     self.vout.b.eq(hdmi_data[16:24])],
                 4: [self.vin.ready.eq(self.vout.ready),
+                    self.vout.valid.eq(self.vin.valid),
                     self.vout.hsync.eq(self.vin.hsync),
                     self.vout.vsync.eq(self.vin.vsync),
                     self.vout.de.eq(self.vin.de),
@@ -275,13 +413,42 @@ class NesInst(LiteXModule):
                     self.vout.g.eq(0), 
                     self.vout.b.eq(255)],
                 "default": [self.vin.ready.eq(self.vout.ready),
+                    self.vout.valid.eq(self.vin.valid),
                     self.vout.hsync.eq(self.vin.hsync),
                     self.vout.vsync.eq(self.vin.vsync),
                     self.vout.de.eq(self.vin.de),
                     self.vout.r.eq(255), 
                     self.vout.g.eq(255), 
                     self.vout.b.eq(255)],
-        })
+        }
+        if framebuffer is not None:
+            self.comb += [
+                framebuffer.nes_pixel.eq(hdmi_data),
+                framebuffer.nes_valid.eq(hdmi_data_valid),
+                framebuffer.nes_vsync.eq(self.vin.vsync),
+            ]
+            # The scaler only watches the raster here, to keep pacing the NES lines.
+            modes[5] = [self.vin.connect(framebuffer.vtg_sink),
+                    framebuffer.source.connect(self.vout),
+                    self.vin.connect(scaler.sink, omit={"valid", "ready"}),
+                    scaler.sink.valid.eq(self.vin.valid & self.vin.ready),
+                    scaler.source.ready.eq(1)]
+        self.comb += Case(vid_select, modes)
+
+        # Health counters of the NES video path.
+        self.health = health = VideoHealthMonitor(clock_domain="hdmi")
+        vsync_d = Signal()
+        self.sync.hdmi += If(self.vin.valid & self.vin.ready, vsync_d.eq(self.vin.vsync))
+        self.comb += [
+            health.frame.eq(self.vin.valid & self.vin.ready & self.vin.vsync & ~vsync_d),
+            health.underflow.eq(scaler.underflow & (vid_select < 2)),
+            health.line_request.eq(hdmi_line_ready),
+            health.line_pixel.eq(hdmi_data_valid),
+            health.line_done.eq(hdmi_line_done),
+            health.line_missed.eq(scaler.line_missed),
+        ]
+        if framebuffer is not None:
+            self.comb += health.fb_underflow.eq(framebuffer.underflow & (vid_select == 5))
 
 # BaseSoC ------------------------------------------------------------------------------------------
 class BaseSoC(SoCCore):
@@ -290,13 +457,19 @@ class BaseSoC(SoCCore):
     }
     interrupt_map.update(SoCCore.interrupt_map)
 
-    def __init__(self, toolchain="gowin", sys_clk_freq=48e6,
+    def __init__(self, toolchain="gowin", sys_clk_freq=None,
         with_led_chaser = False,
         with_rgb_led    = False,
         with_buttons    = True,
         with_video_terminal = False,
+        with_nes       = False,
         with_framebuffer = False,
         with_wb_sdcard = False,
+        wb_sdcard_dma  = "bus",
+        with_busmon    = False,
+        with_sdram_bist = False,
+        sdram_module   = sdram_module_default,
+        sdram_cl       = None,
         **kwargs):
 
         platform = sipeed_tang_nano_20k.Platform(toolchain=toolchain)
@@ -313,7 +486,9 @@ class BaseSoC(SoCCore):
         extra_reset = Signal()
 
         # CRG --------------------------------------------------------------------------------------
-        self.crg = _CRG(platform, sys_clk_freq, reset=extra_reset)
+        clock_plan   = solve_clock_plan(platform.device, sys_clk_freq)
+        sys_clk_freq = clock_plan["sys"]
+        self.crg = _CRG(platform, clock_plan, reset=extra_reset)
 
         # SoCCore ----------------------------------------------------------------------------------
         SoCCore.__init__(self, platform, sys_clk_freq, ident="LiteX SoC on Tang Nano 20K", **kwargs)
@@ -338,18 +513,56 @@ class BaseSoC(SoCCore):
 
             self.specials += DDROutput(0, 1, sdram_pads.clk, ClockSignal("sys"))
 
-            self.sdrphy = GENSDRPHY(sdram_pads, sys_clk_freq)
+            self.sdrphy = GENSDRPHY(sdram_pads, sys_clk_freq, cl=sdram_cl)
             self.add_sdram("sdram",
                 phy           = self.sdrphy,
-                module        = M12L64322A(sys_clk_freq, "1:1"), # FIXME.
-                l2_cache_size = 128,
+                module        = get_sdram_module(sdram_module)(sys_clk_freq, "1:1"),
+                l2_cache_size = kwargs.get("l2_size", 128),
+                with_bist     = with_sdram_bist,
             )
-
-        self.nes = NesInst(self, platform, sys_clk_freq)
-        self.bus.add_master(master=self.nes.wb_rom, region=SoCRegion(origin=0x40000000, size=0x00800000))
-        tp = platform.request_all("test_io")
-        self.comb += [tp.eq(self.nes.testo),
-        ]
+            if hasattr(self, "l2_cache"):
+                # LiteX widens the L2 line past the port to l2_cache_min_data_width.
+                self.add_constant("L2_LINE_BYTES", self.l2_cache.slave.data_width//8)
+
+        # Framebuffer ------------------------------------------------------------------------------
+        self.framebuffer = None
+        if with_framebuffer and with_nes and hasattr(self, "sdram"):
+            # Two rgb565 1280x720 pages in the upper half of the SDRAM, shown as vid_select 5.
+            fb_base = 0x00400000
+            self.framebuffer = VideoDoubleFrameBuffer(
+                read_port    = self.sdram.crossbar.get_port(mode="read",  data_width=32),
+                write_port   = self.sdram.crossbar.get_port(mode="write", data_width=32),
+                hres         = 1280,
+                vres         = 720,
+                base         = fb_base,
+                page_size    = 0x00200000,
+                clock_domain = "hdmi",
+            )
+            self.add_constant("VIDEO_FRAMEBUFFER_BASE",      self.mem_map["main_ram"] + fb_base)
+            self.add_constant("VIDEO_FRAMEBUFFER_PAGE_SIZE", 0x00200000)
+            self.add_constant("VIDEO_FRAMEBUFFER_HRES",      1280)
+            self.add_constant("VIDEO_FRAMEBUFFER_VRES",      720)
+            self.add_constant("VIDEO_FRAMEBUFFER_DEPTH",     16)
+
+        # NES --------------------------------------------------------------------------------------
+        self.nes = None
+        if with_nes:
+            self.nes = NesInst(self, platform, sys_clk_freq, framebuffer=self.framebuffer)
+            if hasattr(self, "sdram"):
+                # ROM fetches get their own port, bridged to the NES clock domain by the crossbar,
+                # and a line cache so the NES core does not see the CPU or the SD DMA. CHR lives
+                # from 512KB up in the ROM window and is kept in its own half of the cache.
+                nes_rom_port = self.sdram.crossbar.get_port(data_width=32, clock_domain="hdmi")
+                self.nes_rom = ClockDomainsRenamer("hdmi")(WishboneDRAMLineCache(self.nes.wb_rom, nes_rom_port,
+                    size      = 0x00800000,
+                    split_bit = 19,
+                ))
+                self.comb += self.nes_rom.flush.eq(self.nes.rom_reset)
+            else:
+                self.bus.add_master(master=self.nes.wb_rom, region=SoCRegion(origin=0x40000000, size=0x00800000))
+            tp = platform.request_all("test_io")
+            self.comb += [tp.eq(self.nes.testo),
+            ]
 
 
         # Leds -------------------------------------------------------------------------------------
@@ -362,7 +575,10 @@ class BaseSoC(SoCCore):
         if with_video_terminal:
             print("Adding hdmi output")
             self.videophy = VideoGowinHDMIPHY(platform.request("hdmi"), clock_domain="hdmi")
-            self.add_nes_video_terminal(self.nes, phy=self.videophy, timings="1280x720@60Hz", clock_domain="hdmi")
+            if self.nes is not None:
+                self.add_nes_video_terminal(self.nes, phy=self.videophy, timings="1280x720@60Hz", clock_domain="hdmi")
+            else:
+                self.add_video_terminal(phy=self.videophy, timings="1280x720@60Hz", clock_domain="hdmi")
 
         # RGB Led ----------------------------------------------------------------------------------
         if with_rgb_led:
@@ -377,7 +593,39 @@ class BaseSoC(SoCCore):
             ))
 
         if with_wb_sdcard:
-            self.sdcard = WbSdcard(self, platform, sys_clk_freq)
+            self.wbsdcard = WbSdcard(self, platform, sys_clk_freq, dma=wb_sdcard_dma)
+
+        # Bus Monitors -----------------------------------------------------------------------------
+        monitors = []
+        if with_busmon:
+            for name, bus in zip(["ibus", "dbus"], self.cpu.periph_buses):
+                busmon = WishboneBusMonitor(bus)
+                self.add_module(name=f"busmon_cpu_{name}", module=busmon)
+                monitors.append(busmon)
+            if with_wb_sdcard:
+                self.busmon_sdcard = WishboneBusMonitor(self.wbsdcard.wbm)
+                monitors.append(self.busmon_sdcard)
+            if with_nes:
+                self.busmon_nes = WishboneBusMonitor(self.nes.wb_rom, clock_domain="hdmi")
+                monitors.append(self.busmon_nes)
+        if with_nes:
+            monitors.append(self.nes.health)
+
+        # Telemetry --------------------------------------------------------------------------------
+        # One snapshot write latches every monitor, for tools/telemetry.py.
+        if monitors:
+            self.telemetry = TelemetrySnapshot()
+            for monitor in monitors:
+                self.telemetry.add_monitor(monitor)
+
+        # Boot Timestamps --------------------------------------------------------------------------
+        # Time base of the boot log kept by the BIOS preboot path, printed by the boottime command.
+        boot_events = {}
+        if with_nes:
+            boot_events["nes_frame"] = (self.nes.vin.vsync & ~self.nes.rom_reset, "hdmi")
+        self.boottime = BootTimestamp(events=boot_events)
+        if hasattr(self, "sdram"):
+            self.add_constant("BOOTLOG_BASE", self.mem_map["main_ram"] + 0x001ff000)
 
         # Buttons ----------------------------------------------------------------------------------
         if with_buttons:
@@ -411,22 +659,32 @@ def main():
     from litex.build.parser import LiteXArgumentParser
     parser = LiteXArgumentParser(platform=sipeed_tang_nano_20k.Platform, description="LiteX SoC on Tang Nano 20K.")
     parser.add_target_argument("--flash",        action="store_true",      help="Flash Bitstream.")
-    parser.add_target_argument("--sys-clk-freq", default=37.125e6, type=float, help="System clock frequency.")
-    parser.add_target_argument("--with-video-terminal", action="store_true",    help="Enable Video Terminal (HDMI).")
-    parser.add_target_argument("--with-rgb-led", action="store_true",    help="Enable RGB led.")
-    parser.add_target_argument("--with-wb-sdcard", action="store_true", help="Enable SDCard support with a wishbone slave.")
+    parser.add_target_argument("--sys-clk-freq", default=None, type=float, help="System clock frequency (default: fastest the SDRAM allows, 37.125e6 to derive it from HDMI).")
+    add_peripheral_arguments(parser)
+    parser.add_target_argument("--sdram-module", default=sdram_module_default,    help="LiteDRAM SDR module giving the SDRAM timings.")
+    parser.add_target_argument("--sdram-cl",     default=None,  type=int,         help="SDRAM CAS latency (default: from the sys clock).")
+    parser.set_defaults(l2_size=128)
+    parser.add_target_argument("--wb-sdcard-dma", default="bus", choices=["bus", "dram"], help="Wishbone SDCard DMA path: shared main bus or dedicated LiteDRAM port.")
+    parser.add_target_argument("--build-cache",  default=default_cache_dir("sipeed_tang_nano_20k"), help="Bitstream cache directory.")
+    parser.add_target_argument("--no-build-cache", action="store_true", help="Always run synthesis and place and route.")
     sdopts = parser.target_group.add_mutually_exclusive_group()
     sdopts.add_argument("--with-spi-sdcard",            action="store_true", help="Enable SPI-mode SDCard support.")
     sdopts.add_argument("--with-sdcard",                action="store_true", help="Enable SDCard support.")
     args = parser.parse_args()
+    enabled = resolve_peripherals(args)
+
+    soc_kwargs = parser.soc_argdict
+    if not args.no_build_cache:
+        soc_kwargs["ident_version"] = False
 
     soc = BaseSoC(
         toolchain    = args.toolchain,
         sys_clk_freq = args.sys_clk_freq,
-        with_video_terminal = args.with_video_terminal,
-        with_rgb_led = args.with_rgb_led,
-        with_wb_sdcard = args.with_wb_sdcard,
-        **parser.soc_argdict
+        wb_sdcard_dma  = args.wb_sdcard_dma,
+        sdram_module   = args.sdram_module,
+        sdram_cl       = args.sdram_cl,
+        **{f"with_{name}": name in enabled for name in peripherals},
+        **soc_kwargs
     )
     
     if args.with_spi_sdcard:
@@ -435,15 +693,17 @@ def main():
         soc.add_sdcard()
 
     builder = Builder(soc, **parser.builder_argdict)
-    if args.with_wb_sdcard:
-        builder.add_external_software_package("libwbsdcard", SoftwareWbsdcard, cmd_srcs=["groot.o"])
-        builder.add_software_library("libwbsdcard")
-    builder.add_external_software_package("libnes", SoftwareNes)
-    builder.add_software_library("libnes")
-    builder.add_json(os.path.join(SoftwareNes, "whatever.json"))
+    cache   = BuildCache(builder, args.build_cache)
+    add_peripheral_software(builder, enabled, cache)
     
     if args.build:
-        builder.build(**parser.toolchain_argdict)
+        if args.no_build_cache:
+            builder.build(**parser.toolchain_argdict)
+        else:
+            cache.build(outputs=[
+                builder.get_bitstream_filename(mode="sram"),
+                builder.get_bitstream_filename(mode="flash", ext=".fs"),
+            ], **parser.toolchain_argdict)
 
     if args.load:
         prog = soc.platform.create_programmer()
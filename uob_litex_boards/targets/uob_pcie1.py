@@ -18,12 +18,19 @@ from litex.gen import *
 from uob_litex_boards.platforms import uob_pcie1
 from uob_litex_boards.i2s import I2SMaster
 from uob_litex_boards.mipi import MipiCsiMaster
+from uob_litex_boards.video import VideoCompositor
+from uob_litex_boards.hyperram import InterleavedHyperRAM
+from uob_litex_boards.pcie import PCIeNXPHY, PCIeEndpoint
+from uob_litex_boards.busmon import WishboneBusMonitor
+from uob_litex_boards.telemetry import TelemetrySnapshot
+from uob_litex_boards.software.constants import SoftwarePerf
+from uob_litex_boards.buildcache import BuildCache, default_cache_dir
 
 from litex.soc.cores.hyperbus import HyperRAM
 from litex.soc.cores.i2c import I2CMaster
 
 from litex.soc.cores.ram import NXLRAM
-from litex.soc.cores.video import VideoHDMIPHY
+from litex.soc.cores.video import VideoHDMIPHY, VideoTimingGenerator
 from litex.build.io import CRG
 from litex.build.generic_platform import *
 
@@ -36,28 +43,52 @@ from litex.soc.cores.led import LedChaser
 # CRG ----------------------------------------------------------------------------------------------
 
 class _CRG(LiteXModule):
-    def __init__(self, platform, sys_clk_freq):
-        self.rst    = Signal()
-        self.cd_sys = ClockDomain()
-        self.cd_por = ClockDomain()
-        self.cd_hdmi = ClockDomain()
+    def __init__(self, platform, sys_clk_freq, clk_freq=12e6, hdmi_refclk=None, hdmi_refclk_freq=27e6):
+        self.rst       = Signal()
+        self.cd_sys    = ClockDomain()
+        self.cd_por    = ClockDomain()
+        self.cd_hdmi   = ClockDomain()
         self.cd_hdmi5x = ClockDomain()
 
-        # TODO: replace with PLL
-        # Clocking
-        self.sys_clk = sys_osc = NXOSCA(platform)
-        sys_osc.create_hf_clk(self.cd_sys, sys_clk_freq)
-        platform.add_period_constraint(self.cd_sys.clk, 1e9/sys_clk_freq)
+        # # #
+
+        # Clk / Rst.
+        clk   = platform.request("clock")
         rst_n = platform.request("reset")
+        platform.add_period_constraint(clk, 1e9/clk_freq)
 
-        # Power On Reset
+        # Power On Reset, on the board clock so it also holds the PLLs.
         por_cycles  = 4096
         por_counter = Signal(log2_int(por_cycles), reset=por_cycles-1)
-        self.comb += self.cd_por.clk.eq(self.cd_sys.clk)
+        self.comb += self.cd_por.clk.eq(clk)
         self.sync.por += If(por_counter != 0, por_counter.eq(por_counter - 1))
         self.specials += AsyncResetSynchronizer(self.cd_por, ~rst_n)
-        self.specials += AsyncResetSynchronizer(self.cd_sys, (por_counter != 0) | self.rst)
 
+        # Sys PLL.
+        self.sys_pll = sys_pll = NXPLL(platform=platform, create_output_port_clocks=True)
+        self.comb += sys_pll.reset.eq(por_counter != 0)
+        sys_pll.register_clkin(clk, clk_freq)
+        sys_pll.create_clkout(self.cd_sys, sys_clk_freq, margin=0)
+        self.specials += AsyncResetSynchronizer(self.cd_sys, ~sys_pll.locked | self.rst)
+
+        # HDMI PLL: 74.25MHz pixel clock and the 5x DDR serializer clock, from the same VCO. Exact
+        # from a video reference clock (27MHz on refclock `hdmi_refclk`), within 0.5% (the
+        # HDMI/CEA tolerance) from the 12MHz board clock.
+        if hdmi_refclk is None:
+            hdmi_clkin, hdmi_clkin_freq, margin = clk, clk_freq, 5e-3
+        else:
+            hdmi_clkin, hdmi_clkin_freq, margin = platform.request("refclock", hdmi_refclk), hdmi_refclk_freq, 0
+            platform.add_period_constraint(hdmi_clkin, 1e9/hdmi_refclk_freq)
+        self.hdmi_pll = hdmi_pll = NXPLL(platform=platform, create_output_port_clocks=True)
+        self.comb += hdmi_pll.reset.eq(por_counter != 0)
+        hdmi_pll.register_clkin(hdmi_clkin, hdmi_clkin_freq)
+        hdmi_pll.create_clkout(self.cd_hdmi,   74.25e6,  margin=margin)
+        hdmi_pll.create_clkout(self.cd_hdmi5x, 371.25e6, margin=margin)
+        self.specials += [
+            AsyncResetSynchronizer(self.cd_hdmi,   ~hdmi_pll.locked),
+            AsyncResetSynchronizer(self.cd_hdmi5x, ~hdmi_pll.locked),
+        ]
+        platform.add_false_path_constraints(self.cd_sys.clk, self.cd_hdmi.clk, self.cd_hdmi5x.clk)
 
 # BaseSoC ------------------------------------------------------------------------------------------
 
@@ -67,17 +98,21 @@ class BaseSoC(SoCCore):
         "sram": 0x40000000,
         "csr":  0xf0000000,
     }
-    def __init__(self, sys_clk_freq=75e6, toolchain="radiant",
+    def __init__(self, sys_clk_freq=100e6, toolchain="radiant",
+        hdmi_refclk     = None,
         hyperram        = "none",
         with_led_chaser = True,
         with_video_terminal = True,
         with_video_colorbars = False,
+        with_video_compositor = False,
+        with_pcie       = False,
+        with_busmon     = False,
         **kwargs):
         platform = uob_pcie1.Platform(toolchain=toolchain)
         platform.add_platform_command("ldc_set_sysconfig {{MASTER_SPI_PORT=SERIAL}}")
 
         # CRG --------------------------------------------------------------------------------------
-        self.crg = _CRG(platform, sys_clk_freq)
+        self.crg = _CRG(platform, sys_clk_freq, hdmi_refclk=hdmi_refclk)
         
         self.i2cm0 = I2CMaster(platform.request("i2c"))
 
@@ -93,6 +128,12 @@ class BaseSoC(SoCCore):
             self.spram = NXLRAM(32, size)
             self.bus.add_slave("sram", slave=self.spram.bus, region=SoCRegion(origin=self.mem_map["sram"],
                 size=size))
+        elif hyperram == "both":
+            # Both HyperRAM chips, striped behind a burst cache, as SRAM ---------------------------
+            size = 16 * MEGABYTE
+            hr_pads = [platform.request("hyperram", n) for n in range(2)]
+            self.hyperram = InterleavedHyperRAM(hr_pads, sys_clk_freq=sys_clk_freq, chip_size=8 * MEGABYTE)
+            self.bus.add_slave("sram", slave=self.hyperram.bus, region=SoCRegion(origin=self.mem_map["sram"], size=size, mode="rwx"))
         else:
             # Use HyperRAM generic PHY as SRAM -----------------------------------------------------
             size = 8 * MEGABYTE
@@ -107,37 +148,120 @@ class BaseSoC(SoCCore):
                 sys_clk_freq = sys_clk_freq)
         
         self.videophy = VideoHDMIPHY(platform.request("hdmi"), clock_domain="hdmi")
-        if with_video_terminal:
+        if with_video_terminal and not with_video_compositor:
             self.add_video_terminal(phy=self.videophy, timings="1280x720@60Hz", clock_domain="hdmi")
-        if with_video_colorbars:
+        if with_video_colorbars and not with_video_compositor:
             self.add_video_colorbars(phy=self.videophy, timings="1280x720@60Hz", clock_domain="hdmi")
         
-        self.mipi0 = MipiCsiMaster(platform.request("camera", number=2))
-        self.mipi1 = MipiCsiMaster(platform.request("camera", number=3))
-        self.mipi2 = MipiCsiMaster(platform.request("camera", number=4))
-        self.i2s_quad_0 = I2SMaster(platform.request("i2s_quad", number=0))
-        self.i2s_quad_1 = I2SMaster(platform.request("i2s_quad", number=1))
-        self.i2s_quad_2 = I2SMaster(platform.request("i2s_quad", number=2))
+
+        # Cameras ----------------------------------------------------------------------------------
+        # CSI-2 receivers writing double buffered frames to memory (HyperRAM with --with-hyperram).
+        self.mipi0 = MipiCsiMaster(platform.request("camera", number=2), name="mipi0")
+        self.mipi1 = MipiCsiMaster(platform.request("camera", number=3), name="mipi1")
+        self.mipi2 = MipiCsiMaster(platform.request("camera", number=4), name="mipi2")
+        for name in ["mipi0", "mipi1", "mipi2"]:
+            self.bus.add_master(name=name, master=getattr(self, name).bus)
+            if self.irq.enabled:
+                self.irq.add(name, use_loc_if_exists=True)
+
+        # Camera preview: the three cameras tiled straight onto the HDMI output.
+        if with_video_compositor:
+            self.video_vtg = ClockDomainsRenamer("hdmi")(VideoTimingGenerator(default_video_timings="1280x720@60Hz"))
+            self.video_compositor = VideoCompositor(
+                sources      = [(m.source, m.clock_domain) for m in [self.mipi0, self.mipi1, self.mipi2]],
+                clock_domain = "hdmi",
+            )
+            self.comb += [
+                self.video_vtg.source.connect(self.video_compositor.vtg_sink),
+                self.video_compositor.source.connect(self.videophy.sink),
+            ]
+
+        # I2S --------------------------------------------------------------------------------------
+        # Three quads of four lanes, each with its own DMA ring buffer and half/full interrupts.
+        self.i2s_quad_0 = I2SMaster(platform.request("i2s_quad", number=0), sys_clk_freq=sys_clk_freq)
+        self.i2s_quad_1 = I2SMaster(platform.request("i2s_quad", number=1), sys_clk_freq=sys_clk_freq)
+        self.i2s_quad_2 = I2SMaster(platform.request("i2s_quad", number=2), sys_clk_freq=sys_clk_freq)
+        for name in ["i2s_quad_0", "i2s_quad_1", "i2s_quad_2"]:
+            self.bus.add_master(name=name, master=getattr(self, name).bus)
+            if self.irq.enabled:
+                self.irq.add(name, use_loc_if_exists=True)
+
+        # PCIe -------------------------------------------------------------------------------------
+        # Gen2 x1 endpoint: BAR0 exposes the CSRs, BAR2 the SRAM, and two scatter-gather DMA writers
+        # (cameras, audio) push board memory to the host with an MSI per flagged descriptor.
+        if with_pcie:
+            self.pcie_phy = PCIeNXPHY(platform.request("pcie"))
+            self.pcie_endpoint = PCIeEndpoint(bars={
+                0: (self.mem_map["csr"],  0x10000),
+                2: (self.mem_map["sram"], size),
+            })
+            self.comb += [
+                self.pcie_phy.source.connect(self.pcie_endpoint.sink),
+                self.pcie_endpoint.source.connect(self.pcie_phy.sink),
+                self.pcie_endpoint.id.eq(self.pcie_phy.id),
+            ]
+            platform.add_period_constraint(self.pcie_phy.cd_pcie.clk, 1e9/125e6)
+            platform.add_false_path_constraints(self.crg.cd_sys.clk, self.pcie_phy.cd_pcie.clk)
+            self.bus.add_master(name="pcie_bar", master=self.pcie_endpoint.bridge.bus)
+            for n, dma in enumerate(self.pcie_endpoint.dmas):
+                self.bus.add_master(name=f"pcie_dma{n}", master=dma.bus)
+
+        # Bus Monitors -----------------------------------------------------------------------------
+        if with_busmon:
+            # CPU and DMA masters, latched together by one telemetry snapshot (tools/telemetry.py).
+            self.telemetry = TelemetrySnapshot()
+            masters  = [(f"cpu_{name}", bus) for name, bus in zip(["ibus", "dbus"], self.cpu.periph_buses)]
+            masters += [(name, getattr(self, name).bus) for name in ["mipi0", "mipi1", "mipi2"]]
+            masters += [(name, getattr(self, name).bus) for name in ["i2s_quad_0", "i2s_quad_1", "i2s_quad_2"]]
+            if with_pcie:
+                masters += [("pcie_bar", self.pcie_endpoint.bridge.bus)]
+                masters += [(f"pcie_dma{n}", dma.bus) for n, dma in enumerate(self.pcie_endpoint.dmas)]
+            for name, bus in masters:
+                busmon = WishboneBusMonitor(bus)
+                self.add_module(name=f"busmon_{name}", module=busmon)
+                self.telemetry.add_monitor(busmon)
 
 # Build --------------------------------------------------------------------------------------------
 
 def main():
     from litex.build.parser import LiteXArgumentParser
     parser = LiteXArgumentParser(platform=uob_pcie1.Platform, description="LiteX SoC on UOB PCIE1 Board.")
-    parser.add_target_argument("--sys-clk-freq",  default=75e6, type=float, help="System clock frequency.")
-    parser.add_target_argument("--with-hyperram", default="none",           help="Enable use of HyperRAM chip (none, 0 or 1).")
+    parser.add_target_argument("--sys-clk-freq",  default=100e6, type=float, help="System clock frequency.")
+    parser.add_target_argument("--hdmi-refclk",   default=None,  type=int,  help="Refclock input with a 27MHz oscillator for exact HDMI clocks (board clock otherwise).")
+    parser.add_target_argument("--with-hyperram", default="none",           help="Enable use of HyperRAM chip (none, 0, 1 or both).")
     parser.add_target_argument("--prog-target",   default="direct",         help="Programming Target (direct or flash).")
+    parser.add_target_argument("--with-busmon",   action="store_true",      help="Enable Wishbone bus monitors on the CPU buses and the DMA masters.")
+    parser.add_target_argument("--with-video-compositor", action="store_true", help="Show the three cameras tiled on HDMI instead of the video terminal.")
+    parser.add_target_argument("--with-pcie",     action="store_true",      help="Enable the PCIe endpoint with scatter-gather DMA to the host.")
+    parser.add_target_argument("--build-cache",   default=default_cache_dir("uob_pcie1"), help="Bitstream cache directory.")
+    parser.add_target_argument("--no-build-cache", action="store_true",     help="Always run synthesis and place and route.")
     args = parser.parse_args()
 
+    soc_kwargs = parser.soc_argdict
+    if not args.no_build_cache:
+        soc_kwargs["ident_version"] = False
+
     soc = BaseSoC(
         sys_clk_freq = args.sys_clk_freq,
         hyperram     = args.with_hyperram,
+        hdmi_refclk  = args.hdmi_refclk,
         toolchain    = args.toolchain,
-        **parser.soc_argdict
+        with_busmon  = args.with_busmon,
+        with_video_compositor = args.with_video_compositor,
+        with_pcie    = args.with_pcie,
+        **soc_kwargs
     )
     builder = Builder(soc, **parser.builder_argdict)
+    cache   = BuildCache(builder, args.build_cache)
+    if args.with_busmon:
+        builder.add_external_software_package("libperf", SoftwarePerf, cmd_srcs=["busmon.o"])
+        builder.add_software_library("libperf")
+        cache.add_software(SoftwarePerf)
     if args.build:
-        builder.build(**parser.toolchain_argdict)
+        if args.no_build_cache:
+            builder.build(**parser.toolchain_argdict)
+        else:
+            cache.build(outputs=[builder.get_bitstream_filename(mode="sram")], **parser.toolchain_argdict)
 
     if args.load:
         prog = soc.platform.create_programmer(args.prog_target)
@@ -0,0 +1,37 @@
+from migen import *
+
+from litex.gen import *
+
+from litex.soc.interconnect.csr import CSR, CSRStatus
+
+# Telemetry snapshot -------------------------------------------------------------------------------
+
+class TelemetrySnapshot(LiteXModule):
+    """One snapshot write for all the monitors of the SoC, read back by tools/telemetry.py.
+
+    A write to `snapshot` pulses the `trigger` input of every monitor given to add_monitor(), so
+    their status registers all hold the counters of the same sys cycle (a few cycles later for
+    monitors in other clock domains). It also counts the snapshots in `sequence` and latches a free
+    running sys cycle counter into `timestamp`, for the host to spot lost samples and time them on
+    the board.
+    """
+    def __init__(self):
+        self.snapshot  = CSR()
+        self.sequence  = CSRStatus(32, description="Snapshots taken since reset.")
+        self.timestamp = CSRStatus(64, description="Sys cycles since reset, at the last snapshot.")
+
+        # # #
+
+        self.trigger = Signal()
+        counter      = Signal(64)
+        self.comb += self.trigger.eq(self.snapshot.re)
+        self.sync += [
+            counter.eq(counter + 1),
+            If(self.trigger,
+                self.sequence.status.eq(self.sequence.status + 1),
+                self.timestamp.status.eq(counter),
+            )
+        ]
+
+    def add_monitor(self, monitor):
+        self.comb += monitor.trigger.eq(self.trigger)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+#
+# Host side reader of the boot timeline (software/wbsdcard/boottime.h).
+#
+# Reads the boot log out of the SDRAM and the gateware stamps of the BootTimestamp core through
+# litex_server (UART or any other bridge), and prints the stages in time order with their
+# durations, or writes them as CSV.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import argparse
+
+from litex import RemoteClient
+
+# Boot log -----------------------------------------------------------------------------------------
+
+BOOTLOG_MAGIC    = 0x544f4f42
+BOOTLOG_ENTRIES  = 32
+BOOTLOG_NAME_LEN = 24
+BOOTLOG_HEADER   = 4  # Words: magic, count, clk_freq, reserved.
+BOOTLOG_ENTRY    = 2 + BOOTLOG_NAME_LEN//4
+
+def read_bootlog(bus):
+    """Stages of the boot log and of the gateware, as (cycles, name) sorted by time, and clk_freq."""
+    if "bootlog_base" not in bus.constants.d:
+        raise ValueError("No BOOTLOG_BASE in the CSR map, the SoC has no boot log.")
+    base  = bus.constants.d["bootlog_base"]
+    words = bus.read(base, BOOTLOG_HEADER + BOOTLOG_ENTRIES*BOOTLOG_ENTRY)
+    magic, count, clk_freq = words[0], words[1], words[2]
+    if magic != BOOTLOG_MAGIC:
+        raise ValueError(f"No boot log at 0x{base:08x}.")
+
+    stages = []
+    for i in range(min(count, BOOTLOG_ENTRIES)):
+        entry  = words[BOOTLOG_HEADER + i*BOOTLOG_ENTRY:][:BOOTLOG_ENTRY]
+        cycles = entry[0] | (entry[1] << 32)
+        name   = b"".join(w.to_bytes(4, "little") for w in entry[2:]).split(b"\0")[0].decode(errors="replace")
+        stages.append((cycles, name))
+    for name in bus.regs.d:
+        if name.startswith("boottime_") and name not in ["boottime_latch", "boottime_cycles"]:
+            cycles = getattr(bus.regs, name).read()
+            if cycles:
+                stages.append((cycles, name[len("boottime_"):] + " (gateware)"))
+    return sorted(stages), clk_freq
+
+# Run ----------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the boot timeline over a litex_server bridge.")
+    parser.add_argument("--csr-csv", default="csr.csv",   help="SoC CSV file.")
+    parser.add_argument("--host",    default="localhost", help="litex_server host.")
+    parser.add_argument("--port",    default=1234,        type=int, help="litex_server port.")
+    parser.add_argument("--csv",     action="store_true", help="Print CSV instead of a table.")
+    args = parser.parse_args()
+
+    bus = RemoteClient(host=args.host, port=args.port, csr_csv=args.csr_csv)
+    bus.open()
+    try:
+        stages, clk_freq = read_bootlog(bus)
+    finally:
+        bus.close()
+
+    if args.csv:
+        print("stage,cycles,time_ms,delta_ms")
+    else:
+        print(f"{'stage':24s} {'cycles':>14s} {'time (ms)':>12s} {'delta (ms)':>12s}")
+    prev = 0
+    for cycles, name in stages:
+        time  = cycles/clk_freq*1e3
+        delta = (cycles - prev)/clk_freq*1e3
+        if args.csv:
+            print(f"{name},{cycles},{time:.3f},{delta:.3f}")
+        else:
+            print(f"{name:24s} {cycles:14d} {time:12.3f} {delta:12.3f}")
+        prev = cycles
+    if stages and not args.csv:
+        slowest = max(zip(stages, [0] + [c for c, _ in stages]), key=lambda s: s[0][0] - s[1])
+        print(f"Slowest stage: {slowest[0][1]} ({(slowest[0][0] - slowest[1])/clk_freq*1e3:.3f} ms).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+#
+# SDRAM tuning sweep for the Tang Nano 20K (software/perf/sdrambench.c).
+#
+# Builds one bitstream per L2 cache size and SDRAM module variant, each in its own output directory
+# and with the LiteDRAM BIST ports (--with-sdram-bist). With --port, every variant is loaded in
+# turn, the sdrambench command is run from the BIOS prompt over the serial console and its
+# bandwidth, latency and error figures are collected into one CSV. Arguments this tool does not
+# know are passed to the target, so the sweep can also run on the full SoC (--with-nes,
+# --with-framebuffer...).
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import re
+import sys
+import time
+import argparse
+import itertools
+import subprocess
+
+TARGET = "uob_litex_boards.targets.sipeed_tang_nano_20k"
+PROMPT = b"litex> "
+
+# Variants -----------------------------------------------------------------------------------------
+
+def variant_name(l2_size, module, cl):
+    return f"l2_{l2_size}_{module.lower()}" + ("" if cl is None else f"_cl{cl}")
+
+def build_variant(output_dir, l2_size, module, cl, target_args, load=False):
+    cmd = [sys.executable, "-m", TARGET,
+        "--with-sdram-bist",
+        "--l2-size",      str(l2_size),
+        "--sdram-module", module,
+        "--output-dir",   output_dir,
+        "--build",
+    ]
+    if cl is not None:
+        cmd += ["--sdram-cl", str(cl)]
+    if load:
+        cmd += ["--load"]
+    print(" ".join(cmd))
+    subprocess.run(cmd + target_args, check=True)
+
+# Console ------------------------------------------------------------------------------------------
+
+BENCH_RE   = re.compile(r"^(sequential|random|mixed|cpu_seq|cpu_random)\s+(\d+)\s+([\d.]+|-)\s+([\d.]+|-)\s+([\d.]+|-)\s+(\d+)\s*$")
+LATENCY_RE = re.compile(r"^(write|read)\s+(\d+)\s+([\d.]+)\s+(\d+) cycles")
+
+def read_until(port, marker, timeout):
+    data     = b""
+    deadline = time.time() + timeout
+    while not data.endswith(marker):
+        if time.time() > deadline:
+            raise TimeoutError(f"No {marker!r} from the board, got: {data[-200:]!r}")
+        data += port.read(port.in_waiting or 1)
+    return data
+
+def run_sdrambench(port, burst=None, timeout=60):
+    """Runs sdrambench at the BIOS prompt and returns its rows as dicts."""
+    port.write(b"\n")
+    read_until(port, PROMPT, timeout)
+    # Drop the prompts of the boot and of the newline still on their way.
+    time.sleep(0.5)
+    port.reset_input_buffer()
+    port.write(b"sdrambench" + (b"" if burst is None else f" {burst}".encode()) + b"\n")
+    output = read_until(port, PROMPT, timeout).decode(errors="replace")
+    rows   = []
+    for line in output.splitlines():
+        line = line.strip()
+        if m := BENCH_RE.match(line):
+            pattern, beats, write, read, total, errors = m.groups()
+            rows.append({"pattern": pattern, "burst": int(beats), "write_mbs": write, "read_mbs": read,
+                "total_mbs": total, "errors": int(errors)})
+        elif m := LATENCY_RE.match(line):
+            direction, lat_min, lat_avg, lat_max = m.groups()
+            rows.append({"pattern": f"latency_{direction}", "burst": 1, "lat_min": int(lat_min),
+                "lat_avg": lat_avg, "lat_max": int(lat_max)})
+    if not rows:
+        raise ValueError(f"No sdrambench results in:\n{output}")
+    return rows
+
+# Run ----------------------------------------------------------------------------------------------
+
+COLUMNS = ["variant", "l2_size", "module", "cl", "pattern", "burst", "write_mbs", "read_mbs", "total_mbs",
+    "errors", "lat_min", "lat_avg", "lat_max"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and measure SDRAM variants of the Tang Nano 20K.")
+    parser.add_argument("--l2-sizes",   default="0,128,1024,8192",  help="L2 cache sizes, comma separated.")
+    parser.add_argument("--modules",    default="M12L64322A",       help="LiteDRAM SDR modules, comma separated.")
+    parser.add_argument("--cls",        default="",                 help="CAS latencies, comma separated (default: from the sys clock).")
+    parser.add_argument("--output-dir", default="build/sdram_sweep", help="Base output directory, one sub directory per variant.")
+    parser.add_argument("--port",       default=None,               help="Serial port of the board, load and measure each variant.")
+    parser.add_argument("--baudrate",   default=115200, type=int,   help="Serial baudrate.")
+    parser.add_argument("--burst",      default=None,   type=int,   help="sdrambench burst length in beats.")
+    parser.add_argument("--csv",        default=None,               help="Results CSV (default: <output-dir>/results.csv).")
+    args, target_args = parser.parse_known_args()
+
+    l2_sizes = [int(s, 0) for s in args.l2_sizes.split(",")]
+    modules  = args.modules.split(",")
+    cls      = [int(c) for c in args.cls.split(",")] if args.cls else [None]
+
+    port = None
+    if args.port is not None:
+        import serial
+        port = serial.Serial(args.port, args.baudrate, timeout=0.1)
+    csv_path = args.csv or os.path.join(args.output_dir, "results.csv")
+    os.makedirs(os.path.dirname(os.path.abspath(csv_path)), exist_ok=True)
+
+    with open(csv_path, "w") as csv:
+        csv.write(",".join(COLUMNS) + "\n")
+        for l2_size, module, cl in itertools.product(l2_sizes, modules, cls):
+            name = variant_name(l2_size, module, cl)
+            build_variant(os.path.join(args.output_dir, name), l2_size, module, cl, target_args, load=port is not None)
+            if port is None:
+                continue
+            for row in run_sdrambench(port, burst=args.burst):
+                row.update(variant=name, l2_size=l2_size, module=module, cl="" if cl is None else cl)
+                csv.write(",".join(str(row.get(c, "")) for c in COLUMNS) + "\n")
+                csv.flush()
+                print(", ".join(f"{c}={row[c]}" for c in COLUMNS if c in row))
+    if port is not None:
+        port.close()
+        print(f"Results in {csv_path}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+#
+# Host side telemetry collector over a litex_server bridge (UART, Etherbone, PCIe...).
+#
+# Reads the counters of the SoC monitors (bus monitors, video health...) at a fixed rate and streams
+# timestamped samples as CSV or JSON lines. Each sample starts with a write to the TelemetrySnapshot
+# core (uob_litex_boards/telemetry.py), which latches every monitor on the same cycle, so the values
+# of one sample are consistent whatever the time the bridge takes to read them. The registers to read
+# are taken from the csr.json of the build and grouped into burst reads of contiguous CSR ranges, a
+# few round trips per sample instead of one per register.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+import sys
+import json
+import time
+import bisect
+import fnmatch
+import argparse
+
+from litex import RemoteClient
+
+# CSR map ------------------------------------------------------------------------------------------
+
+DEFAULT_REGS = "busmon_*,nes_health_*,telemetry_*"
+
+class CSRMap:
+    """Registers, banks and constants of a csr.json."""
+    def __init__(self, filename):
+        with open(filename) as f:
+            d = json.load(f)
+        self.registers      = d["csr_registers"]
+        self.bases          = sorted(d["csr_bases"].values())
+        self.constants      = d["constants"]
+        self.csr_data_width = self.constants.get("config_csr_data_width", 32)
+        self.clk_freq       = self.constants.get("config_clock_frequency", None)
+
+    def bank(self, addr):
+        return self.bases[bisect.bisect_right(self.bases, addr) - 1]
+
+    def select(self, patterns):
+        """Read only registers matching one of the glob `patterns`, by address."""
+        names = [name for name, reg in self.registers.items()
+            if reg["type"] == "ro" and any(fnmatch.fnmatch(name, p) for p in patterns)]
+        return sorted(names, key=lambda name: self.registers[name]["addr"])
+
+    def plan(self, names, max_gap=4, max_burst=255):
+        """Burst reads covering the `names` registers, as (addr, words, names) tuples.
+
+        A burst is extended to the next register when both are in the same CSR bank, at most
+        `max_gap` words apart with only read only registers in between (reading those has no side
+        effect), and the burst stays within `max_burst` words.
+        """
+        bursts = []
+        for name in names:
+            reg = self.registers[name]
+            if bursts:
+                addr, words, burst_names = bursts[-1]
+                end = addr + 4*words
+                gap = [r for r in self.registers.values() if end <= r["addr"] < reg["addr"]]
+                if (self.bank(addr) == self.bank(reg["addr"]) and
+                    (reg["addr"] - end)//4 <= max_gap and
+                    all(r["type"] == "ro" for r in gap) and
+                    (reg["addr"] - addr)//4 + reg["size"] <= max_burst):
+                    bursts[-1] = (addr, (reg["addr"] - addr)//4 + reg["size"], burst_names + [name])
+                    continue
+            bursts.append((reg["addr"], reg["size"], [name]))
+        return bursts
+
+# Sampling -----------------------------------------------------------------------------------------
+
+class TelemetryCollector:
+    def __init__(self, bus, csr_map, names, **plan_kwargs):
+        self.bus      = bus
+        self.csr_map  = csr_map
+        self.names    = names
+        self.bursts   = csr_map.plan(names, **plan_kwargs)
+        self.snapshot = csr_map.registers.get("telemetry_snapshot", {}).get("addr", None)
+        self.sequence = None
+        self.lost     = 0
+
+    def sample(self):
+        """One consistent sample: dict of the host time, the board time and the register values."""
+        width = self.csr_map.csr_data_width
+        if self.snapshot is not None:
+            # Posted, and through the same bridge as the reads that follow.
+            self.bus.write(self.snapshot, 1)
+        row = {"time": time.time()}
+        for addr, words, names in self.bursts:
+            datas = self.bus.read(addr, words)
+            for name in names:
+                reg   = self.csr_map.registers[name]
+                value = 0
+                for data in datas[(reg["addr"] - addr)//4:][:reg["size"]]:
+                    value = (value << width) | (data & (2**width - 1))
+                row[name] = value
+        if "telemetry_timestamp" in row and self.csr_map.clk_freq:
+            row["board_time"] = row["telemetry_timestamp"]/self.csr_map.clk_freq
+        if "telemetry_sequence" in row:
+            # Other clients taking snapshots in between.
+            if self.sequence is not None and row["telemetry_sequence"] != (self.sequence + 1) % 2**32:
+                self.lost += 1
+            self.sequence = row["telemetry_sequence"]
+        return row
+
+# Run ----------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream consistent CSR telemetry samples over a litex_server bridge.")
+    parser.add_argument("--csr-json",  default="csr.json",    help="SoC JSON file.")
+    parser.add_argument("--host",      default="localhost",   help="litex_server host.")
+    parser.add_argument("--port",      default=1234,          type=int,   help="litex_server port.")
+    parser.add_argument("--regs",      default=DEFAULT_REGS,  help="Registers to sample, comma separated glob patterns.")
+    parser.add_argument("--rate",      default=10.0,          type=float, help="Samples per second.")
+    parser.add_argument("--count",     default=0,             type=int,   help="Samples to take (default: until interrupted).")
+    parser.add_argument("--format",    default="csv",         choices=["csv", "json"], help="Output format (json: one object per line).")
+    parser.add_argument("--output",    default=None,          help="Output file (default: stdout).")
+    parser.add_argument("--max-gap",   default=4,             type=int,   help="Unselected words read to merge two bursts.")
+    parser.add_argument("--max-burst", default=255,           type=int,   help="Longest burst read, in words.")
+    parser.add_argument("--plan",      action="store_true",   help="Print the burst plan and exit.")
+    args = parser.parse_args()
+
+    csr_map = CSRMap(args.csr_json)
+    names   = csr_map.select(args.regs.split(","))
+    if not names:
+        raise ValueError(f"No read only register matches {args.regs} in {args.csr_json}.")
+    if "telemetry_snapshot" not in csr_map.registers:
+        print("No telemetry_snapshot register, samples are not latched together.", file=sys.stderr)
+
+    if args.plan:
+        bursts = csr_map.plan(names, max_gap=args.max_gap, max_burst=args.max_burst)
+        for addr, words, burst_names in bursts:
+            print(f"0x{addr:08x} {words:4d} words: {', '.join(burst_names)}")
+        print(f"{len(names)} registers in {len(bursts)} burst reads.")
+        return
+
+    bus = RemoteClient(host=args.host, port=args.port)
+    bus.open()
+    collector = TelemetryCollector(bus, csr_map, names, max_gap=args.max_gap, max_burst=args.max_burst)
+    columns   = ["time"] + (["board_time"] if "telemetry_timestamp" in names and csr_map.clk_freq else []) + names
+    output    = sys.stdout if args.output is None else open(args.output, "w")
+
+    samples  = 0
+    overruns = 0
+    period   = 1/args.rate
+    deadline = time.monotonic()
+    try:
+        if args.format == "csv":
+            output.write(",".join(columns) + "\n")
+        while args.count == 0 or samples < args.count:
+            row = collector.sample()
+            if args.format == "csv":
+                output.write(",".join(f"{row[c]:.6f}" if c.endswith("time") else str(row[c]) for c in columns) + "\n")
+            else:
+                output.write(json.dumps(row) + "\n")
+            output.flush()
+            samples  += 1
+            deadline += period
+            delay     = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # The bridge is slower than the rate, restart the schedule from now.
+                overruns += 1
+                deadline  = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bus.close()
+        if args.output is not None:
+            output.close()
+    print(f"{samples} samples of {len(names)} registers in {len(collector.bursts)} burst reads, "
+          f"{overruns} overruns, {collector.lost} samples interleaved with other snapshots.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,798 @@
+from migen import *
+from migen.genlib.cdc import MultiReg, BusSynchronizer, PulseSynchronizer
+
+from litex.gen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import CSR, CSRStorage, CSRStatus, CSRField
+from litex.soc.interconnect.stream import Endpoint
+from litex.soc.cores.video import video_timing_layout, video_data_layout
+
+# Line buffer integer scaler -----------------------------------------------------------------------
+
+class LineScaler(LiteXModule):
+    """Integer scaler for a line based pixel source, centered in the video raster.
+
+    Source lines of `width` pixels are written into one half of a two line block RAM while the other
+    half is replayed `h_scale` times per pixel and `v_scale` times per line. `line_ready` asks the
+    source for the next line (it stays high until its first pixel arrives) as soon as replay of the
+    current line starts, so a source has v_scale output lines to deliver one. The first line of a
+    frame is requested on vsync. Outside the `width*h_scale` x `height*v_scale` window the output is
+    black, a window larger than the raster starts at its top left corner.
+    """
+    def __init__(self, width=256, height=240, scale_bits=4):
+        self.sink   = sink   = Endpoint(video_timing_layout)
+        self.source = source = Endpoint(video_data_layout)
+
+        self.pixel       = Signal(24) # r[0:8], g[8:16], b[16:24].
+        self.pixel_valid = Signal()
+        self.line_ready  = Signal()
+        self.underflow   = Signal() # A pixel was shown before the source wrote it.
+        self.line_missed = Signal() # A line was requested before the previous one arrived.
+
+        self.h_scale = Signal(scale_bits, reset=3)
+        self.v_scale = Signal(scale_bits, reset=3)
+
+        # # #
+
+        x_bits = log2_int(width, need_pow2=False)
+
+        # Window.
+        out_w   = Signal(12)
+        out_h   = Signal(12)
+        h_start = Signal(12)
+        v_start = Signal(12)
+        self.sync += [
+            out_w.eq(width  * self.h_scale),
+            out_h.eq(height * self.v_scale),
+            # A window larger than the raster is cropped on the right/bottom.
+            h_start.eq(Mux(out_w < sink.hres, (sink.hres - out_w) >> 1, 0)),
+            v_start.eq(Mux(out_h < sink.vres, (sink.vres - out_h) >> 1, 0)),
+        ]
+
+        # Line buffers.
+        mem    = Memory(24, 2*2**x_bits)
+        wrport = mem.get_port(write_capable=True)
+        rdport = mem.get_port(has_re=True)
+        self.specials += mem, wrport, rdport
+
+        # Source side: one line at a time into the bank that is not being replayed.
+        wr_bank  = Signal()
+        wr_x     = Signal(x_bits + 1)
+        request  = Signal()
+        self.comb += [
+            wrport.adr.eq(Cat(wr_x[:x_bits], wr_bank)),
+            wrport.dat_w.eq(self.pixel),
+            wrport.we.eq(self.pixel_valid & (wr_x < width)),
+        ]
+        self.sync += [
+            If(request,
+                self.line_ready.eq(1),
+                wr_x.eq(0),
+            ).Elif(self.pixel_valid,
+                self.line_ready.eq(0),
+                If(wr_x < width, wr_x.eq(wr_x + 1)),
+            ),
+        ]
+
+        # Replay side.
+        advance    = Signal()
+        vsync_d    = Signal()
+        line_start = Signal()
+        line_end   = Signal()
+        in_rows    = Signal()
+        in_window  = Signal()
+        rd_bank    = Signal()
+        rd_x       = Signal(x_bits + 1)
+        sub_x      = Signal(scale_bits)
+        src_y      = Signal(log2_int(height, need_pow2=False) + 1)
+        sub_y      = Signal(scale_bits)
+        self.comb += [
+            sink.ready.eq(~source.valid | source.ready),
+            advance.eq(sink.valid & sink.ready),
+            line_start.eq(advance & (sink.hcount == 0)),
+            line_end.eq(advance & (sink.hcount == (sink.hres - 1))),
+            in_rows.eq((sink.vcount >= v_start) & (sink.vcount < (v_start + out_h))),
+            in_window.eq(in_rows & (sink.hcount >= h_start) & (sink.hcount < (h_start + out_w))),
+            rdport.adr.eq(Cat(rd_x[:x_bits], rd_bank)),
+            rdport.re.eq(advance),
+            self.underflow.eq(advance & in_window & (wr_bank == rd_bank) & (wr_x <= rd_x)),
+            self.line_missed.eq(request & self.line_ready),
+        ]
+        self.sync += [
+            request.eq(0),
+            If(advance, vsync_d.eq(sink.vsync)),
+            If(advance & sink.vsync & ~vsync_d,
+                # New frame: first line into bank 0, replayed from the first row.
+                wr_bank.eq(0),
+                rd_bank.eq(0),
+                src_y.eq(0),
+                sub_y.eq(0),
+                request.eq(1),
+            ).Elif(line_start & in_rows,
+                # Replay of a line starts, fetch the next one into the other bank.
+                If((sub_y == 0) & (src_y < (height - 1)),
+                    wr_bank.eq(~rd_bank),
+                    request.eq(1),
+                ),
+            ).Elif(line_end & in_rows,
+                If(sub_y >= (self.v_scale - 1),
+                    sub_y.eq(0),
+                    src_y.eq(src_y + 1),
+                    rd_bank.eq(~rd_bank),
+                ).Else(
+                    sub_y.eq(sub_y + 1),
+                ),
+            ),
+            # Horizontal position, rewound after the last active pixel of every line.
+            If(line_end,
+                rd_x.eq(0),
+                sub_x.eq(0),
+            ).Elif(advance & in_window,
+                If(sub_x >= (self.h_scale - 1),
+                    sub_x.eq(0),
+                    rd_x.eq(rd_x + 1),
+                ).Else(
+                    sub_x.eq(sub_x + 1),
+                ),
+            ),
+        ]
+
+        # Output, registered to line up with the block RAM read.
+        window = Signal()
+        self.sync += [
+            If(advance,
+                source.valid.eq(1),
+                source.hsync.eq(sink.hsync),
+                source.vsync.eq(sink.vsync),
+                source.de.eq(sink.de),
+                window.eq(in_window),
+            ).Elif(source.ready,
+                source.valid.eq(0),
+            ),
+        ]
+        self.comb += If(window,
+            source.r.eq(rdport.dat_r[0:8]),
+            source.g.eq(rdport.dat_r[8:16]),
+            source.b.eq(rdport.dat_r[16:24]),
+        )
+
+# Video health monitor -----------------------------------------------------------------------------
+
+class VideoHealthMonitor(LiteXModule):
+    """Health counters of a line based video path, for regressions on clocks and bus topology.
+
+    Everything is counted in `clock_domain` (the video one) from the strobes below, with saturating
+    counters, and latched into the status registers by a write to `snapshot` like the bus monitors
+    (leave a few microseconds before reading them back); a write to `clear` restarts counting.
+    Watermarks cover the latency from a line request to its first pixel, the lines delivered per
+    frame and the frame period, from the first complete frame after a clear. `trigger` is a sys
+    pulse doing what a write to `snapshot` does.
+    """
+    def __init__(self, clock_domain="hdmi", counter_width=32):
+        self.frame        = Signal() # Start of a frame, one cycle.
+        self.underflow    = Signal() # Pixel shown before it was written.
+        self.fb_underflow = Signal() # Framebuffer FIFO empty while showing a pixel.
+        self.line_request = Signal() # Level, a line is requested from the source.
+        self.line_pixel   = Signal() # The source delivers a pixel.
+        self.line_done    = Signal() # The source finished a line.
+        self.line_missed  = Signal() # A line was requested before the previous one arrived.
+        self.trigger      = Signal() # Snapshot, sys domain.
+
+        self.clear    = CSR()
+        self.snapshot = CSR()
+
+        self.frames           = CSRStatus(counter_width, description="Frames.")
+        self.underflows       = CSRStatus(counter_width, description="Pixels shown before the source wrote them.")
+        self.underflow_frames = CSRStatus(counter_width, description="Frames with at least one underflow (torn frames).")
+        self.fb_underflows    = CSRStatus(counter_width, description="Framebuffer underflows (resynchronizations).")
+        self.lines            = CSRStatus(counter_width, description="Lines delivered by the source.")
+        self.lines_missed     = CSRStatus(counter_width, description="Line requests the source did not answer in time.")
+        self.line_latency_min = CSRStatus(counter_width, description="Shortest line request to first pixel latency, in cycles.")
+        self.line_latency_max = CSRStatus(counter_width, description="Longest line request to first pixel latency, in cycles.")
+        self.frame_lines_min  = CSRStatus(counter_width, description="Fewest lines delivered in a frame.")
+        self.frame_lines_max  = CSRStatus(counter_width, description="Most lines delivered in a frame.")
+        self.frame_cycles_min = CSRStatus(counter_width, description="Shortest frame period, in cycles.")
+        self.frame_cycles_max = CSRStatus(counter_width, description="Longest frame period, in cycles.")
+
+        # # #
+
+        sync = getattr(self.sync, clock_domain)
+        ones = 2**counter_width - 1
+
+        # Control pulses into the video domain.
+        self.clear_ps    = PulseSynchronizer("sys", clock_domain)
+        self.snapshot_ps = PulseSynchronizer("sys", clock_domain)
+        clear    = Signal()
+        snapshot = Signal()
+        self.comb += [
+            self.clear_ps.i.eq(self.clear.re),
+            self.snapshot_ps.i.eq(self.snapshot.re | self.trigger),
+            clear.eq(self.clear_ps.o),
+            snapshot.eq(self.snapshot_ps.o),
+        ]
+
+        def counter(name, reset=0):
+            return Signal(counter_width, name=name, reset=reset)
+        def incr(c):
+            return If(c != ones, c.eq(c + 1))
+        frames           = counter("frames")
+        underflows       = counter("underflows")
+        underflow_frames = counter("underflow_frames")
+        fb_underflows    = counter("fb_underflows")
+        lines            = counter("lines")
+        lines_missed     = counter("lines_missed")
+        line_latency_min = counter("line_latency_min", reset=ones)
+        line_latency_max = counter("line_latency_max")
+        frame_lines_min  = counter("frame_lines_min", reset=ones)
+        frame_lines_max  = counter("frame_lines_max")
+        frame_cycles_min = counter("frame_cycles_min", reset=ones)
+        frame_cycles_max = counter("frame_cycles_max")
+
+        # Per frame and per line tracking.
+        frame_cycles = Signal(counter_width)
+        frame_lines  = Signal(counter_width)
+        frame_torn   = Signal()
+        frame_valid  = Signal() # A whole frame was seen since the clear.
+        latency      = Signal(counter_width)
+        waiting      = Signal()
+        request_d    = Signal()
+        sync += [
+            request_d.eq(self.line_request),
+            If(self.frame | clear,
+                frame_cycles.eq(1),
+                frame_lines.eq(0),
+                frame_torn.eq(0),
+            ).Else(
+                incr(frame_cycles),
+                If(self.line_done, incr(frame_lines)),
+                If(self.underflow, frame_torn.eq(1)),
+            ),
+            If(self.line_request & ~request_d,
+                waiting.eq(1),
+                latency.eq(1),
+            ).Elif(waiting,
+                If(self.line_pixel,
+                    waiting.eq(0),
+                ).Else(
+                    incr(latency),
+                )
+            ),
+        ]
+
+        sync += [
+            If(clear,
+                frame_valid.eq(0),
+                frames.eq(0),
+                underflows.eq(0),
+                underflow_frames.eq(0),
+                fb_underflows.eq(0),
+                lines.eq(0),
+                lines_missed.eq(0),
+                line_latency_min.eq(ones),
+                line_latency_max.eq(0),
+                frame_lines_min.eq(ones),
+                frame_lines_max.eq(0),
+                frame_cycles_min.eq(ones),
+                frame_cycles_max.eq(0),
+            ).Else(
+                If(self.underflow,    incr(underflows)),
+                If(self.fb_underflow, incr(fb_underflows)),
+                If(self.line_done,    incr(lines)),
+                If(self.line_missed,  incr(lines_missed)),
+                If(waiting & self.line_pixel,
+                    If(latency < line_latency_min, line_latency_min.eq(latency)),
+                    If(latency > line_latency_max, line_latency_max.eq(latency)),
+                ),
+                If(self.frame,
+                    incr(frames),
+                    frame_valid.eq(1),
+                    If(frame_torn, incr(underflow_frames)),
+                    If(frame_valid,
+                        If(frame_lines  < frame_lines_min,  frame_lines_min.eq(frame_lines)),
+                        If(frame_lines  > frame_lines_max,  frame_lines_max.eq(frame_lines)),
+                        If(frame_cycles < frame_cycles_min, frame_cycles_min.eq(frame_cycles)),
+                        If(frame_cycles > frame_cycles_max, frame_cycles_max.eq(frame_cycles)),
+                    ),
+                ),
+            ),
+        ]
+
+        # Snapshot.
+        snapshot_regs = [
+            (frames,           self.frames),
+            (underflows,       self.underflows),
+            (underflow_frames, self.underflow_frames),
+            (fb_underflows,    self.fb_underflows),
+            (lines,            self.lines),
+            (lines_missed,     self.lines_missed),
+            (line_latency_min, self.line_latency_min),
+            (line_latency_max, self.line_latency_max),
+            (frame_lines_min,  self.frame_lines_min),
+            (frame_lines_max,  self.frame_lines_max),
+            (frame_cycles_min, self.frame_cycles_min),
+            (frame_cycles_max, self.frame_cycles_max),
+        ]
+        # Latched in the video domain, copied into the status registers from sys once stable.
+        shadows = [Signal(counter_width) for _ in snapshot_regs]
+        sync += If(snapshot, [shadow.eq(value) for shadow, (value, _) in zip(shadows, snapshot_regs)])
+        self.latched_ps = PulseSynchronizer(clock_domain, "sys")
+        self.comb += self.latched_ps.i.eq(snapshot)
+        self.sync += If(self.latched_ps.o, [csr.status.eq(shadow) for shadow, (_, csr) in zip(shadows, snapshot_regs)])
+
+# Double buffered SDRAM framebuffer ----------------------------------------------------------------
+
+class VideoDoubleFrameBuffer(LiteXModule):
+    """Two rgb565 pages in SDRAM, streamed to a video PHY with page flips on frame boundaries.
+
+    The reader runs in sys on its own LiteDRAM port with several reads in flight and crosses into
+    `clock_domain` through an async FIFO, where pixels are lined up with the timing generator on the
+    first word of each frame (and again after an underflow). `enable` starts and stops the reader on
+    frame boundaries. A page written to `page` is shown from the next frame on, `status.page` tells
+    when that happened. The CPU draws through the main bus, flushing the L2 cache before a flip;
+    with a `write_port`, NES lines fed to `nes_pixel` are also written at `nes_origin` of the back
+    page, flipping to it after each NES frame when `autoflip` is set. The NES side can not be
+    stalled, words lost to a full clock domain crossing are counted in `nes_overflows`.
+    """
+    def __init__(self, read_port, write_port=None, hres=1280, vres=720, base=0x00400000, page_size=0x00200000,
+        default_enable = 0,
+        clock_domain   = "hdmi",
+        fifo_depth     = 512,
+        nes_width      = 256,
+        nes_height     = 240):
+        self.vtg_sink  = vtg_sink = Endpoint(video_timing_layout)
+        self.source    = source   = Endpoint(video_data_layout)
+        self.underflow = Signal()
+
+        self.enable = CSRStorage(1, reset=default_enable, description="Stream the framebuffer (takes effect on a frame boundary).")
+        self.page   = CSRStorage(1, description="Page to show from the next frame on.")
+        self.page0  = CSRStorage(32, reset=base,             description="Byte offset of page 0 in SDRAM.")
+        self.page1  = CSRStorage(32, reset=base + page_size, description="Byte offset of page 1 in SDRAM.")
+        self.status = CSRStatus(fields=[
+            CSRField("page", size=1, description="Page being shown."),
+        ])
+        self.frames = CSRStatus(32, description="Frames read since reset.")
+
+        # # #
+
+        from litedram.frontend.dma import LiteDRAMDMAReader, LiteDRAMDMAWriter
+
+        assert read_port.data_width == 32
+        dw          = read_port.data_width
+        frame_words = hres*vres*16//dw
+        byte_shift  = log2_int(dw//8)
+
+        # Page selection (sys), set by the CPU or, with autoflip, by the NES writer.
+        page_req = Signal()
+        flip_req = Signal()
+        flip_to  = Signal()
+        self.sync += [
+            If(flip_req,
+                page_req.eq(flip_to)
+            ).Elif(self.page.re,
+                page_req.eq(self.page.storage)
+            )
+        ]
+        def page_base(page):
+            return Mux(page, self.page1.storage, self.page0.storage)[byte_shift:]
+
+        # Reader (sys).
+        self.reader = reader = LiteDRAMDMAReader(read_port, fifo_depth=64, fifo_buffered=True)
+        offset     = Signal(max=frame_words)
+        frame_base = Signal(len(read_port.cmd.addr))
+        shown      = Signal()
+        running    = Signal()
+        self.comb += [
+            reader.sink.valid.eq(running),
+            reader.sink.address.eq(frame_base + offset),
+            self.status.fields.page.eq(shown),
+        ]
+        self.sync += [
+            If(~running,
+                running.eq(self.enable.storage),
+                frame_base.eq(page_base(page_req)),
+                shown.eq(page_req),
+            ).Elif(reader.sink.ready,
+                If(offset == (frame_words - 1),
+                    offset.eq(0),
+                    running.eq(self.enable.storage),
+                    frame_base.eq(page_base(page_req)),
+                    shown.eq(page_req),
+                    self.frames.status.eq(self.frames.status + 1),
+                ).Else(
+                    offset.eq(offset + 1),
+                )
+            )
+        ]
+
+        # Tag the first word of each frame, data returns in order.
+        rd_count = Signal(max=frame_words)
+        self.cdc = cdc = stream.ClockDomainCrossing([("data", dw)], cd_from="sys", cd_to=clock_domain, depth=fifo_depth)
+        self.comb += [
+            reader.source.connect(cdc.sink, omit={"first"}),
+            cdc.sink.first.eq(rd_count == 0),
+        ]
+        self.sync += If(reader.source.valid & reader.source.ready,
+            If(rd_count == (frame_words - 1),
+                rd_count.eq(0)
+            ).Else(
+                rd_count.eq(rd_count + 1)
+            )
+        )
+
+        # Video output (clock_domain): two rgb565 pixels per word, low half first.
+        half  = Signal()
+        pixel = Signal(16)
+        self.comb += [
+            pixel.eq(Mux(half, cdc.source.data[16:32], cdc.source.data[0:16])),
+            source.valid.eq(vtg_sink.valid),
+            source.hsync.eq(vtg_sink.hsync),
+            source.vsync.eq(vtg_sink.vsync),
+            source.de.eq(vtg_sink.de),
+        ]
+        frame_start = Signal()
+        sync_hit    = Signal()
+        self.comb += [
+            frame_start.eq(vtg_sink.valid & (vtg_sink.hcount == 0) & (vtg_sink.vcount == 0)),
+            sync_hit.eq(frame_start & cdc.source.valid & cdc.source.first),
+            vtg_sink.ready.eq(source.ready),
+        ]
+        def show_pixel():
+            return If(vtg_sink.valid & vtg_sink.ready & vtg_sink.de,
+                If(cdc.source.valid,
+                    source.r.eq(Cat(Replicate(0, 3), pixel[11:16])),
+                    source.g.eq(Cat(Replicate(0, 2), pixel[5:11])),
+                    source.b.eq(Cat(Replicate(0, 3), pixel[0:5])),
+                    NextValue(half, ~half),
+                    cdc.source.ready.eq(half),
+                ).Else(
+                    self.underflow.eq(1),
+                    NextValue(half, 0),
+                    NextState("SYNC")
+                )
+            )
+        self.fsm = fsm = ClockDomainsRenamer(clock_domain)(FSM(reset_state="SYNC"))
+        fsm.act("SYNC",
+            # Drop data up to the start of a frame and show it once the raster gets there.
+            cdc.source.ready.eq(cdc.source.valid & ~cdc.source.first),
+            If(sync_hit,
+                NextState("RUN"),
+                show_pixel(),
+            )
+        )
+        fsm.act("RUN",
+            show_pixel()
+        )
+
+        # NES writer.
+        if write_port is None:
+            return
+        self.nes = CSRStorage(fields=[
+            CSRField("enable",   size=1, description="Write the NES picture into the framebuffer."),
+            CSRField("autoflip", size=1, description="Write to the back page and flip to it after each NES frame."),
+        ])
+        self.nes_origin = CSRStorage(fields=[
+            CSRField("x", size=16, reset=(hres - nes_width)//2,  description="Left edge of the NES picture (even)."),
+            CSRField("y", size=16, reset=(vres - nes_height)//2, description="Top edge of the NES picture."),
+        ])
+        self.nes_overflows = CSRStatus(32, description="NES words dropped because the clock domain crossing was full.")
+        self.nes_pixel = Signal(24) # r[0:8], g[8:16], b[16:24].
+        self.nes_valid = Signal()
+        self.nes_vsync = Signal()
+
+        # Pack pixel pairs in the NES domain, first word of a frame tagged.
+        nes_x    = Signal(max=nes_width + 1)
+        nes_y    = Signal(max=nes_height + 1)
+        nes_low  = Signal(16)
+        nes_565  = Signal(16)
+        vsync_d  = Signal()
+        self.wcdc = wcdc = stream.ClockDomainCrossing([("data", dw)], cd_from=clock_domain, cd_to="sys", depth=128)
+        self.comb += [
+            nes_565.eq(Cat(self.nes_pixel[16+3:24], self.nes_pixel[8+2:16], self.nes_pixel[0+3:8])),
+            wcdc.sink.data.eq(Cat(nes_low, nes_565)),
+            wcdc.sink.first.eq((nes_x == 1) & (nes_y == 0)),
+            wcdc.sink.valid.eq(self.nes_valid & nes_x[0] & (nes_y < nes_height)),
+        ]
+        # The NES core can not be stalled, words the crossing can not take are counted.
+        overflows = Signal(32)
+        sync = getattr(self.sync, clock_domain)
+        sync += If(wcdc.sink.valid & ~wcdc.sink.ready, overflows.eq(overflows + 1))
+        self.overflows_bs = BusSynchronizer(32, clock_domain, "sys")
+        self.comb += [
+            self.overflows_bs.i.eq(overflows),
+            self.nes_overflows.status.eq(self.overflows_bs.o),
+        ]
+        sync += [
+            vsync_d.eq(self.nes_vsync),
+            If(self.nes_vsync & ~vsync_d,
+                nes_x.eq(0),
+                nes_y.eq(0),
+            ).Elif(self.nes_valid,
+                nes_low.eq(nes_565),
+                If(nes_x == (nes_width - 1),
+                    nes_x.eq(0),
+                    nes_y.eq(nes_y + 1),
+                ).Else(
+                    nes_x.eq(nes_x + 1),
+                )
+            )
+        ]
+
+        # Addresses (sys).
+        self.writer = writer = LiteDRAMDMAWriter(write_port, fifo_depth=16)
+        line_words = nes_width*16//dw
+        wr_page    = Signal()
+        wr_line    = Signal(len(write_port.cmd.addr))
+        wr_x       = Signal(max=line_words)
+        wr_y       = Signal(max=nes_height)
+        wr_active  = Signal()
+        origin     = Signal(len(write_port.cmd.addr))
+        target     = Signal()
+        frame_line = Signal(len(write_port.cmd.addr))
+        self.comb += [
+            origin.eq((self.nes_origin.fields.y*hres + self.nes_origin.fields.x)*2 >> byte_shift),
+            # Back page when flipping automatically, otherwise the page asked for.
+            target.eq(Mux(self.nes.fields.autoflip, ~shown, page_req)),
+            frame_line.eq(page_base(target) + origin),
+            writer.sink.address.eq(Mux(wcdc.source.first, frame_line, wr_line + wr_x)),
+            writer.sink.data.eq(wcdc.source.data),
+            writer.sink.valid.eq(wcdc.source.valid & self.nes.fields.enable & (wr_active | wcdc.source.first)),
+            wcdc.source.ready.eq(writer.sink.ready | ~writer.sink.valid),
+        ]
+        self.sync += [
+            If(wcdc.source.valid & wcdc.source.ready,
+                If(wcdc.source.first,
+                    wr_page.eq(target),
+                    wr_line.eq(frame_line),
+                    wr_x.eq(1),
+                    wr_y.eq(0),
+                    wr_active.eq(1),
+                ).Elif(wr_x == (line_words - 1),
+                    wr_x.eq(0),
+                    wr_line.eq(wr_line + hres*16//dw),
+                    If(wr_y == (nes_height - 1),
+                        wr_active.eq(0),
+                    ).Else(
+                        wr_y.eq(wr_y + 1),
+                    )
+                ).Else(
+                    wr_x.eq(wr_x + 1),
+                )
+            )
+        ]
+        self.comb += [
+            flip_to.eq(wr_page),
+            flip_req.eq(self.nes.fields.autoflip & wr_active & (wr_y == (nes_height - 1)) &
+                (wr_x == (line_words - 1)) & wcdc.source.valid & wcdc.source.ready),
+        ]
+
+# Camera tile downscaler ---------------------------------------------------------------------------
+
+class TileDownscaler(LiteXModule):
+    """Crops and decimates a camera pixel stream into lines of 8-bit luma for a compositor tile.
+
+    The sink carries four 16-bit pixels per beat with the luma (or RAW value) in the upper byte, as
+    produced by the CSI-2 unpacker; it is never stalled. Pixels from (`x0`, `y0`) on are kept every
+    2**`shift` columns and rows, `width` x `height` of them, four per word into `nlines` line slots
+    of a line buffer. `x0` and `width` are multiples of 4. `line` counts the tile lines completed in
+    the current camera frame.
+    """
+    def __init__(self, max_width=640, nlines=8):
+        self.sink = sink = Endpoint([("data", 64), ("fs", 1)])
+
+        self.x0     = Signal(16)
+        self.y0     = Signal(16)
+        self.width  = Signal(12)
+        self.height = Signal(12)
+        self.shift  = Signal(2)
+
+        word_bits = log2_int(max_width//4, need_pow2=False)
+        self.adr   = Signal(word_bits + log2_int(nlines))
+        self.dat_w = Signal(32)
+        self.we    = Signal()
+        self.line  = Signal(12)
+
+        # # #
+
+        src_x = Signal(16)
+        src_y = Signal(16)
+        col   = Signal(12)
+        acc   = Signal(32)
+        count = Signal(2)
+        luma  = [sink.data[16*i + 8:16*(i + 1)] for i in range(4)]
+
+        # Counters as seen by this beat: first restarts the line, fs the frame.
+        bx = Signal(16)
+        by = Signal(16)
+        bl = Signal(12)
+        bc = Signal(12)
+        bn = Signal(2)
+        self.comb += [
+            bx.eq(Mux(sink.first, 0, src_x)),
+            by.eq(Mux(sink.fs, 0, src_y)),
+            bl.eq(Mux(sink.fs, 0, self.line)),
+            bc.eq(Mux(sink.first, 0, col)),
+            bn.eq(Mux(sink.first, 0, count)),
+        ]
+
+        # Row and beat selection.
+        dy       = Signal(16)
+        dx       = Signal(16)
+        row_keep = Signal()
+        keep     = Signal()
+        self.comb += [
+            sink.ready.eq(1),
+            dy.eq(by - self.y0),
+            dx.eq(bx - self.x0),
+            row_keep.eq((by >= self.y0) & ((dy & ((1 << self.shift) - 1)) == 0) & (bl < self.height)),
+            keep.eq(sink.valid & row_keep & (bx >= self.x0) & ~(dx[2] & (self.shift == 3)) & (bc < self.width)),
+        ]
+
+        # Four kept pixels per word.
+        packed = Signal(32)
+        step   = Signal(3)
+        self.comb += Case(self.shift, {
+            0: [packed.eq(Cat(*luma)), step.eq(4)],
+            1: [packed.eq(Cat(acc[16:], luma[0], luma[2])), step.eq(2)],
+            "default": [packed.eq(Cat(acc[8:], luma[0])), step.eq(1)],
+        })
+        self.comb += [
+            self.adr.eq(Cat(bc[2:2 + word_bits], bl[:log2_int(nlines)])),
+            self.dat_w.eq(packed),
+            self.we.eq(keep & ((bn + step) >= 4)),
+        ]
+        self.sync += If(sink.valid,
+            src_x.eq(bx + 4),
+            src_y.eq(by),
+            col.eq(bc),
+            count.eq(bn),
+            self.line.eq(bl),
+            If(keep,
+                acc.eq(packed),
+                count.eq(bn + step),
+                col.eq(bc + step),
+            ),
+            If(sink.last,
+                src_y.eq(by + 1),
+                If(row_keep, self.line.eq(bl + 1)),
+            ),
+        )
+
+# Multi camera compositor --------------------------------------------------------------------------
+
+class VideoCompositor(LiteXModule):
+    """Tiles up to three downscaled camera streams on a video raster, without a frame store.
+
+    Each source is an (endpoint, clock_domain) pair from a camera receiver. Its TileDownscaler writes
+    luma lines into a small line ring that the raster reads back in `clock_domain`, so a camera line
+    reaches the screen a few lines after it arrives. This only holds while the camera runs at the
+    display frame rate in phase with its tile: `tileN_phase` reports the camera lines written when
+    the raster reaches the top of the tile (keep it between 1 and `nlines` - 1 by trimming the sensor
+    frame length) and `tileN_underruns` the tile rows shown from stale lines. Tiles are shown grey,
+    tile 0 on top, over `background`.
+    """
+    def __init__(self, sources, hres=1280, vres=720, clock_domain="hdmi", max_width=640, nlines=8):
+        assert len(sources) <= 3
+        self.vtg_sink = vtg_sink = Endpoint(video_timing_layout)
+        self.source   = source   = Endpoint(video_data_layout)
+
+        self.background = CSRStorage(24, description="Background colour, r[0:8], g[8:16], b[16:24].")
+
+        # # #
+
+        sync       = getattr(self.sync, clock_domain)
+        word_bits  = log2_int(max_width//4, need_pow2=False)
+        line_bits  = log2_int(nlines)
+        background = Signal(24)
+        self.specials += MultiReg(self.background.storage, background, clock_domain)
+
+        advance = Signal()
+        self.comb += [
+            vtg_sink.ready.eq(~source.valid | source.ready),
+            advance.eq(vtg_sink.valid & vtg_sink.ready),
+        ]
+
+        # Default layout: 2x2 grid of half resolution tiles.
+        layout = [(0, 0), (hres//2, 0), (0, vres//2)]
+        hits   = []
+        for n, (sink, cd) in enumerate(sources):
+            crop  = CSRStorage(fields=[
+                CSRField("x", size=16, offset=0,  description="First camera column (multiple of 4)."),
+                CSRField("y", size=16, offset=16, description="First camera row."),
+            ])
+            size  = CSRStorage(fields=[
+                CSRField("w", size=16, offset=0,  reset=hres//2, description="Tile width (multiple of 4)."),
+                CSRField("h", size=16, offset=16, reset=vres//2, description="Tile height."),
+            ])
+            pos   = CSRStorage(fields=[
+                CSRField("x", size=16, offset=0,  reset=layout[n][0], description="Tile left edge on screen (multiple of 4)."),
+                CSRField("y", size=16, offset=16, reset=layout[n][1], description="Tile top edge on screen."),
+            ])
+            ctrl  = CSRStorage(fields=[
+                CSRField("enable", size=1, offset=0, reset=1, description="Show the tile."),
+                CSRField("shift",  size=2, offset=1, reset=1, description="Keep one camera pixel in 2**shift, both ways."),
+            ])
+            phase     = CSRStatus(12, description="Camera lines in the ring when the raster reached the tile.")
+            underruns = CSRStatus(32, description="Tile rows shown before the camera wrote them.")
+            for name, csr in [("crop", crop), ("size", size), ("pos", pos), ("ctrl", ctrl), ("phase", phase), ("underruns", underruns)]:
+                setattr(self, f"tile{n}_{name}", csr)
+
+            # Camera side.
+            downscaler = ClockDomainsRenamer(cd)(TileDownscaler(max_width=max_width, nlines=nlines))
+            setattr(self, f"tile{n}_downscaler", downscaler)
+            for value, target in [
+                (crop.fields.x,  downscaler.x0),
+                (crop.fields.y,  downscaler.y0),
+                (size.fields.w,  downscaler.width),
+                (size.fields.h,  downscaler.height),
+                (ctrl.fields.shift, downscaler.shift)]:
+                self.specials += MultiReg(value, target, cd)
+            self.comb += sink.connect(downscaler.sink)
+
+            mem    = Memory(32, nlines*2**word_bits)
+            wrport = mem.get_port(write_capable=True, clock_domain=cd)
+            rdport = mem.get_port(has_re=True, clock_domain=clock_domain)
+            self.specials += mem, wrport, rdport
+            self.comb += [
+                wrport.adr.eq(downscaler.adr),
+                wrport.dat_w.eq(downscaler.dat_w),
+                wrport.we.eq(downscaler.we),
+            ]
+
+            # Raster side.
+            tx, ty, tw, th = Signal(16), Signal(16), Signal(16), Signal(16)
+            enable = Signal()
+            for value, target in [(pos.fields.x, tx), (pos.fields.y, ty), (size.fields.w, tw), (size.fields.h, th),
+                (ctrl.fields.enable, enable)]:
+                self.specials += MultiReg(value, target, clock_domain)
+            cam_line = BusSynchronizer(12, cd, clock_domain)
+            self.submodules += cam_line
+            self.comb += cam_line.i.eq(downscaler.line)
+
+            col = Signal(16)
+            row = Signal(16)
+            hit = Signal()
+            sel = Signal(2)
+            self.comb += [
+                col.eq(vtg_sink.hcount - tx),
+                row.eq(vtg_sink.vcount - ty),
+                rdport.adr.eq(Cat(col[2:2 + word_bits], row[:line_bits])),
+                rdport.re.eq(advance),
+            ]
+            tile_phase     = Signal(12)
+            tile_underruns = Signal(32)
+            sync += If(advance,
+                hit.eq(enable & vtg_sink.de &
+                    (vtg_sink.hcount >= tx) & (vtg_sink.hcount < (tx + tw)) &
+                    (vtg_sink.vcount >= ty) & (vtg_sink.vcount < (ty + th))),
+                sel.eq(col[:2]),
+                If(enable & (vtg_sink.hcount == tx) & (vtg_sink.vcount >= ty) & (vtg_sink.vcount < (ty + th)),
+                    If(vtg_sink.vcount == ty, tile_phase.eq(cam_line.o)),
+                    If((cam_line.o <= row) | ((cam_line.o - row) > nlines),
+                        tile_underruns.eq(tile_underruns + 1),
+                    ),
+                ),
+            )
+            for value, csr in [(tile_phase, phase.status), (tile_underruns, underruns.status)]:
+                bs = BusSynchronizer(len(csr), clock_domain, "sys")
+                self.submodules += bs
+                self.comb += [bs.i.eq(value), csr.eq(bs.o)]
+            luma = Signal(8)
+            self.comb += Case(sel, {i: luma.eq(rdport.dat_r[8*i:8*(i + 1)]) for i in range(4)})
+            hits.append((hit, luma))
+
+        # Output, registered to line up with the block RAM reads.
+        sync += [
+            If(advance,
+                source.valid.eq(1),
+                source.hsync.eq(vtg_sink.hsync),
+                source.vsync.eq(vtg_sink.vsync),
+                source.de.eq(vtg_sink.de),
+            ).Elif(source.ready,
+                source.valid.eq(0),
+            ),
+        ]
+        pixel = [source.r.eq(background[0:8]), source.g.eq(background[8:16]), source.b.eq(background[16:24])]
+        for hit, luma in reversed(hits):
+            pixel = [If(hit, source.r.eq(luma), source.g.eq(luma), source.b.eq(luma)).Else(*pixel)]
+        self.comb += pixel